@@ -0,0 +1,390 @@
+"""Hierarchical meta-d' model contrasting mental replay with no replay across the cohort.
+
+Every participant x condition keeps its own type-1 d' and c (point estimates, as in HMeta-d)
+and its own type-2 criteria. Metacognitive efficiency is modelled on the log M-ratio scale:
+
+    log(meta-d' / d') = mu + beta_replay * replay + beta_vividness * (vividness - 2.5) + sigma * z_participant
+
+so beta_replay is the cohort-level effect of mental replay and beta_vividness the effect of
+one step on the vividness scale, a trial-level covariate (trials are grouped by their
+vividness rating, and no-replay trials have none). The posterior is sampled with a
+Metropolis-within-Gibbs scheme: the criteria and participant effects are updated for every
+participant at once with one vectorized likelihood call each (their conditional posteriors
+are independent), and the four group parameters jointly, with a proposal covariance learnt
+during the warm-up. sigma also gets a move that rescales the participant effects so that the
+likelihood is unchanged, which keeps it mixing when sigma is small, and mu is shifted against
+the participant effects in the same way. Every chain starts from its own jittered copy of the
+initial (or cached) state, so that R-hat compares chains that started apart. Chains run in
+parallel on a process pool.
+
+Two caches under cache_dir make re-runs fast: the count tables of every session CSV (keyed
+by its path, size and modification time, so only new or changed files are parsed) and the
+final state and tuned step sizes of the last run, which start the next run close to the
+posterior with a shorter warm-up.
+
+Usage (from exp_script):
+    python -m analysis.hierarchical --chains 4 --samples 2000
+"""
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from analysis import metad
+
+GROUP_PARAMS = ["mu", "beta_replay", "beta_vividness", "log_sigma"]
+VIVIDNESS_CENTER = 2.5  # middle of the 1-4 vividness scale
+TARGET_ACCEPTANCE = 0.3
+INITIAL_GAP = np.log(0.5)  # prior mean of the log distance between type-2 criteria
+MAX_LOG_M_RATIO = 5.0  # proposals outside |log M-ratio| <= 5 (M-ratio 0.007 to 148) are rejected
+INITIAL_SPREAD = {"group": 0.5, "z": 0.5, "gaps": 0.2}  # sd of the jitter of each chain's starting point
+
+# Count tables: one cell per participant x block_type x vividness rating (0 without a rating)
+cell_dtype = np.dtype([
+    ("participant", "U48"),  # phase/participant_id
+    ("block_type", "U24"),
+    ("vividness", np.int8),
+])
+
+def session_counts(path, phase):
+    """Cells and count tables (n_cells, 2 stimuli, 2 responses, n_ratings) of one session CSV."""
+    trials = metad.load_session_trials(path, phase)
+    participants = np.char.add(np.char.add(trials["phase"], "/"), trials["participant_id"])
+    cells = np.zeros(len(trials), dtype=metad.with_text_width(cell_dtype, "participant", participants.itemsize // 4))
+    cells["participant"] = participants
+    cells["block_type"] = trials["block_type"]
+    has_vividness = (trials["block_type"] == "with_mental_replay") & (trials["vividness"] >= 1)
+    cells["vividness"] = np.where(has_vividness, trials["vividness"], 0)
+    keys, index = np.unique(cells, return_inverse=True)
+    counts = np.zeros((len(keys), 2, 2, metad.N_RATINGS))
+    np.add.at(counts, (index.ravel(), trials["stimulus"], trials["response"], trials["confidence"] - 1), 1)
+    return keys, counts
+
+class CountCache:
+    """Count tables of each session CSV, saved in cache_dir and rebuilt only when the file changes."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, path):
+        name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"counts_{name}.npz")
+
+    def get(self, path, phase):
+        stat = os.stat(path)
+        cache_path = self._cache_path(path)
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                if cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+                    return cached["keys"], cached["counts"]
+        keys, counts = session_counts(path, phase)
+        np.savez(cache_path, keys=keys, counts=counts, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        return keys, counts
+
+def load_counts(data_dir="./data", phases=metad.PHASES, cache_dir=None):
+    """Count tables of every cell over all sessions, merging sessions of the same participant."""
+    cache = CountCache(cache_dir) if cache_dir else None
+    all_keys, all_counts = [], []
+    for phase, path in metad.session_files(data_dir, phases):
+        keys, counts = cache.get(path, phase) if cache else session_counts(path, phase)
+        all_keys.append(keys)
+        all_counts.append(counts)
+    if not all_keys:
+        return np.zeros(0, dtype=cell_dtype), np.zeros((0, 2, 2, metad.N_RATINGS))
+    keys, index = np.unique(np.concatenate(all_keys), return_inverse=True)
+    counts = np.zeros((len(keys), 2, 2, metad.N_RATINGS))
+    np.add.at(counts, index.ravel(), np.concatenate(all_counts))
+    return keys, counts
+
+class ModelData:
+    """Index arrays linking cells to participants and participant x condition pairs, built once."""
+    def __init__(self, cells, counts):
+        self.cells = cells
+        self.counts = counts
+        self.participants, self.participant_index = np.unique(cells["participant"], return_inverse=True)
+        pairs = cells[["participant", "block_type"]]
+        self.pairs, self.pair_index = np.unique(pairs, return_inverse=True)
+        self.participant_index = self.participant_index.ravel()
+        self.pair_index = self.pair_index.ravel()
+        self.replay = (cells["block_type"] == "with_mental_replay").astype(float)
+        self.vividness = np.where(cells["vividness"] > 0, cells["vividness"] - VIVIDNESS_CENTER, 0.0)
+
+        # Type-1 d' and c of every participant x condition, from padded counts
+        pair_counts = np.zeros((len(self.pairs),) + counts.shape[1:])
+        np.add.at(pair_counts, self.pair_index, counts)
+        d_prime, c = metad.type1_sdt(pair_counts + 1 / (2 * counts.shape[-1]))
+        self.d_prime = np.maximum(d_prime, 0.1)  # meta-d' = M-ratio * d' needs a positive d'
+        self.c_prime = c / self.d_prime
+        self.n_gaps = 2 * (counts.shape[-1] - 1)
+
+    @property
+    def n_participants(self):
+        return len(self.participants)
+
+    @property
+    def n_pairs(self):
+        return len(self.pairs)
+
+    def log_m_ratio(self, group, z):
+        mu, beta_replay, beta_vividness, log_sigma = group
+        return (mu + beta_replay * self.replay + beta_vividness * self.vividness
+                + np.exp(log_sigma) * z[self.participant_index])
+
+    def cell_nll(self, group, z, gaps):
+        """Negative log-likelihood of every cell; inf where the parameters are out of range,
+        so that such proposals are rejected explicitly."""
+        log_m_ratio = self.log_m_ratio(group, z)
+        in_range = np.abs(log_m_ratio) <= MAX_LOG_M_RATIO
+        meta_d = self.d_prime[self.pair_index] * np.exp(np.where(in_range, log_m_ratio, 0.0))
+        params = np.column_stack([meta_d, gaps[self.pair_index]])
+        nll = metad.negative_log_likelihood(params, self.counts, self.c_prime[self.pair_index])
+        return np.where(in_range & np.isfinite(nll), nll, np.inf)
+
+    def sum_by(self, index, n, values):
+        return np.bincount(index, weights=values, minlength=n)
+
+def log_prior_group(group):
+    mu, beta_replay, beta_vividness, log_sigma = group
+    # Normal(0, 1) priors, half-normal(1) on sigma sampled on the log scale (with its Jacobian)
+    return -0.5 * (mu ** 2 + beta_replay ** 2 + beta_vividness ** 2 + np.exp(2 * log_sigma)) + log_sigma
+
+def initial_state(data):
+    return {
+        "group": np.array([0.0, 0.0, 0.0, np.log(0.5)]),
+        "z": np.zeros(data.n_participants),
+        "gaps": np.full((data.n_pairs, data.n_gaps), INITIAL_GAP),
+        "step_group": np.array(1.0),
+        "proposal_group": np.diag(np.full(4, 0.05)),  # Cholesky factor of the group proposal covariance
+        "step_sigma": np.array(0.3),
+        "step_z": np.full(data.n_participants, 0.5),
+        "step_gaps": np.full(data.n_pairs, 0.1),
+    }
+
+def overdisperse(state, rng):
+    """Copy of state with a jittered starting point, so that the chains of a run start apart
+    (R-hat compares chains, which is meaningless if they all start from the same state)."""
+    state = {name: np.array(value, dtype=float) for name, value in state.items()}
+    for name, spread in INITIAL_SPREAD.items():
+        state[name] = state[name] + spread * rng.standard_normal(state[name].shape)
+    return state
+
+def _adapt(step, accepted, iterations):
+    """Scales step sizes towards TARGET_ACCEPTANCE from the acceptance rate of the last window."""
+    return step * np.exp(accepted / iterations - TARGET_ACCEPTANCE)
+
+def run_chain(data, n_warmup, n_samples, seed, state=None, adapt_every=50):
+    """One Metropolis-within-Gibbs chain from a jittered copy of state (the initial state by default);
+    returns its draws and its final state."""
+    rng = np.random.default_rng(seed)
+    start = state or initial_state(data)
+    state = overdisperse(start, rng)
+    if not np.all(np.isfinite(data.cell_nll(state["group"], state["z"], state["gaps"]))):
+        state = {name: np.array(value, dtype=float) for name, value in start.items()}  # jittered out of range
+    group, z, gaps = state["group"], state["z"], state["gaps"]
+    step_group, step_z, step_gaps = state["step_group"], state["step_z"], state["step_gaps"]
+    proposal_group, step_sigma = state["proposal_group"], state["step_sigma"]
+    nll = data.cell_nll(group, z, gaps)
+    accepted_group, accepted_sigma = 0.0, 0.0
+    accepted_z, accepted_gaps = np.zeros_like(step_z), np.zeros_like(step_gaps)
+    warmup_group = np.empty((n_warmup, 4))
+    draws_group = np.empty((n_samples, 4))
+    draws_z = np.empty((n_samples, data.n_participants))
+
+    for iteration in range(n_warmup + n_samples):
+        # Type-2 criteria of every participant x condition
+        proposal = gaps + step_gaps[:, None] * rng.standard_normal(gaps.shape)
+        nll_proposal = data.cell_nll(group, z, proposal)
+        log_ratio = (data.sum_by(data.pair_index, data.n_pairs, nll - nll_proposal)
+                     - 0.5 * np.sum((proposal - INITIAL_GAP) ** 2 - (gaps - INITIAL_GAP) ** 2, axis=1))
+        accept = np.log(rng.random(data.n_pairs)) < log_ratio
+        gaps = np.where(accept[:, None], proposal, gaps)
+        nll = np.where(accept[data.pair_index], nll_proposal, nll)
+        accepted_gaps += accept
+
+        # Participant effects
+        proposal = z + step_z * rng.standard_normal(z.shape)
+        nll_proposal = data.cell_nll(group, proposal, gaps)
+        log_ratio = (data.sum_by(data.participant_index, data.n_participants, nll - nll_proposal)
+                     - 0.5 * (proposal ** 2 - z ** 2))
+        accept = np.log(rng.random(data.n_participants)) < log_ratio
+        z = np.where(accept, proposal, z)
+        nll = np.where(accept[data.participant_index], nll_proposal, nll)
+        accepted_z += accept
+
+        # Group parameters
+        proposal = group + step_group * proposal_group @ rng.standard_normal(4)
+        nll_proposal = data.cell_nll(proposal, z, gaps)
+        log_ratio = nll.sum() - nll_proposal.sum() + log_prior_group(proposal) - log_prior_group(group)
+        if np.log(rng.random()) < log_ratio:
+            group, nll = proposal, nll_proposal
+            accepted_group += 1
+
+        # sigma with z rescaled so that sigma * z, hence the likelihood, stays the same
+        log_sigma = group[3] + step_sigma * rng.standard_normal()
+        z_scaled = z * np.exp(group[3] - log_sigma)
+        proposal = np.concatenate([group[:3], [log_sigma]])
+        log_ratio = (log_prior_group(proposal) - log_prior_group(group) - 0.5 * np.sum(z_scaled ** 2 - z ** 2)
+                     + data.n_participants * (group[3] - log_sigma))  # Jacobian of the rescaling
+        if np.log(rng.random()) < log_ratio:
+            group, z = proposal, z_scaled
+            accepted_sigma += 1
+
+        # mu shifted against the participant effects: mu + sigma * z, hence the likelihood, stays
+        # the same, so the shift is drawn exactly from its Gaussian conditional under the priors
+        sigma = np.exp(group[3])
+        precision = 1 + data.n_participants / sigma ** 2
+        shift = (z.sum() / sigma - group[0]) / precision + rng.standard_normal() / np.sqrt(precision)
+        group = np.concatenate([[group[0] + shift], group[1:]])
+        z = z - shift / sigma
+
+        if iteration < n_warmup:
+            warmup_group[iteration] = group
+        if iteration < n_warmup and (iteration + 1) % adapt_every == 0:
+            step_gaps = _adapt(step_gaps, accepted_gaps, adapt_every)
+            step_z = _adapt(step_z, accepted_z, adapt_every)
+            step_group = _adapt(step_group, accepted_group, adapt_every)
+            step_sigma = _adapt(step_sigma, accepted_sigma, adapt_every)
+            # Group proposal shaped like the posterior seen in the second half of the warm-up so far
+            recent = warmup_group[(iteration + 1) // 2:iteration + 1]
+            if len(recent) >= 100:
+                covariance = np.cov(recent, rowvar=False) * 2.38 ** 2 / 4 + 1e-6 * np.eye(4)
+                proposal_group = np.linalg.cholesky(covariance)
+            accepted_group, accepted_sigma = 0.0, 0.0
+            accepted_z, accepted_gaps = np.zeros_like(step_z), np.zeros_like(step_gaps)
+        if iteration >= n_warmup:
+            draws_group[iteration - n_warmup] = group
+            draws_z[iteration - n_warmup] = z
+
+    final_state = {"group": group, "z": z, "gaps": gaps, "step_group": step_group,
+                   "proposal_group": proposal_group, "step_sigma": step_sigma,
+                   "step_z": step_z, "step_gaps": step_gaps}
+    return draws_group, draws_z, final_state
+
+def split_rhat(draws):
+    """Split R-hat of draws with shape (n_chains, n_samples)."""
+    half = draws.shape[1] // 2
+    chains = np.concatenate([draws[:, :half], draws[:, half:2 * half]])
+    within = chains.var(axis=1, ddof=1).mean()
+    between = half * chains.mean(axis=1).var(ddof=1)
+    return float(np.sqrt(((half - 1) / half * within + between / half) / within))
+
+def effective_sample_size(draws):
+    """ESS of draws with shape (n_chains, n_samples), from autocorrelations summed up to the first negative pair."""
+    n_chains, n = draws.shape
+    centered = draws - draws.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=2 * n, axis=1)
+    autocovariance = np.fft.irfft(spectrum * np.conj(spectrum), axis=1)[:, :n] / n
+    rho = autocovariance.mean(axis=0) / autocovariance[:, 0].mean()
+    total = 0.0
+    for t in range(1, n - 1, 2):
+        pair = rho[t] + rho[t + 1]
+        if pair < 0:
+            break
+        total += pair
+    return float(n_chains * n / (1 + 2 * total))
+
+class StateCache:
+    """Final state of the last run, matched to the participants and pairs of the next one."""
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, "hierarchical_state.npz")
+
+    def load(self, data):
+        if not os.path.exists(self.path):
+            return None
+        state = initial_state(data)
+        with np.load(self.path) as cached:
+            for column in ["group", "step_group", "proposal_group", "step_sigma"]:
+                state[column] = cached[column]
+            for names, keys, columns in [("participants", data.participants, ["z", "step_z"]),
+                                         ("pairs", data.pairs, ["gaps", "step_gaps"])]:
+                known = {key: i for i, key in enumerate(cached[names].tolist())}
+                for i, key in enumerate(keys.tolist()):
+                    if key in known:
+                        for column in columns:
+                            state[column][i] = cached[column][known[key]]
+        return state
+
+    def save(self, data, state):
+        np.savez(self.path, participants=data.participants, pairs=data.pairs, **state)
+
+def sample(data, n_chains=4, n_warmup=2000, n_samples=2000, seed=None, state=None, executor=None):
+    """Runs n_chains chains (in parallel when an executor is given) and pools their draws."""
+    seeds = np.random.SeedSequence(seed).spawn(n_chains)
+    jobs = [(data, n_warmup, n_samples, chain_seed, state) for chain_seed in seeds]
+    if executor is None:
+        results = [run_chain(*job) for job in jobs]
+    else:
+        results = list(executor.map(run_chain, *zip(*jobs)))
+    draws_group = np.stack([r[0] for r in results])  # (n_chains, n_samples, 4)
+    draws_z = np.stack([r[1] for r in results])
+    return draws_group, draws_z, results[0][2]
+
+def summarize(data, draws_group, draws_z):
+    """Posterior summaries of the group parameters and of each participant's M-ratio per condition."""
+    summary = {}
+    for j, name in enumerate(GROUP_PARAMS):
+        values = draws_group[..., j]
+        if name == "log_sigma":
+            name, values = "sigma", np.exp(values)
+        low, high = np.quantile(values, [0.025, 0.975])
+        summary[name] = {"mean": float(values.mean()), "sd": float(values.std()), "low": float(low),
+                         "high": float(high), "rhat": split_rhat(values), "ess": effective_sample_size(values)}
+    summary["p_replay_positive"] = float(np.mean(draws_group[..., 1] > 0))
+
+    # M-ratio at the vividness scale's middle, per participant and condition
+    mu, beta_replay, sigma = draws_group[..., 0:1], draws_group[..., 1:2], np.exp(draws_group[..., 3:4])
+    participants = []
+    for i, participant in enumerate(data.participants.tolist()):
+        effect = sigma[..., 0] * draws_z[..., i]
+        participants.append({
+            "participant": participant,
+            "m_ratio_without_replay": float(np.exp(mu[..., 0] + effect).mean()),
+            "m_ratio_with_replay": float(np.exp(mu[..., 0] + beta_replay[..., 0] + effect).mean()),
+        })
+    summary["participants"] = participants
+    return summary
+
+def fit(data_dir="./data", phases=metad.PHASES, cache_dir=None, n_chains=4, n_warmup=2000,
+        n_samples=2000, seed=None, executor=None):
+    """Loads the count tables, samples the posterior and summarizes it.
+    With a cache_dir, the warm-up is halved when a previous state is found."""
+    cells, counts = load_counts(data_dir, phases, cache_dir)
+    if len(cells) == 0:
+        return None
+    data = ModelData(cells, counts)
+    state_cache = StateCache(cache_dir) if cache_dir else None
+    state = state_cache.load(data) if state_cache else None
+    if state is not None:
+        n_warmup = max(n_warmup // 2, 100)
+    draws_group, draws_z, final_state = sample(data, n_chains, n_warmup, n_samples, seed, state, executor)
+    if state_cache:
+        state_cache.save(data, final_state)
+    return summarize(data, draws_group, draws_z)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hierarchical meta-d' model of mental replay")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--phases", nargs="+", default=metad.PHASES, choices=metad.PHASES)
+    parser.add_argument("--cache-dir", default="./data/.analysis_cache")
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.chains) as executor:
+        summary = fit(args.data_dir, args.phases, args.cache_dir, args.chains, args.warmup,
+                      args.samples, args.seed, executor)
+    if summary is None:
+        print(f"No experimental trials found under {args.data_dir}")
+    else:
+        for name in ["mu", "beta_replay", "beta_vividness", "sigma"]:
+            s = summary[name]
+            print(f"{name:<15} {s['mean']:7.3f} (sd {s['sd']:.3f}, 95% [{s['low']:.3f}, {s['high']:.3f}]) "
+                  f"R-hat {s['rhat']:.3f}, ESS {s['ess']:.0f}")
+        if any(summary[name]["rhat"] > 1.05 for name in ["mu", "beta_replay", "beta_vividness", "sigma"]):
+            print("R-hat above 1.05: the chains have not converged, run more warm-up and samples")
+        print(f"P(beta_replay > 0) = {summary['p_replay_positive']:.3f}")
+        for p in summary["participants"]:
+            print(f"  {p['participant']:<24} M-ratio without replay {p['m_ratio_without_replay']:.2f}, "
+                  f"with replay {p['m_ratio_with_replay']:.2f}")
@@ -0,0 +1,207 @@
+"""Meta-d' and M-ratio of every participant, fitted in one batch.
+
+Every session CSV under data/{code,pilot,experimental} is loaded, and the experimental
+trials are turned into type-2 count tables (stimulus x response x confidence) with NumPy,
+one per participant x block_type. The meta-d' model (Maniscalco & Lau, 2012) is then fitted
+by maximum likelihood to all tables at once: the likelihood is evaluated for every fit in
+a single vectorized call, and because the fits are independent, the gradient of their
+summed likelihood is obtained with one perturbation per parameter for all fits together.
+
+Usage (from exp_script):
+    python -m analysis.metad --output data/metad_results.csv
+"""
+import argparse
+import csv
+import glob
+import os
+import numpy as np
+from scipy import optimize, special
+
+PHASES = ["code", "pilot", "experimental"]
+BLOCK_TYPES = ["with_mental_replay", "without_mental_replay"]
+N_RATINGS = 4  # confidence and vividness scales go from 1 to 4
+RESPONSE_TO_STIMULUS = {"v": 0, "b": 1}  # 'v' is correct for direction -1 (S1), 'b' for +1 (S2)
+
+trial_dtype = np.dtype([
+    ("phase", "U16"),
+    ("participant_id", "U32"),
+    ("block_type", "U24"),
+    ("stimulus", np.int8),  # 0 = S1 (direction -1), 1 = S2 (direction +1)
+    ("response", np.int8),  # same coding
+    ("confidence", np.int8),
+    ("vividness", np.int8),  # -1 without mental replay
+])
+
+def with_text_width(dtype, field, width):
+    """dtype with a text field wide enough for width characters (never narrower than before)."""
+    return np.dtype([(name, f"U{max(width, dtype[name].itemsize // 4)}" if name == field else dtype[name])
+                     for name in dtype.names])
+
+def _rating(value):
+    return int(value) if value not in ("", "NA", "None") else -1
+
+def session_files(data_dir="./data", phases=PHASES):
+    """(phase, path) of every session CSV."""
+    return [(phase, path) for phase in phases
+            for path in sorted(glob.glob(os.path.join(data_dir, phase, "*_experiment_data.csv")))]
+
+def load_session_trials(path, phase):
+    """Experimental trials with a response and a confidence rating from one session CSV."""
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("block") not in BLOCK_TYPES or row.get("response") not in RESPONSE_TO_STIMULUS:
+                continue
+            confidence = _rating(row.get("confidence", "NA"))
+            if not 1 <= confidence <= N_RATINGS:
+                continue
+            rows.append((phase, row["participant_id"], row["block_type"],
+                         int(int(row["gabor_direction"]) > 0), RESPONSE_TO_STIMULUS[row["response"]],
+                         confidence, _rating(row.get("vividness", "NA"))))
+    # IDs are typed at the dialog, so the field grows with the longest one rather than cutting it
+    longest = max((len(row[1]) for row in rows), default=0)
+    return np.array(rows, dtype=with_text_width(trial_dtype, "participant_id", longest))
+
+def load_trials(data_dir="./data", phases=PHASES):
+    """Experimental trials of every session CSV."""
+    trials = [load_session_trials(path, phase) for phase, path in session_files(data_dir, phases)]
+    return np.concatenate(trials) if trials else np.zeros(0, dtype=trial_dtype)
+
+def count_tables(trials, rating="confidence", n_ratings=N_RATINGS):
+    """Type-2 count tables of every participant x block_type.
+
+    Returns the keys (phase, participant_id, block_type) and an array of shape
+    (n_fits, 2 stimuli, 2 responses, n_ratings) holding the number of trials per cell.
+    """
+    keys, index = np.unique(trials[["phase", "participant_id", "block_type"]], return_inverse=True)
+    counts = np.zeros((len(keys), 2, 2, n_ratings))
+    np.add.at(counts, (index.ravel(), trials["stimulus"], trials["response"], trials[rating] - 1), 1)
+    return keys, counts
+
+def type1_sdt(counts):
+    """d' and criterion c of every table (padded counts, see fit_meta_d)."""
+    responses = counts.sum(axis=-1)  # (n_fits, stimulus, response)
+    hit_rate = responses[:, 1, 1] / responses[:, 1].sum(axis=-1)
+    false_alarm_rate = responses[:, 0, 1] / responses[:, 0].sum(axis=-1)
+    z_hit, z_false_alarm = special.ndtri(hit_rate), special.ndtri(false_alarm_rate)
+    return z_hit - z_false_alarm, -0.5 * (z_hit + z_false_alarm)
+
+def _unpack(params, n_ratings):
+    """meta-d' and the type-2 criteria of every fit, relative to the type-1 criterion.
+    The criteria are kept ordered by parameterizing the log of the gaps between them."""
+    meta_d = params[:, 0]
+    s1_criteria = -np.cumsum(np.exp(params[:, 1:n_ratings]), axis=1)
+    s2_criteria = np.cumsum(np.exp(params[:, n_ratings:]), axis=1)
+    return meta_d, s1_criteria, s2_criteria
+
+def negative_log_likelihood(params, counts, c_prime):
+    """Type-2 negative log-likelihood of every fit; params has shape (n_fits, 2 * n_ratings - 1)."""
+    n_fits, n_ratings = counts.shape[0], counts.shape[-1]
+    meta_d, s1_criteria, s2_criteria = _unpack(params, n_ratings)
+    # Type-1 criterion fixed at 0, with the same relative position as in the type-1 data
+    means = np.stack([-meta_d / 2, meta_d / 2], axis=1) - (meta_d * c_prime)[:, None]  # (n_fits, stimulus)
+    inf = np.full((n_fits, 1), np.inf)
+    zero = np.zeros((n_fits, 1))
+    s1_edges = np.concatenate([zero, s1_criteria, -inf], axis=1)  # confidence 1..K from 0 leftwards
+    s2_edges = np.concatenate([zero, s2_criteria, inf], axis=1)  # confidence 1..K from 0 rightwards
+    mu = means[:, :, None]
+    s1_cdf = special.ndtr(s1_edges[:, None, :] - mu)
+    s2_sf = special.ndtr(mu - s2_edges[:, None, :])
+    # P(rating | response, stimulus); the floor keeps far tails at a probability of 0 instead of 0/0
+    p_s1 = (s1_cdf[..., :-1] - s1_cdf[..., 1:]) / np.maximum(s1_cdf[..., :1], 1e-300)
+    p_s2 = (s2_sf[..., :-1] - s2_sf[..., 1:]) / np.maximum(s2_sf[..., :1], 1e-300)
+    probabilities = np.stack([p_s1, p_s2], axis=2)  # (n_fits, stimulus, response, rating)
+    return -np.sum(counts * np.log(np.clip(probabilities, 1e-10, None)), axis=(1, 2, 3))
+
+def _initial_params(d_prime, n_fits, n_ratings):
+    params = np.empty((n_fits, 2 * n_ratings - 1))
+    params[:, 0] = d_prime
+    params[:, 1:] = np.log(0.5)  # criteria 0.5 apart
+    return params
+
+def fit_meta_d(counts, pad=True, step=1e-5):
+    """Maximum-likelihood meta-d' of every count table.
+
+    pad adds 1 / (2 * n_ratings) to every cell so that empty cells do not give infinite
+    rates (Hautus, 1995). Returns a dict of arrays with one value per table.
+    """
+    counts = np.asarray(counts, dtype=float)
+    n_fits, n_ratings = counts.shape[0], counts.shape[-1]
+    if pad:
+        counts = counts + 1 / (2 * n_ratings)
+    d_prime, c = type1_sdt(counts)
+    c_prime = c / np.where(np.abs(d_prime) < 1e-6, 1e-6, d_prime)
+    shape = (n_fits, 2 * n_ratings - 1)
+
+    def objective(flat):
+        params = flat.reshape(shape)
+        nll = negative_log_likelihood(params, counts, c_prime)
+        # Central differences: parameter j of every fit is perturbed at once
+        gradient = np.empty(shape)
+        for j in range(shape[1]):
+            params[:, j] += step
+            upper = negative_log_likelihood(params, counts, c_prime)
+            params[:, j] -= 2 * step
+            lower = negative_log_likelihood(params, counts, c_prime)
+            params[:, j] += step
+            gradient[:, j] = (upper - lower) / (2 * step)
+        return nll.sum(), gradient.ravel()
+
+    result = optimize.minimize(objective, _initial_params(d_prime, n_fits, n_ratings).ravel(),
+                               jac=True, method="L-BFGS-B", options={"maxiter": 5000, "ftol": 1e-13, "gtol": 1e-7})
+    # ftol applies to the summed likelihood, hence much smaller than for a single fit
+    params = result.x.reshape(shape)
+    meta_d, s1_criteria, s2_criteria = _unpack(params, n_ratings)
+    gradient = objective(params.ravel().copy())[1].reshape(shape)
+    return {
+        "d_prime": d_prime,
+        "c": c,
+        "meta_d": meta_d,
+        "m_ratio": meta_d / d_prime,
+        "m_diff": meta_d - d_prime,
+        "nll": negative_log_likelihood(params, counts, c_prime),
+        "converged": np.abs(gradient).max(axis=1) < 1e-3,
+    }
+
+def fit_sessions(data_dir="./data", phases=PHASES, rating="confidence"):
+    """Tidy results table: one row per phase x participant x block_type."""
+    trials = load_trials(data_dir, phases)
+    if rating == "vividness":
+        trials = trials[(trials["vividness"] >= 1) & (trials["vividness"] <= N_RATINGS)]
+    if len(trials) == 0:
+        return []
+    keys, counts = count_tables(trials, rating)
+    fit = fit_meta_d(counts)
+    results = []
+    for i, (phase, participant_id, block_type) in enumerate(keys.tolist()):
+        row = {"phase": phase, "participant_id": participant_id, "block_type": block_type,
+               "rating": rating, "n_trials": int(counts[i].sum())}
+        row.update({name: float(values[i]) if name != "converged" else bool(values[i])
+                    for name, values in fit.items()})
+        results.append(row)
+    return results
+
+def save_results(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit meta-d' per participant and block type")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--phases", nargs="+", default=PHASES, choices=PHASES)
+    parser.add_argument("--rating", default="confidence", choices=["confidence", "vividness"])
+    parser.add_argument("--output", default=None, help="CSV file for the results table")
+    args = parser.parse_args()
+
+    results = fit_sessions(args.data_dir, args.phases, args.rating)
+    if not results:
+        print(f"No experimental trials found under {args.data_dir}")
+    else:
+        for row in results:
+            print(f"{row['phase']:<12} {row['participant_id']:<12} {row['block_type']:<22} "
+                  f"n={row['n_trials']:<4} d'={row['d_prime']:.2f} meta-d'={row['meta_d']:.2f} "
+                  f"M-ratio={row['m_ratio']:.2f}")
+        if args.output:
+            save_results(args.output, results)
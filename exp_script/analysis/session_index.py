@@ -0,0 +1,230 @@
+"""Incremental SQLite index of the session CSVs under data/{code,pilot,experimental}.
+
+update() only reads the files that are new or changed since the last update: a file whose
+size and modification time are unchanged is skipped, and one whose content hash is unchanged
+is only re-stamped. Every session keeps its participant, group, phase, timestamp and
+completeness, and every row of its CSV is stored as a typed trial, so cohort summaries are
+SQL queries instead of re-parsing every CSV.
+
+Usage (from exp_script):
+    python -m analysis.session_index --db data/sessions.sqlite
+"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import numpy as np
+import main
+import session_store
+from analysis import metad
+
+# "<participant_id_clean>_<YYYYmmdd>_<HHMMSS>_experiment_data.csv", as written by main.Session
+FILE_NAME = re.compile(r"^(?P<participant>.+)_(?P<date>\d{8})_(?P<time>\d{6})_experiment_data\.csv$")
+BOOLEAN_COLUMNS = {"correct", "vividness_on_left"}
+
+def _sql_type(column):
+    column_type = np.dtype(session_store.COLUMN_TYPES.get(column, session_store.DEFAULT_TYPE)[0])
+    if column in BOOLEAN_COLUMNS or column_type.kind in "iu":
+        return "INTEGER"
+    if column_type.kind == "f":
+        return "REAL"
+    return "TEXT"
+
+TRIAL_COLUMNS = [column for column in main.header if column not in ("participant_id", "gender", "age", "handedness")]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    path TEXT PRIMARY KEY,
+    phase TEXT,
+    participant_id TEXT,
+    participant_id_clean TEXT,
+    group_id INTEGER,
+    started TEXT,
+    gender TEXT,
+    age INTEGER,
+    handedness TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    sha256 TEXT,
+    n_rows INTEGER,
+    n_experimental_trials INTEGER,
+    complete INTEGER
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_path TEXT REFERENCES sessions(path) ON DELETE CASCADE,
+    {", ".join(f"{column} {_sql_type(column)}" for column in TRIAL_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS sessions_participant ON sessions(participant_id_clean);
+CREATE INDEX IF NOT EXISTS sessions_group_phase ON sessions(group_id, phase);
+CREATE INDEX IF NOT EXISTS trials_session ON trials(session_path);
+CREATE INDEX IF NOT EXISTS trials_block_type ON trials(block_type);
+"""
+# Stored as PRAGMA user_version: an index built with another schema (e.g. before a column was
+# added to main.header) is dropped and rebuilt from the CSVs
+SCHEMA_VERSION = int(hashlib.sha256(SCHEMA.encode("utf-8")).hexdigest()[:7], 16)
+
+SESSION_COLUMNS = ["path", "phase", "participant_id", "participant_id_clean", "group_id", "started", "gender",
+                   "age", "handedness", "mtime_ns", "size", "sha256", "n_rows", "n_experimental_trials", "complete"]
+
+def _insert(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+def _value(column, value):
+    """CSV string to the value stored in SQLite (None for missing values)."""
+    if value is None or value in ("", "NA", "None"):
+        return None
+    if column in BOOLEAN_COLUMNS:
+        return int(value == "True")
+    sql_type = _sql_type(column)
+    try:
+        if sql_type == "INTEGER":
+            return int(float(value))
+        if sql_type == "REAL":
+            return float(value)
+    except ValueError:
+        return None
+    return value
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class SessionIndex:
+    """SQLite catalogue of the sessions and their trials."""
+    def __init__(self, db_path, data_dir="./data", phases=metad.PHASES,
+                 expected_trials=main.TOTAL_BLOCKS * main.NUMBER_OF_TRIALS):
+        self.data_dir = data_dir
+        self.phases = phases
+        self.expected_trials = expected_trials  # experimental trials of a complete session
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS trials; DROP TABLE IF EXISTS sessions;")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def update(self):
+        """Ingests new and changed session files and forgets deleted ones.
+        Returns the number of added, updated and removed sessions."""
+        known = {row["path"]: row for row in self.connection.execute("SELECT path, mtime_ns, size, sha256 FROM sessions")}
+        added = updated = 0
+        seen = set()
+        with self.connection:
+            for phase, path in metad.session_files(self.data_dir, self.phases):
+                path = os.path.normpath(path)
+                seen.add(path)
+                stat = os.stat(path)
+                row = known.get(path)
+                if row is not None and row["mtime_ns"] == stat.st_mtime_ns and row["size"] == stat.st_size:
+                    continue
+                sha256 = file_hash(path)
+                if row is not None and row["sha256"] == sha256:
+                    self.connection.execute("UPDATE sessions SET mtime_ns = ?, size = ? WHERE path = ?",
+                                            (stat.st_mtime_ns, stat.st_size, path))
+                    continue
+                self._ingest(path, phase, stat, sha256)
+                if row is None:
+                    added += 1
+                else:
+                    updated += 1
+            removed = [path for path in known if path not in seen]
+            self.connection.executemany("DELETE FROM sessions WHERE path = ?", [(path,) for path in removed])
+        return added, updated, len(removed)
+
+    def _ingest(self, path, phase, stat, sha256):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        match = FILE_NAME.match(os.path.basename(path))
+        participant_id_clean = match["participant"] if match else os.path.basename(path)
+        started = (f"{match['date'][:4]}-{match['date'][4:6]}-{match['date'][6:]} "
+                   f"{match['time'][:2]}:{match['time'][2:4]}:{match['time'][4:]}") if match else None
+        first = rows[0] if rows else {}
+        n_experimental = sum(row.get("block") in metad.BLOCK_TYPES for row in rows)
+
+        self.connection.execute("DELETE FROM sessions WHERE path = ?", (path,))  # trials follow (cascade)
+        self.connection.execute(
+            _insert("sessions", SESSION_COLUMNS),
+            (path, phase, first.get("participant_id", participant_id_clean), participant_id_clean,
+             main.assign_group(participant_id_clean), started, first.get("gender"),
+             _value("age", first.get("age")), first.get("handedness"), stat.st_mtime_ns, stat.st_size,
+             sha256, len(rows), n_experimental, int(n_experimental >= self.expected_trials)))
+        self.connection.executemany(
+            _insert("trials", ["session_path"] + TRIAL_COLUMNS),
+            [(path, *[_value(column, row.get(column)) for column in TRIAL_COLUMNS]) for row in rows])
+
+    @staticmethod
+    def _where(filters):
+        clauses, values = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"{column} IN ({', '.join(['?'] * len(value))})")
+                values.extend(value)
+            else:
+                clauses.append(f"{column} = ?")
+                values.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+    def sessions(self, participant=None, group_id=None, phase=None, complete=None):
+        """Sessions matching every given filter (a value or a list of values), oldest first."""
+        where, values = self._where({"participant_id_clean": participant, "group_id": group_id,
+                                     "phase": phase, "complete": None if complete is None else int(complete)})
+        return self.connection.execute(f"SELECT * FROM sessions{where} ORDER BY started", values).fetchall()
+
+    def trials(self, participant=None, group_id=None, phase=None, block_type=None, complete=None):
+        """Trials (with their session's participant, group and phase) matching every given filter."""
+        where, values = self._where({"s.participant_id_clean": participant, "s.group_id": group_id,
+                                     "s.phase": phase, "t.block_type": block_type,
+                                     "s.complete": None if complete is None else int(complete)})
+        return self.connection.execute(
+            "SELECT s.participant_id_clean, s.group_id, s.phase, t.* FROM trials t "
+            f"JOIN sessions s ON s.path = t.session_path{where}", values).fetchall()
+
+    def duplicates(self):
+        """Participants with more than one session in the same phase (restarts or aborted sessions)."""
+        return self.connection.execute(
+            "SELECT phase, participant_id_clean, COUNT(*) AS n_sessions, SUM(complete) AS n_complete "
+            "FROM sessions GROUP BY phase, participant_id_clean HAVING COUNT(*) > 1 "
+            "ORDER BY phase, participant_id_clean").fetchall()
+
+    def summary(self, phase=None, complete=True):
+        """Accuracy, mean response time and mean ratings per participant and block type."""
+        where, values = self._where({"s.phase": phase, "s.complete": None if complete is None else int(complete)})
+        where += (" AND " if where else " WHERE ") + "t.block = t.block_type"
+        return self.connection.execute(
+            "SELECT s.phase, s.participant_id_clean, s.group_id, t.block_type, COUNT(*) AS n_trials, "
+            "AVG(t.correct) AS accuracy, AVG(t.response_time) AS response_time, "
+            "AVG(t.confidence) AS confidence, AVG(t.vividness) AS vividness "
+            f"FROM trials t JOIN sessions s ON s.path = t.session_path{where} "
+            "GROUP BY s.phase, s.participant_id_clean, t.block_type "
+            "ORDER BY s.phase, s.participant_id_clean, t.block_type", values).fetchall()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the SQLite index of the session CSVs")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--db", default="./data/sessions.sqlite")
+    args = parser.parse_args()
+
+    index = SessionIndex(args.db, args.data_dir)
+    added, updated, removed = index.update()
+    print(f"{added} sessions added, {updated} updated, {removed} removed")
+    sessions = index.sessions()
+    incomplete = [s for s in sessions if not s["complete"]]
+    print(f"{len(sessions)} sessions, {len(incomplete)} incomplete")
+    for s in incomplete:
+        print(f"  incomplete: {s['path']} ({s['n_experimental_trials']} of {index.expected_trials} trials)")
+    for d in index.duplicates():
+        print(f"  duplicate: {d['phase']}/{d['participant_id_clean']} has {d['n_sessions']} sessions "
+              f"({d['n_complete']} complete)")
+    index.close()
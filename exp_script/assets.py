@@ -0,0 +1,66 @@
+import os
+import threading
+import weakref
+try:
+    from PIL import Image
+except ImportError:  # without Pillow, ImageStim decodes the files itself when uploading
+    Image = None
+
+class ImageCache:
+    """Instruction images decoded and uploaded once, then handed out as ready ImageStims.
+    preload() decodes the files, optionally on a background thread while the participant
+    fills in the dialogs; upload() then turns them into ImageStims (the GL upload has to
+    happen on the thread that owns the window). Images can be asked for by path or by
+    file name.
+    """
+    def __init__(self):
+        self._decoded = {}  # path -> decoded image (or the path itself without Pillow)
+        self._names = {}  # file name -> path
+        self._stims = weakref.WeakKeyDictionary()  # window -> {path: ImageStim}
+        self._thread = None
+
+    def preload(self, paths, background=True):
+        paths = [path for path in paths if path not in self._decoded]
+        for path in paths:
+            self._names[os.path.basename(path)] = path
+        if background:
+            self._thread = threading.Thread(target=self._decode, args=(paths,), daemon=True)
+            self._thread.start()
+        else:
+            self._decode(paths)
+
+    def _decode(self, paths):
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"Instruction image not found: {path}")
+                continue
+            if Image is None:
+                self._decoded[path] = path
+                continue
+            image = Image.open(path)
+            image.load()
+            self._decoded[path] = image
+
+    def wait(self):
+        """Waits for the background decoding to finish."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def upload(self, win):
+        """Creates the ImageStim of every decoded image for this window."""
+        self.wait()
+        for path in self._decoded:
+            self.get(win, path)
+
+    def get(self, win, image):
+        """Returns the ImageStim of a path or file name, building it if it was not preloaded."""
+        path = self._names.get(image, image)
+        stims = self._stims.setdefault(win, {})
+        if path not in stims:
+            from psychopy import visual  # deferred: preload() runs before the window exists
+            self.wait()
+            stims[path] = visual.ImageStim(win, image=self._decoded.get(path, path))
+        return stims[path]
+
+image_cache = ImageCache()
@@ -0,0 +1,72 @@
+"""Session checkpoints, to resume a session that crashed where it stopped.
+
+After every trial the session saves a small JSON file next to its CSV
+(<participant>_<timestamp>_experiment_data_checkpoint.json) with everything the rest of the
+session depends on: the position in the session (training stage and counters, or the next
+experimental trial), the states of the random streams, the block order, the staircases and
+the directions shown so far, and the number of data rows saved until then.
+
+The checkpoint is written on the CSV writer thread (trial_logger), after the rows logged
+before it and together with the .npy copy of the session, and replaced atomically. The
+trial loop never waits for the disk, and even when the process is killed the data files
+hold at least the rows the checkpoint counts. A resumed session drops any row saved after
+its checkpoint (truncate_csv, SessionArrayWriter keep_rows) and runs those trials again.
+"""
+import csv
+import glob
+import json
+import os
+import numpy as np
+
+VERSION = 2
+
+def checkpoint_path(data_file):
+    return data_file.replace(".csv", "_checkpoint.json")
+
+def seed_to_json(seed):
+    # Simulations seed sessions with spawned SeedSequences rather than integers
+    if isinstance(seed, np.random.SeedSequence):
+        return {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)}
+    return seed
+
+def seed_from_json(seed):
+    if isinstance(seed, dict):
+        return np.random.SeedSequence(seed["entropy"], spawn_key=tuple(seed["spawn_key"]))
+    return seed
+
+def save_checkpoint(path, state):
+    # A temporary file first, so a crash never leaves a half-written checkpoint behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def truncate_csv(data_file, n_rows):
+    """Keeps the header and the first n_rows rows of the CSV."""
+    with open(data_file, newline="") as f:
+        rows = list(csv.reader(f))
+    if len(rows) <= n_rows + 1:
+        return
+    tmp_path = data_file + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        csv.writer(f).writerows(rows[:n_rows + 1])
+    os.replace(tmp_path, data_file)
+
+def load_checkpoint(path):
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("version") != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} checkpoint")
+    return state
+
+def find_checkpoint(save_directory, participant_id_clean):
+    """Checkpoint of the participant's latest unfinished session, or None."""
+    paths = glob.glob(os.path.join(save_directory, f"{glob.escape(participant_id_clean)}_*_experiment_data_checkpoint.json"))
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            state = load_checkpoint(path)
+        except (OSError, ValueError):
+            continue
+        if state["participant_id_clean"] == participant_id_clean:
+            return path if state["position"]["phase"] != "done" else None
+    return None
@@ -0,0 +1,141 @@
+"""Monte-Carlo design simulator: many simulated participants per design, on every core.
+
+Each design (a set of main.py settings such as TOTAL_BLOCKS, NUMBER_OF_TRIALS or the
+staircase steps) is run for n simulated participants spread over a process pool. Every
+participant gets its own streams spawned from one SeedSequence, for the observer as well
+as for the experiment itself, so no two participants share random numbers. The same
+participants are reused for every design, so designs are compared on common random numbers.
+
+Usage (from exp_script):
+    python design_simulation.py --participants 200 --total-blocks 4 8 --trials 10 20
+"""
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import main
+import simulation
+
+def _init_worker():
+    simulation.install()
+
+def participant_streams(seed_sequence):
+    """Observer and experiment seeds of a participant.
+    Unlike seed_sequence.spawn(2), this leaves seed_sequence unchanged, so a participant gets
+    the same streams in every design (common random numbers), in a worker or not."""
+    return [np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (i,),
+                                   pool_size=seed_sequence.pool_size) for i in range(2)]
+
+def _simulate_participant(design, participant_number, seed_sequence, observer_params, sensory_noise_spread):
+    """Runs one simulated participant; executed in a worker process."""
+    observer_seed, experiment_seed = participant_streams(seed_sequence)
+    rng = np.random.default_rng(observer_seed)
+    params = dict(observer_params)
+    params["sensory_noise"] *= np.exp(rng.normal(0, sensory_noise_spread))  # participants differ in sensitivity
+    observer = simulation.SimulatedObserver(rng=rng, **params)
+
+    # The session seed normally comes from the participant ID; here it comes from the
+    # participant's own SeedSequence so simulated sessions never share streams
+    data_dir = tempfile.mkdtemp(prefix="design_simulation_")
+    try:
+        result = simulation.run_session(participant_number, observer, overrides=design, data_dir=data_dir,
+                                        seed=experiment_seed)
+        summary = simulation.summarize_session(result)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    summary["sensory_noise"] = observer.sensory_noise
+    summary["target_stim_strength"] = target_stim_strength(observer, design)
+    return summary
+
+def target_stim_strength(observer, design):
+    """stim_strength at which a weighted up-down staircase should settle for this observer."""
+    params = design.get("STAIRCASE_PARAMS", main.STAIRCASE_PARAMS)["weighted_up_down"]
+    target_p = params["step_up"] / (params["step_up"] + params["step_down"])
+    grid = np.linspace(0, 100, 10001)
+    return float(grid[np.searchsorted(observer.psychometric(grid), target_p)])
+
+def simulate_design(design, participant_seeds, observer_params, sensory_noise_spread=0.2, executor=None):
+    """Runs one simulated participant per seed through a design and aggregates their sessions."""
+    jobs = [(design, i + 1, seed, observer_params, sensory_noise_spread)
+            for i, seed in enumerate(participant_seeds)]
+    if executor is None:
+        summaries = [_simulate_participant(*job) for job in jobs]
+    else:
+        summaries = list(executor.map(_simulate_participant, *zip(*jobs)))
+    return aggregate(design, summaries)
+
+def aggregate(design, summaries):
+    """Staircase trajectories, training lengths and accuracies of all participants of a design."""
+    n_trials = max(len(s["stim_strength"]) for s in summaries)
+    trajectories = np.full((len(summaries), n_trials), np.nan)
+    for i, s in enumerate(summaries):
+        trajectories[i, :len(s["stim_strength"])] = s["stim_strength"]
+    tail = max(1, n_trials // 10)
+    final = np.nanmean(trajectories[:, -tail:], axis=1)
+    target = np.array([s["target_stim_strength"] for s in summaries])
+    result = {
+        "design": design,
+        "n_participants": len(summaries),
+        "mean_trajectory": np.nanmean(trajectories, axis=0),
+        "sd_trajectory": np.nanstd(trajectories, axis=0),
+        "final_stim_strength": float(np.mean(final)),
+        "staircase_error": float(np.mean(np.abs(final - target))),
+        "duration_minutes": float(np.mean([s["duration"] for s in summaries]) / 60),
+        "trajectories": trajectories,
+    }
+    for label in ["training_1", "training_2", "training_3"]:
+        lengths = np.array([s[f"{label}_trials"] for s in summaries])
+        result[f"{label}_trials"] = float(lengths.mean())
+        result[f"{label}_extended"] = float(np.mean(lengths > 20))  # past baseline_trials of training_phase
+    for block_type in ["with_mental_replay", "without_mental_replay"]:
+        accuracy = np.array([s[f"accuracy_{block_type}"] for s in summaries])
+        result[f"accuracy_{block_type}"] = float(np.nanmean(accuracy))
+        result[f"accuracy_sd_{block_type}"] = float(np.nanstd(accuracy))
+    return result
+
+def print_summary(result):
+    design = ", ".join(f"{key}={value}" for key, value in result["design"].items()) or "default design"
+    print(f"{design} ({result['n_participants']} participants, {result['duration_minutes']:.1f} min per session)")
+    print(f"  training trials: {result['training_1_trials']:.1f} / {result['training_2_trials']:.1f} / "
+          f"{result['training_3_trials']:.1f} (extended: {result['training_1_extended']:.0%} / "
+          f"{result['training_2_extended']:.0%} / {result['training_3_extended']:.0%})")
+    print(f"  staircase: final stim_strength {result['final_stim_strength']:.2f}, "
+          f"mean error to the observer's target {result['staircase_error']:.2f}")
+    print(f"  accuracy: replay {result['accuracy_with_mental_replay']:.3f} "
+          f"(sd {result['accuracy_sd_with_mental_replay']:.3f}), "
+          f"no replay {result['accuracy_without_mental_replay']:.3f} "
+          f"(sd {result['accuracy_sd_without_mental_replay']:.3f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare experiment designs on simulated participants")
+    parser.add_argument("--participants", type=int, default=100, help="per design")
+    parser.add_argument("--total-blocks", type=int, nargs="+", default=[8])
+    parser.add_argument("--trials", type=int, nargs="+", default=[20], help="NUMBER_OF_TRIALS per block")
+    parser.add_argument("--step-up", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--step-down", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--sensory-noise", type=float, default=6.0)
+    parser.add_argument("--sensory-noise-spread", type=float, default=0.2, help="sd of log sensory noise across participants")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="save the staircase trajectories of every design to this .npz file")
+    args = parser.parse_args()
+
+    root_seed = np.random.SeedSequence(args.seed)
+    print(f"Seed: {root_seed.entropy}")
+    designs = [{"TOTAL_BLOCKS": blocks, "NUMBER_OF_TRIALS": trials,
+                "STAIRCASE_PARAMS": {"weighted_up_down": {"start": 20, "step_up": step_up, "step_down": step_down}}}
+               for blocks, trials, step_up, step_down in itertools.product(args.total_blocks, args.trials,
+                                                                           args.step_up, args.step_down)]
+    participant_seeds = root_seed.spawn(args.participants)
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        for design in designs:
+            result = simulate_design(design, participant_seeds, {"sensory_noise": args.sensory_noise},
+                                     args.sensory_noise_spread, executor=executor)
+            print_summary(result)
+            results.append(result)
+    if args.output:
+        np.savez(args.output, **{f"design_{i}": result["trajectories"] for i, result in enumerate(results)})
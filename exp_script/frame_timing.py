@@ -0,0 +1,199 @@
+import time
+import numpy as np
+
+DEFAULT_FRAME_RATE = 60.0  # used when the refresh rate cannot be measured
+LATE_FLIP_THRESHOLD = 1.5  # a flip this many frames after the paced flip before it counts as dropped frames
+
+# Every flip of the session, saved next to the CSV. global_trial restarts with the experimental
+# blocks, so trials are told apart by (block, global_trial); flips outside trials have block "NA"
+flip_dtype = np.dtype([
+    ("block", "U24"),
+    ("global_trial", np.int32),
+    ("label", "U16"),
+    ("time", np.float64),
+])
+
+def measure_frame_rate(win):
+    """Refresh rate of the window, measured over a few frames at startup."""
+    frame_rate = win.getActualFrameRate(nIdentical=10, nMaxFrames=120, nWarmUpFrames=10, threshold=1)
+    return frame_rate if frame_rate else DEFAULT_FRAME_RATE
+
+class FrameTimer:
+    """Records the timestamp of every flip and the timing of the stimulus of each trial.
+
+    Use timer.flip(label) instead of win.flip(), or timer.present(...) to show a screen for a
+    whole number of frames. A flip made with paced=True (every flip of present() and
+    present_until()) is due one refresh later, so the next flip, whatever its screen, that comes
+    later than that counts the refreshes in between as dropped frames: a late first frame of
+    the stimulus or of the next screen is caught as well as a late frame within a screen.
+    Unpaced flips (instructions, breaks, which come after a wait) are not checked and set no
+    deadline; neither does a paced flip with wait_after=True, whose screen then waits for a
+    key. The time spent building the stimulus, between build_started() and
+    build_finished(), is compared with the frame budget (one refresh interval).
+    Flips between end_trial() and the next start_trial() (instructions, breaks) are recorded
+    with global_trial -1 and count towards no trial.
+    """
+    def __init__(self, win, frame_rate=None, on_frame=None):
+        self.win = win
+        self.frame_rate = frame_rate or measure_frame_rate(win)
+        self.frame_duration = 1.0 / self.frame_rate
+        self.on_frame = on_frame  # called after every flip of present(), e.g. to check for escape
+        self.flips = []
+        self.trials = []
+        self._last_label = None
+        self._paced_flip = None  # time of the last flip if the next one is due a refresh later
+        self._build_start = None
+        self.stim_build_time = None  # the next stimulus may be built before its trial starts
+        self.start_trial(-1)
+
+    def start_trial(self, global_trial, block="NA"):
+        self.global_trial = global_trial
+        self.block = block
+        self.current = {
+            "trial_onset": None,
+            "stim_onset": None,
+            "stim_offset": None,
+            "dropped_frames": 0,
+        }
+
+    def build_started(self):
+        self._build_start = time.perf_counter()
+
+    def build_finished(self):
+        self.stim_build_time = time.perf_counter() - self._build_start
+
+    def frames_for(self, duration):
+        """Number of refreshes closest to a duration in seconds (at least one)."""
+        return max(1, int(round(duration * self.frame_rate)))
+
+    def present(self, label, draw, duration, prepare=None):
+        """Shows a screen for frames_for(duration) refreshes, redrawing it before every flip.
+
+        The next flip after this returns replaces the screen exactly on time. prepare() runs once
+        right after the first flip, so the next screen is built while this one is on display;
+        its result is returned. draw() must draw the same screen every time: a window that can
+        hold a static screen (the headless one of simulation.py, see hold_frames) shows the
+        remaining frames in one call.
+        """
+        prepared = None
+        frames = self.frames_for(duration)
+        hold_frames = getattr(self.win, "hold_frames", None)
+        for frame in range(frames):
+            draw()
+            self.flip(label, paced=True)
+            if frame == 0 and prepare is not None:
+                prepared = prepare()
+            if hold_frames is not None and frames > 1:
+                for t in hold_frames(frames - 1):
+                    self._record(label, t)
+            if self.on_frame is not None:
+                self.on_frame()
+            if hold_frames is not None:
+                break
+        return prepared
+
+    def present_until(self, label, draw, poll):
+        """Shows a screen, redrawn and flipped every refresh, until poll() (called after each
+        flip) returns something other than None; returns that.
+
+        As in present(), draw() must draw the same screen every time: a window that knows
+        when the next input comes (frames_until_input) holds the screen until then.
+        """
+        frames_until_input = getattr(self.win, "frames_until_input", None)
+        while True:
+            draw()
+            self.flip(label, paced=True)
+            result = poll()
+            if result is not None:
+                return result
+            frames = frames_until_input() if frames_until_input is not None else None
+            if frames:
+                for t in self.win.hold_frames(frames):
+                    self._record(label, t)
+
+    def flip(self, label, paced=False, wait_after=False):
+        return self._record(label, self.win.flip(), checked=paced, deadline=paced and not wait_after)
+
+    def _record(self, label, t, checked=True, deadline=True):
+        new_screen = label != self._last_label
+        if checked and self._paced_flip is not None:
+            missed = (t - self._paced_flip) / self.frame_duration
+            if missed > LATE_FLIP_THRESHOLD:
+                self.current["dropped_frames"] += int(round(missed)) - 1
+        self._paced_flip = t if deadline else None
+        self._last_label = label
+        self.flips.append((self.block, self.global_trial, label, t))
+        # Onsets are taken from the first flip of each screen
+        if new_screen:
+            if label == "fixation":
+                self.current["trial_onset"] = t
+            elif label == "stimulus":
+                self.current["stim_onset"] = t
+            elif label == "stimulus_off":
+                self.current["stim_offset"] = t
+        return t
+
+    def end_trial(self, intended_stim_duration):
+        """Timing columns of the trial that just ended; times are relative to the fixation onset."""
+        c = self.current
+        c["stim_build_time"], self.stim_build_time = self.stim_build_time, None
+        onset, offset, trial_onset = c["stim_onset"], c["stim_offset"], c["trial_onset"]
+        row = {
+            "stim_onset": "NA", "stim_offset": "NA", "stim_duration": "NA", "stim_frames": "NA",
+            "stim_build_time": "NA" if c["stim_build_time"] is None else c["stim_build_time"],
+            "dropped_frames": c["dropped_frames"],
+        }
+        if onset is not None and offset is not None:
+            row["stim_onset"] = onset - trial_onset if trial_onset is not None else "NA"
+            row["stim_offset"] = offset - trial_onset if trial_onset is not None else "NA"
+            row["stim_duration"] = offset - onset
+            row["stim_frames"] = int(round((offset - onset) / self.frame_duration))
+        self.trials.append({
+            "block": self.block,
+            "global_trial": self.global_trial,
+            "stim_frames": row["stim_frames"],
+            "intended_frames": int(round(intended_stim_duration / self.frame_duration)),
+            "stim_build_time": c["stim_build_time"],
+            "dropped_frames": c["dropped_frames"],
+        })
+        self.start_trial(-1)
+        return row
+
+    def save(self, path):
+        np.save(path, np.array(self.flips, dtype=flip_dtype))
+
+    def summary(self):
+        """Lines of the end-of-session report."""
+        lines = [f"Frame timing: {self.frame_rate:.1f} Hz ({self.frame_duration * 1000:.2f} ms per frame), "
+                 f"{len(self.trials)} trials, {len(self.flips)} flips"]
+        wrong_duration = [t for t in self.trials
+                          if t["stim_frames"] != "NA" and t["stim_frames"] != t["intended_frames"]]
+        overruns = [t for t in self.trials
+                    if t["stim_build_time"] is not None and t["stim_build_time"] > self.frame_duration]
+        dropped = [t for t in self.trials if t["dropped_frames"]]
+        lines.append(f"  stimulus duration off target: {len(wrong_duration)} trials")
+        self._listed(lines, wrong_duration,
+                     lambda t: f"{t['block']} trial {t['global_trial']}: "
+                               f"{t['stim_frames']} frames instead of {t['intended_frames']}")
+        lines.append(f"  stimulus construction over the frame budget: {len(overruns)} trials")
+        self._listed(lines, overruns,
+                     lambda t: f"{t['block']} trial {t['global_trial']}: generate_gabor_patches took "
+                               f"{t['stim_build_time'] * 1000:.1f} ms")
+        lines.append(f"  trials with dropped frames: {len(dropped)} "
+                     f"({sum(t['dropped_frames'] for t in dropped)} frames)")
+        self._listed(lines, dropped, lambda t: f"{t['block']} trial {t['global_trial']}: {t['dropped_frames']} frames")
+        return lines
+
+    @staticmethod
+    def _listed(lines, trials, describe, limit=10):
+        for t in trials[:limit]:
+            lines.append("    " + describe(t))
+        if len(trials) > limit:
+            lines.append(f"    ... and {len(trials) - limit} more")
+
+    def report(self, path=None):
+        lines = self.summary()
+        print("\n".join(lines))
+        if path is not None:
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
@@ -4,5 +4,8 @@ class constant:
     DIAGONAL_TO_CENTER_ARC = DIAGONAL_TO_CENTER*2
     DISTANCE_MIN_BETW_GABORS = 30
     GABOR_SIZE = 30
+    GABOR_SF = 0.15
+    GABOR_CONTRAST = 3
+    RENDER_MODE = "grating"  # "grating": one GratingStim per patch, "array": one ElementArrayStim for all patches
     NUMBER_TRIALS = 10
     NUMBER_BLOCKS = 2
@@ -1,71 +1,142 @@
-from psychopy import visual, core, event, gui, prefs
-import psychopy
+from psychopy import visual
 import numpy as np
 from gabor_patches import utils
-import copy
+import weakref
+import functools
 from gabor_patches.constant import constant as ct
-import random as rd
 # Create the gabor patches
 # Generate the 15 Gabor patches with different orientations
 
 
-def arc_vertices(radius, start, end, edges=190):
-    """Generates vertices for an arc."""
-    theta = np.linspace(start, end, edges)
+@functools.lru_cache(maxsize=None)
+def unit_arc(radius, span, edges=190):
+    """Arc going from 0 to span degrees (clockwise from vertical), computed once per
+    (radius, span, edges) and kept as a read-only float32 array."""
+    theta = np.linspace(0, span, edges)
     theta = np.deg2rad(-theta + 90)
-    return np.column_stack([radius*np.cos(theta), radius*np.sin(theta)]).tolist()
+    arc = np.column_stack([radius*np.cos(theta), radius*np.sin(theta)]).astype(np.float32)
+    arc.setflags(write=False)
+    return arc
 
-def generate_gabor_patches(win, reference, direction, distance_to_bound):
-    """ Generates Gabor patches for the experiment.
-    Reference determines the angle of the reference that the mean oirentation has to be compared to
-    If direction is 1 then the orientation is at right (blue), if -1 then left
-    """
+def arc_vertices(radius, start, end, edges=190):
+    """Generates vertices for an arc by rotating the cached unit arc clockwise by start degrees."""
+    angle = np.deg2rad(start)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)],
+                         [np.sin(angle), np.cos(angle)]], dtype=np.float32)
+    return unit_arc(radius, end - start, edges) @ rotation
 
-    # Arc of answer
-    arc_left = visual.ShapeStim(
+def make_arc(win, color):
+    return visual.ShapeStim(
         win,
         closeShape=False,          # <- keeps it as a line (no closing/radials)
-        lineColor='orange',
+        lineColor=color,
         lineWidth=4,
         fillColor=None,
     )
-    arc_left_sym = copy.copy(arc_left)
 
-    arc_right = visual.ShapeStim(
-        win,
-        closeShape=False,          # <- keeps it as a line (no closing/radials)
-        lineColor='blue',
-        lineWidth=4,
-        fillColor=None,
-    )
-    arc_right_sym = copy.copy(arc_right)
+class StimulusPool:
+    """Gabor patches and answer arcs kept alive for one window.
+    Building a GratingStim allocates its textures and mask, so the stimuli are created once
+    and each trial only updates their ori, pos and vertices.
+    """
+    def __init__(self, win):
+        self.win = win
+        self.gabors = []
+        self.gabor_array = None
+        # Left (orange) and right (blue) arcs, each with its symmetric counterpart
+        self.arcs = [make_arc(win, 'orange'), make_arc(win, 'orange'),
+                     make_arc(win, 'blue'), make_arc(win, 'blue')]
+
+    def get_gabors(self, num_patches):
+        while len(self.gabors) < num_patches:
+            self.gabors.append(visual.GratingStim(self.win, sf=ct.GABOR_SF,
+                                                           contrast = ct.GABOR_CONTRAST,
+                                                           size=(ct.GABOR_SIZE, ct.GABOR_SIZE),
+                                                           color='white', mask='gauss'))
+        return self.gabors[:num_patches]
+
+    def get_gabor_array(self, num_patches):
+        # An ElementArrayStim has a fixed number of elements, so it is only rebuilt when that changes
+        if self.gabor_array is None or self.gabor_array.nElements != num_patches:
+            self.gabor_array = visual.ElementArrayStim(self.win, nElements=num_patches,
+                                                       elementTex='sin', elementMask='gauss',
+                                                       xys=np.zeros((num_patches, 2)),
+                                                       sizes=ct.GABOR_SIZE, sfs=ct.GABOR_SF,
+                                                       contrs=ct.GABOR_CONTRAST)
+        return self.gabor_array
+
+_pools = weakref.WeakKeyDictionary()
+
+def get_stimulus_pool(win):
+    """Returns the pool of the window, creating it on first use."""
+    pool = _pools.get(win)
+    if pool is None:
+        pool = StimulusPool(win)
+        _pools[win] = pool
+    return pool
+
+def generate_gabor_array(win, orientations, positions, sizes=ct.GABOR_SIZE, sfs=ct.GABOR_SF,
+                         contrs=ct.GABOR_CONTRAST):
+    """Puts all the patches in one ElementArrayStim, drawn with a single call.
+    Every parameter is either a scalar or a NumPy vector with one value per patch,
+    e.g. the output of utils.generate_orientation_patches and utils.generate_position_patches
+    """
+    orientations = np.asarray(orientations, dtype=float)
+    gabor_array = get_stimulus_pool(win).get_gabor_array(len(orientations))
+    gabor_array.xys = np.asarray(positions, dtype=float)
+    gabor_array.oris = orientations
+    gabor_array.sizes = sizes
+    gabor_array.sfs = sfs
+    gabor_array.contrs = contrs
+    return gabor_array
+
+def generate_gabor_patches(win, reference, direction, distance_to_bound, orientations=None, positions=None,
+                           mode=None):
+    """ Generates Gabor patches for the experiment.
+    Reference determines the angle of the reference that the mean oirentation has to be compared to
+    If direction is 1 then the orientation is at right (blue), if -1 then left
+    Orientations and positions can be given when they were drawn beforehand (see trial_plan)
+    With mode "array" (default: ct.RENDER_MODE) the patches come back as a single ElementArrayStim
+    """
+    if mode is None:
+        mode = ct.RENDER_MODE
+
+    pool = get_stimulus_pool(win)
+
+    # Arc of answer
+    arc_left, arc_left_sym, arc_right, arc_right_sym = pool.arcs
 
-        
     # Defines the angles that will be displayed to answer
-    arc_left.vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference-45, end=reference)
-    arc_left_sym.vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference-45+180, end=reference+180)
-    
-    arc_right.vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference, end=reference+45)
-    arc_right_sym.vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference+180, end=reference+45+180)
+    # All four arcs share the same cached 45 degree arc; the symmetric ones are a half turn away
+    left_vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference-45, end=reference)
+    right_vertices = arc_vertices(radius=ct.DIAGONAL_TO_CENTER_ARC, start=reference, end=reference+45)
+    arc_left.vertices = left_vertices
+    arc_left_sym.vertices = -left_vertices
+
+    arc_right.vertices = right_vertices
+    arc_right_sym.vertices = -right_vertices
     # Store things to show in a list
     to_show_arc = [arc_left, arc_left_sym, arc_right, arc_right_sym]
     
-    orientations = utils.generate_orientation_patches(ct.NUM_PATCHES, reference+distance_to_bound*direction, sd=5)
-    positions = utils.generate_position_patches(ct.NUM_PATCHES, ct.DIAGONAL_TO_CENTER, ct.DISTANCE_MIN_BETW_GABORS)
+    if orientations is None:
+        orientations = utils.generate_orientation_patches(ct.NUM_PATCHES, reference+distance_to_bound*direction, sd=5)
+    if positions is None:
+        positions = utils.generate_position_patches(ct.NUM_PATCHES, ct.DIAGONAL_TO_CENTER, ct.DISTANCE_MIN_BETW_GABORS)
     
     # Also for the gabor patches
-    to_show_gabor = []
-    for i in range(ct.NUM_PATCHES):
-        stim = psychopy.visual.GratingStim(win, ori=orientations[i], sf=0.15, 
-                                        contrast = 3,
-                                        size=(ct.GABOR_SIZE, ct.GABOR_SIZE),
-                                        pos=positions[i],
-                                        color='white', mask='gauss')
-        to_show_gabor.append(stim)
+    if mode == "array":
+        return [generate_gabor_array(win, orientations, positions)], to_show_arc
+
+    to_show_gabor = pool.get_gabors(len(orientations))
+    for stim, ori, pos in zip(to_show_gabor, orientations, positions):
+        stim.ori = ori
+        stim.pos = pos
 
     return to_show_gabor, to_show_arc
 
 if __name__ == "__main__":
+    from psychopy import core, event
+    import random as rd
     win = visual.Window([800, 600], units='pix', fullscr=False, color = "gray")
     rt_clock = core.Clock()
     key_list = ["d", "f"]
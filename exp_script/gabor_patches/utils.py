@@ -1,31 +1,92 @@
 import numpy as np
 
-def generate_orientation_patches(num_patches, mean_orientation, sd):
-    orientation_patches = np.random.normal(loc=mean_orientation, scale=sd, size=num_patches)
+# Densest packing of equal circles in the plane (hexagonal), used as an upper
+# bound to reject position requests that can never be satisfied
+MAX_PACKING_DENSITY = np.pi / (2 * np.sqrt(3))
+
+def generate_orientation_patches(num_patches, mean_orientation, sd, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    orientation_patches = rng.normal(loc=mean_orientation, scale=sd, size=num_patches)
     return orientation_patches
 
-def generate_position_patches(num_patches, radius, distance_min):
-    # Generate random positions for the patches within specified ranges
-    # BUT it must ensure that the patches do not overlap
-    # Furthermore, it should ensure that the generation of positions is not
-    # in a square grid, but a circle. 
-    rng = np.random.default_rng(124)
-    positions = []
-    for _ in range(num_patches):
-        while True:
-            x = rng.uniform(-radius, radius)
-            y = rng.uniform(-radius, radius)
-            
-            # Distance from the center should be less than the radius from 0
-            distance_from_center = np.sqrt((x - 0)**2 +(y - 0)**2)
-            if distance_from_center > radius:
+def sample_disc(rng, n, radius):
+    """Draws n points uniformly inside a disc of the given radius."""
+    r = radius * np.sqrt(rng.random(n))
+    theta = rng.uniform(0, 2 * np.pi, n)
+    return np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+
+def generate_position_patches(num_patches, radius, distance_min, rng=None, max_batches=1000):
+    """Generates non-overlapping patch positions inside a disc.
+
+    Candidates are drawn in vectorized batches and checked against the accepted
+    positions through a spatial grid whose cells are small enough to hold at
+    most one patch, so each check only looks at the 5x5 neighbouring cells.
+    Raises ValueError when the packing is geometrically impossible and
+    RuntimeError when no layout is found within max_batches batches.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if num_patches <= 0:
+        return np.empty((0, 2))
+    if distance_min <= 0:
+        return sample_disc(rng, num_patches, radius)
+
+    # Every patch owns a disc of diameter distance_min that must fit inside
+    # the (slightly enlarged) stimulus disc
+    needed = num_patches * (distance_min / 2) ** 2
+    available = MAX_PACKING_DENSITY * (radius + distance_min / 2) ** 2
+    if needed > available:
+        raise ValueError(
+            f"Cannot place {num_patches} patches {distance_min} apart inside a "
+            f"disc of radius {radius}: reduce the number of patches or the minimal distance"
+        )
+
+    # Grid over [-radius, radius], padded by 2 cells so the neighbourhood
+    # lookup never leaves the array
+    cell = distance_min / np.sqrt(2)
+    n_cells = int(np.ceil(2 * radius / cell)) + 1
+    grid = np.full((n_cells + 4, n_cells + 4), -1, dtype=np.intp)
+    offsets = np.arange(-2, 3)
+    di, dj = [o.ravel() for o in np.meshgrid(offsets, offsets, indexing="ij")]
+    distance_min_sq = distance_min ** 2
+    neighbourhood = list(zip(di.tolist(), dj.tolist()))
+    accepted = {}  # (i, j) cell -> position, the same layout as grid for the loop below
+    far = (np.inf, np.inf)
+
+    positions = np.empty((num_patches, 2))
+    n_accepted = 0
+    for _ in range(max_batches):
+        remaining = num_patches - n_accepted
+        candidates = sample_disc(rng, max(64, 4 * remaining), radius)
+        cells = ((candidates + radius) // cell).astype(np.intp) + 2
+
+        # Vectorized rejection against everything accepted in earlier batches
+        if n_accepted:
+            neighbours = grid[cells[:, 0, None] + di, cells[:, 1, None] + dj]
+            occupied = neighbours >= 0
+            diff = positions[np.where(occupied, neighbours, 0)] - candidates[:, None, :]
+            too_close = occupied & (np.einsum("ijk,ijk->ij", diff, diff) < distance_min_sq)
+            keep = ~too_close.any(axis=1)
+            candidates, cells = candidates[keep], cells[keep]
+
+        # Survivors may still collide with each other, so insert them one by one. Only a few
+        # neighbours are checked per candidate, so plain floats beat small NumPy arrays here
+        for (x, y), (i, j) in zip(candidates.tolist(), cells.tolist()):
+            if any((x - px) ** 2 + (y - py) ** 2 < distance_min_sq
+                   for px, py in (accepted.get((i + a, j + b), far) for a, b in neighbourhood)):
                 continue
-            # And the position should not overlap with existing positions
-            position = (x, y)
-            if not any(np.linalg.norm(np.array(position) - np.array(p)) < distance_min for p in positions):
-                positions.append(position)
-                break
-    return positions
+            grid[i, j] = n_accepted
+            accepted[i, j] = (x, y)
+            positions[n_accepted] = (x, y)
+            n_accepted += 1
+            if n_accepted == num_patches:
+                return positions
+
+    raise RuntimeError(
+        f"Could only place {n_accepted} of {num_patches} patches {distance_min} apart "
+        f"inside a disc of radius {radius} after {max_batches} batches"
+    )
 
 if __name__ == "__main__":
     # Example usage
@@ -35,5 +96,5 @@ if __name__ == "__main__":
     orientations = generate_orientation_patches(num_patches, mean_orientation, sd)
     print("Generated Orientations:", orientations)
 
-    positions = generate_position_patches(num_patches, radius=200)
-    print("Generated Positions:", positions)
\ No newline at end of file
+    positions = generate_position_patches(num_patches, radius=200, distance_min=30)
+    print("Generated Positions:", positions)
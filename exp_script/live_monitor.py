@@ -0,0 +1,155 @@
+"""Live view of a running session, in a separate process.
+
+With LIVE_MONITOR = True in main.py, the experiment publishes every finished trial as a small
+JSON datagram on DEFAULT_ADDRESS (TrialPublisher); otherwise nothing is encoded or sent. Sending never blocks and nothing waits for an answer, so the trial loop
+pays the same few microseconds whether or not a monitor is listening. The monitor
+(python live_monitor.py, in a second terminal) receives them and shows the running
+accuracy, the stim_strength staircase, the response time distribution and dropped frames.
+A resumed session (same participant) adds to the trials already shown.
+
+Usage (from exp_script):
+    python live_monitor.py [--port 47901]
+"""
+import argparse
+import json
+import socket
+import time
+import numpy as np
+
+DEFAULT_ADDRESS = ("127.0.0.1", 47901)
+MAX_DATAGRAM = 65507
+
+def _to_json(value):
+    # NumPy scalars and arrays become numbers and lists, anything else its text
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+class TrialPublisher:
+    """Fire-and-forget publisher of trial results."""
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = tuple(address)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def publish(self, kind, data=None):
+        message = json.dumps({"kind": kind, "time": time.time(), "data": data or {}}, default=_to_json)
+        try:
+            self.socket.sendto(message.encode("utf-8"), self.address)
+        except OSError:  # no monitor (or a full buffer): the message is dropped
+            pass
+
+    def close(self):
+        self.socket.close()
+
+class MonitorState:
+    """Running statistics of the session, updated from the published messages."""
+    def __init__(self, window=20):
+        self.window = window
+        self.reset()
+
+    def reset(self, session=None):
+        self.session = session or {}
+        self.trials = []
+        self.finished = False
+
+    def handle(self, message):
+        kind, data = message["kind"], message["data"]
+        if kind == "session_start":
+            if data.get("participant_id") != self.session.get("participant_id"):
+                self.reset(data)
+            else:  # the same participant's session resumed: keep its trials
+                self.session, self.finished = data, False
+        elif kind == "trial":
+            self.trials.append(data)
+        elif kind == "session_end":
+            self.finished = True
+
+    def _values(self, trials, key):
+        """Numeric values of a column ("NA" and missing values left out)."""
+        return np.array([t[key] for t in trials if isinstance(t.get(key), (int, float))], dtype=float)
+
+    def accuracy(self, block_type=None, last=None):
+        trials = [t for t in self.trials if block_type is None or t.get("block_type") == block_type]
+        if last:
+            trials = trials[-last:]
+        correct = [bool(t["correct"]) for t in trials if t.get("correct") is not None]
+        return (np.mean(correct), len(correct)) if correct else (np.nan, 0)
+
+    def stim_strength(self):
+        return self._values([t for t in self.trials if t.get("block") == t.get("block_type")], "stim_strength")
+
+    def response_times(self):
+        return self._values(self.trials, "response_time")
+
+    def dropped_frames(self):
+        return int(sum(t.get("dropped_frames") or 0 for t in self.trials))
+
+def sparkline(values, width=60):
+    """Values as one line of block characters, scaled to their own range."""
+    if len(values) == 0:
+        return ""
+    values = np.asarray(values[-width:], dtype=float)
+    blocks = " ▁▂▃▄▅▆▇█"
+    low, high = values.min(), values.max()
+    scaled = np.zeros(len(values), dtype=int) if high == low else \
+        np.round((values - low) / (high - low) * (len(blocks) - 1)).astype(int)
+    return "".join(blocks[i] for i in scaled)
+
+def histogram(values, bins=10, width=40):
+    """Lines of a horizontal histogram."""
+    if len(values) == 0:
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    scale = width / max(counts.max(), 1)
+    return [f"  {low:5.2f}-{high:5.2f} s {'#' * int(round(count * scale))} {count}"
+            for low, high, count in zip(edges[:-1], edges[1:], counts)]
+
+def render(state):
+    lines = []
+    session = state.session
+    lines.append(f"Participant {session.get('participant_id', '?')} (group {session.get('group_id', '?')})"
+                 f"{' - session finished' if state.finished else ''}")
+    last = state.trials[-1] if state.trials else {}
+    lines.append(f"Trials: {len(state.trials)}, last: {last.get('block', '-')} block {last.get('block_number', '-')} "
+                 f"trial {last.get('trial', '-')}")
+    for block_type in [None, "with_mental_replay", "without_mental_replay"]:
+        overall, n = state.accuracy(block_type)
+        recent, n_recent = state.accuracy(block_type, last=state.window)
+        lines.append(f"Accuracy {block_type or 'all':<22} {overall:6.1%} ({n} trials), "
+                     f"last {n_recent}: {recent:6.1%}")
+    strength = state.stim_strength()
+    if len(strength):
+        lines.append(f"stim_strength {strength[-1]:.2f} (min {strength.min():.2f}, max {strength.max():.2f})")
+        lines.append("  " + sparkline(strength))
+    response_times = state.response_times()
+    if len(response_times):
+        lines.append(f"Response times: median {np.median(response_times):.3f} s")
+        lines.extend(histogram(response_times))
+    lines.append(f"Dropped frames: {state.dropped_frames()}")
+    return "\n".join(lines)
+
+def run_monitor(address=DEFAULT_ADDRESS, refresh=0.5):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(tuple(address))
+    receiver.settimeout(refresh)
+    state = MonitorState()
+    print(f"Listening on {address[0]}:{address[1]}")
+    last_draw = 0.0
+    while True:
+        try:
+            payload, _ = receiver.recvfrom(MAX_DATAGRAM)
+            state.handle(json.loads(payload.decode("utf-8")))
+        except socket.timeout:
+            pass
+        if time.monotonic() - last_draw >= refresh:
+            print("\033[2J\033[H" + render(state), flush=True)  # clear the terminal and redraw
+            last_draw = time.monotonic()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live view of a running session")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    args = parser.parse_args()
+    try:
+        run_monitor((args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -1,23 +1,13 @@
-from psychopy import visual, core, event, gui, prefs
-import random
+"""Mental replay experiment.
+
+Run it with `python main.py`. Importing this module has no side effects: it only defines the
+settings below and the Session and Experiment classes, so tools can read the configuration
+without PsychoPy. PsychoPy and the helper modules are imported, and the window opened, when
+an Experiment is run.
+"""
+import functools
 import os
 from datetime import datetime
-import utils
-import gabor_patches.generate_gaborPatches as gabor
-import numpy as np
-import csv
-
-# Window settings
-prefs.general['windowType'] = 'pyglet'
-win = visual.Window(
-    size=[1920, 1200],
-    color='gray',
-    units='pix',
-    fullscr=False,
-    screen=0,
-    pos=[0, 0]
-)
-key_list = ["v", "b"]
 
 # Experiment parameters
 N_TRAINING_TRIALS = 20  # number of training trials
@@ -28,6 +18,19 @@ INTERTRIAL_PAUSE = 2  # fixation cross display time
 MENTAL_REPLAY_PAUSE = 1  # pause during mental replay instruction
 FEEDBACK_TIME = 0.5
 FIXATION_CROSS_DURATION = 0.5
+RATING_CONFIRM_DURATION = 0.2  # selected square stays highlighted before moving on
+
+# Staircase on stim_strength: "weighted_up_down", "quest" or "psi", with the parameters of each method
+STAIRCASE_METHOD = "weighted_up_down"
+STAIRCASE_PARAMS = {
+    "weighted_up_down": {"start": 20, "step_up": 1.0, "step_down": 0.5},  # up after incorrect, down after correct
+    "quest": {"start": 20, "target_p": 0.75, "slope": 2.0},
+    "psi": {"start": 20},
+}
+INTERLEAVED_STAIRCASES = False  # True: replay and no-replay blocks each get their own staircase
+
+# True: every finished trial is sent to the live monitor (python live_monitor.py, see its DEFAULT_ADDRESS)
+LIVE_MONITOR = False
 
 # Set relative paths
 phase = 0
@@ -35,8 +38,13 @@ folder = {0: "code", 1: "pilot", 2: "experimental"}
 save_directory = f"./data/{folder[phase]}/"
 image_dir = "./images"
 
-# Make sure the data folder exists
-os.makedirs(save_directory, exist_ok=True)
+# Settings an Experiment can override, e.g. Experiment(NUMBER_OF_TRIALS=10)
+SETTINGS = [
+    "N_TRAINING_TRIALS", "TOTAL_BLOCKS", "NUMBER_OF_TRIALS", "STIMULUS_DURATION", "INTERTRIAL_PAUSE",
+    "MENTAL_REPLAY_PAUSE", "FEEDBACK_TIME", "FIXATION_CROSS_DURATION", "RATING_CONFIRM_DURATION",
+    "STAIRCASE_METHOD", "STAIRCASE_PARAMS", "INTERLEAVED_STAIRCASES", "LIVE_MONITOR",
+    "save_directory",
+]
 
 # Instruction image setup
 image_intro = [os.path.join(image_dir, f) for f in ["Intro1.JPG"]]
@@ -53,113 +61,7 @@ image_replay = [os.path.join(image_dir, "MentalReplayImg.png")]
 
 min_display_time = 2  # seconds before intructions can be skipped
 
-# Escape function
-def check_for_escape():
-    if event.getKeys(keyList=['escape']):
-        win.close()
-        core.quit()
-
-# TRIAL PHASE
-if TOTAL_BLOCKS % 2 != 0:
-    print("TOTAL_BLOCKS must be an even number.")
-    core.quit()
-
-# Step 1: Get Participant ID
-id_dialog = gui.Dlg(title="Enter Participant ID")
-id_dialog.addField("Participant ID:")
-id_dialog.show()
-if not id_dialog.OK:
-    core.quit()
-participant_id = str(id_dialog.data[0]).strip()
-
-while not participant_id:
-    print("Participant ID cannot be empty.")
-    participant_id = str(gui.Dlg(title="Enter Participant ID").addField("Participant ID:").show()[0]).strip()
-    if not participant_id:
-        core.quit()
-participant_id_clean = participant_id.replace(":", "_").replace("/", "_").replace("\\", "_").strip()
-random_seed = sum(ord(c) for c in participant_id_clean) # generate random seed
-random.seed(random_seed)
-
-# Collect reaction time
-rt_clock = core.Clock()
-
-# Sorting participants into 8 conditions
-# handle numeric and non-numeric participant ids robustly
-try:
-    participant_id_num = int(participant_id_clean)  # participant ID must be numeric for direct numeric mapping
-    group_id = participant_id_num % 8  # assign participant to 1 of 8 groups (0–7)
-except ValueError:
-    # fallback: use sum of ordinals (consistent with the seed)
-    group_id = sum(ord(c) for c in participant_id_clean) % 8
-
-# Factor 1: starting condition
-start_with_replay = (group_id % 2 == 0)  # even groups: replay first, odd groups: non-replay first
-
-# Factor 2: scale order
-vividness_first = (group_id // 2) % 2 == 0  # groups 0–1,4–5 vividness first; groups 2–3,6–7 confidence first
-
-# Factor 3: hand assignment
-left_for_confidence = (group_id // 4) % 2 == 0  # groups 0–3: left hand = confidence; groups 4–7: left hand = vividness
-
-# Define half_blocks before use
-half_blocks = TOTAL_BLOCKS // 2
-
-# Build block order with first block fixed, rest randomized
-all_blocks = (["with_mental_replay"] * half_blocks +
-              ["without_mental_replay"] * half_blocks)
-
-if start_with_replay:
-    first_block = "with_mental_replay"
-else:
-    first_block = "without_mental_replay"
-
-remaining_blocks = [b for b in all_blocks if b != first_block] + [first_block] * (half_blocks - 1)
-random.shuffle(remaining_blocks)
-
-block_order = [first_block] + remaining_blocks
-test_directions = []
-
-print(f"Assigned to group {group_id}: "
-      f"{'Replay first' if start_with_replay else 'Non-replay first'}, "
-      f"{'Vividness first' if vividness_first else 'Confidence first'}, "
-      f"{'Left=confidence' if left_for_confidence else 'Left=vividness'}")
-
-# Save trial data to CSV
-def save_trial_data(data_file, header, row_dict):
-    safe_row = {key: str(row_dict.get(key, "NA")) for key in header}
-    write_header = not os.path.exists(data_file)
-    with open(data_file, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        if write_header:
-            writer.writeheader()
-        writer.writerow(safe_row)
-        
-# Collect demographic info
-participant_dialog = gui.Dlg(title="Participant Info")
-participant_dialog.addField("Gender", choices=["Male", "Female", "Other"])
-participant_dialog.addField("Age")
-participant_dialog.addField("Handedness", choices=["Left", "Right", "Ambidextrous"])
-participant_dialog.show()
-if not participant_dialog.OK:
-    core.quit()
-gender = participant_dialog.data[0]
-age_raw = participant_dialog.data[1]
-handedness = participant_dialog.data[2]
-age = int(age_raw) if age_raw.isdigit() else "NA"
-
-
-# Set up output file
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-data_file = os.path.join(save_directory, f"{participant_id_clean}_{timestamp}_experiment_data.csv")
-
-# Fixation cross
-fixation_cross = visual.TextStim(win, text="+", color='white', height=30)
-dot_instruction = visual.TextStim(
-    win, text="Which direction are most of the dots moving?\nPress V or B.",
-    color='white', height=20, pos=(0, -250), wrapWidth=700
-)
-replay_text = visual.TextStim(win, text="Mentally replay the motion you just saw.", color='white', height=20)
+key_list = ["v", "b"]
 
 # Response key mappings
 left_vividness_keys = {'a': 1, 'z': 2, 'e': 3, 'r': 4} # counterbalancing: the keys switch -- half the time vividness is on the left hand
@@ -168,408 +70,757 @@ left_confidence_keys = {'a': 1, 'z': 2, 'e': 3, 'r': 4}
 right_confidence_keys = {'u': 1, 'i': 2, 'o': 3, 'p': 4}
 response_keys = ['v', 'b', 'escape']
 
-# Create visual scales for both conditions
-def draw_visual_scale(win, selected, labels, y_offset=-100):
-    spacing = 150
-    start_x = -((len(labels) - 1) * spacing) / 2
-    rect_size = 50
-
-    for i, label in enumerate(labels):
-        x = start_x + i * spacing
-        # Draw square
-        color = 'blue' if selected == (i + 1) else None
-        square = visual.Rect(win, width=rect_size, height=rect_size,
-                             lineColor='white', fillColor=color, pos=(x, y_offset))
-        square.draw()
-
-        # Draw label below the square
-        text = visual.TextStim(win, text=label, pos=(x, y_offset - 40),
-                               height=16, color='white', wrapWidth=200)
-        text.draw()
+# Labels of the visual scales for both conditions
+vividness_labels = ["Not vivid", "Slightly", "Moderately", "Very vivid"]
+confidence_labels = ["Not confident", "Slightly", "Moderately", "Very confident"]
 
 # CSV header
 header = [
     "participant_id", "gender", "age", "handedness",
     "block", "block_type", "block_number", "trial", "global_trial",
     "response", "reference", "vividness", "confidence", "response_time",
-    "gabor_direction", "correct", "stim_strength", "vividness_on_left"
+    "gabor_direction", "correct", "stim_strength", "vividness_on_left",
+    "vividness_rt", "confidence_rt",
+    "stim_onset", "stim_offset", "stim_duration", "stim_frames", "stim_build_time", "dropped_frames"
 ]
 
-# Main trial procedure
-def run_trial(block_type, block_number, trial_num, global_trial, gabor_direction, stim_strength,
-              give_feedback=False, saved_block_label=None):
-    if saved_block_label is None:
-        saved_block_label = block_type
-    response = None
-
-    # Set rating key mappings
-    if block_type == "with_mental_replay":
-        vividness_on_left = not left_for_confidence
-        if left_for_confidence:
-            confidence_keys = left_confidence_keys
-            vividness_keys = right_vividness_keys
-            confidence_prompt_text = "How confident are you?\n\nUse A/Z/E/R (left hand)"
-            vividness_prompt_text = "How vivid was your mental replay?\n\nUse U/I/O/P (right hand)"
+def preload_images():
+    # Decode every instruction image in the background while the dialogs are open
+    import assets
+    assets.image_cache.preload(image_intro + image_training1 + image_training2 + image_training3 +
+                               image_training_end + image_task1 + image_task2 + image_end + image_replay,
+                               background=True)
+
+def clean_participant_id(participant_id):
+    return participant_id.replace(":", "_").replace("/", "_").replace("\\", "_").strip()
+
+# Sorting participants into 8 conditions
+def assign_group(participant_id_clean):
+    # handle numeric and non-numeric participant ids robustly
+    try:
+        participant_id_num = int(participant_id_clean)  # participant ID must be numeric for direct numeric mapping
+        return participant_id_num % 8  # assign participant to 1 of 8 groups (0–7)
+    except ValueError:
+        # fallback: use sum of ordinals
+        return sum(ord(c) for c in participant_id_clean) % 8
+
+def ask_participant():
+    """Participant ID and demographics from the dialogs, or None if they were cancelled."""
+    from psychopy import gui
+    import session_store
+
+    # Step 1: Get Participant ID
+    id_dialog = gui.Dlg(title="Enter Participant ID")
+    id_dialog.addField("Participant ID:")
+    id_dialog.show()
+    if not id_dialog.OK:
+        return None
+    participant_id = str(id_dialog.data[0]).strip()
+
+    while not participant_id or len(participant_id) > session_store.MAX_PARTICIPANT_ID_LENGTH:
+        if participant_id:
+            print(f"Participant ID cannot be longer than {session_store.MAX_PARTICIPANT_ID_LENGTH} characters.")
         else:
-            confidence_keys = right_confidence_keys
-            vividness_keys = left_vividness_keys
-            confidence_prompt_text = "How confident are you?\n\nUse U/I/O/P (right hand)"
-            vividness_prompt_text = "How vivid was your mental replay?\n\nUse A/Z/E/R (left hand)"
-    else:  # without mental replay
-        vividness_on_left = None
-        confidence_keys = right_confidence_keys
-        confidence_prompt_text = (
-            "How confident are you in your response?\n\n"
-            "U = Not confident   I = Slightly   O = Moderately   P = Very confident"
+            print("Participant ID cannot be empty.")
+        participant_id = str(gui.Dlg(title="Enter Participant ID").addField("Participant ID:").show()[0]).strip()
+        if not participant_id:
+            return None
+
+    # Collect demographic info
+    participant_dialog = gui.Dlg(title="Participant Info")
+    participant_dialog.addField("Gender", choices=["Male", "Female", "Other"])
+    participant_dialog.addField("Age")
+    participant_dialog.addField("Handedness", choices=["Left", "Right", "Ambidextrous"])
+    participant_dialog.show()
+    if not participant_dialog.OK:
+        return None
+    gender = participant_dialog.data[0]
+    age_raw = participant_dialog.data[1]
+    handedness = participant_dialog.data[2]
+    return participant_id, gender, age_raw, handedness
+
+def ask_resume(checkpoint_path):
+    """Whether to resume the interrupted session saved in checkpoint_path."""
+    from psychopy import gui
+    resume_dialog = gui.Dlg(title="Interrupted session")
+    resume_dialog.addText(f"An unfinished session was found:\n{os.path.basename(checkpoint_path)}")
+    resume_dialog.addField("Continue it?", choices=["Resume", "New session"])
+    resume_dialog.show()
+    return resume_dialog.OK and resume_dialog.data[0] == "Resume"
+
+class Session:
+    """One participant: counterbalancing group, block order, random streams and data files.
+    seed replaces the seed derived from the participant ID (used by the simulations).
+    """
+    def __init__(self, participant_id, gender, age, handedness, total_blocks=TOTAL_BLOCKS,
+                 save_directory=save_directory, seed=None):
+        import random_streams, session_store
+        if len(participant_id) > session_store.MAX_PARTICIPANT_ID_LENGTH:
+            # The typed .npy copy of the session could not hold it
+            raise ValueError(f"Participant ID longer than {session_store.MAX_PARTICIPANT_ID_LENGTH} "
+                             f"characters: {participant_id!r}")
+        self.participant_id = participant_id
+        self.participant_id_clean = clean_participant_id(participant_id)
+        self.gender = gender
+        self.age = int(age) if str(age).isdigit() else "NA"
+        self.handedness = handedness
+        self.seed = random_streams.session_seed(self.participant_id_clean) if seed is None else seed
+        self.rng = random_streams.SessionRNG(self.seed) # one independent stream per source of randomness
+
+        self.group_id = assign_group(self.participant_id_clean)
+
+        # Factor 1: starting condition
+        self.start_with_replay = (self.group_id % 2 == 0)  # even groups: replay first, odd groups: non-replay first
+
+        # Factor 2: scale order
+        self.vividness_first = (self.group_id // 2) % 2 == 0  # groups 0–1,4–5 vividness first; groups 2–3,6–7 confidence first
+
+        # Factor 3: hand assignment
+        self.left_for_confidence = (self.group_id // 4) % 2 == 0  # groups 0–3: left hand = confidence; groups 4–7: left hand = vividness
+
+        # Build block order with first block fixed, rest randomized
+        half_blocks = total_blocks // 2
+        all_blocks = (["with_mental_replay"] * half_blocks +
+                      ["without_mental_replay"] * half_blocks)
+        first_block = "with_mental_replay" if self.start_with_replay else "without_mental_replay"
+        remaining_blocks = [b for b in all_blocks if b != first_block] + [first_block] * (half_blocks - 1)
+        self.rng.blocks.shuffle(remaining_blocks)
+        self.block_order = [first_block] + remaining_blocks
+        self.test_directions = []
+
+        # Set up output file
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.data_file = os.path.join(save_directory, f"{self.participant_id_clean}_{timestamp}_experiment_data.csv")
+        self.session_writer = None
+
+        # Where a resumed session starts again (None for a new session), see from_checkpoint
+        self.resumes = 0
+        self.position = None
+        self.staircase_state = None
+        self.saved_rows = 0
+
+    @classmethod
+    def from_checkpoint(cls, path, total_blocks=TOTAL_BLOCKS):
+        """The interrupted session saved in the checkpoint, continuing its data files."""
+        import checkpoint
+        state = checkpoint.load_checkpoint(path)
+        session = cls(state["participant_id"], state["gender"], state["age"], state["handedness"],
+                      total_blocks=total_blocks, save_directory=os.path.dirname(path),
+                      seed=checkpoint.seed_from_json(state["seed"]))
+        if len(state["block_order"]) != total_blocks:
+            raise ValueError(f"{path} has {len(state['block_order'])} blocks, not {total_blocks}")
+        session.data_file = os.path.join(os.path.dirname(path), os.path.basename(state["data_file"]))
+        session.block_order = state["block_order"]
+        session.test_directions = state["test_directions"]
+        session.rng.set_state(state["rng"])
+        session.resumes = state["resumes"] + 1
+        session.position = state["position"]
+        session.staircase_state = state["staircases"]
+        session.saved_rows = state["rows"]
+        return session
+
+    def describe(self):
+        return (f"Assigned to group {self.group_id}: "
+                f"{'Replay first' if self.start_with_replay else 'Non-replay first'}, "
+                f"{'Vividness first' if self.vividness_first else 'Confidence first'}, "
+                f"{'Left=confidence' if self.left_for_confidence else 'Left=vividness'}")
+
+    def open_data_files(self):
+        """Opens the CSV now so that a locked file is reported before the first trial (PermissionError)."""
+        import checkpoint, session_store, trial_logger
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        if self.resumes:
+            # Rows saved after the checkpoint belong to trials that will run again
+            checkpoint.truncate_csv(self.data_file, self.saved_rows)
+        trial_logger.get_trial_logger(self.data_file, header)
+        self.session_writer = session_store.SessionArrayWriter(session_store.session_path(self.data_file), header,
+                                                               keep_rows=self.saved_rows)
+
+    def data_path(self, suffix):
+        """Path of a file saved next to the CSV, e.g. data_path("_flips.npy")."""
+        return self.data_file.replace(".csv", suffix)
+
+    # Save trial data to CSV (written on a background thread, see trial_logger)
+    # and to the typed .npy copy of the session, which also keeps the patch orientations and positions
+    def save_trial_data(self, row_dict, orientations=None, positions=None):
+        import trial_logger
+        trial_logger.get_trial_logger(self.data_file, header).log(row_dict)
+        self.session_writer.append(row_dict, orientations, positions)
+
+    # Saved after every trial: position is where the session would start again. The checkpoint and
+    # the .npy are written on the CSV writer thread once the rows before them are in the CSV, so the
+    # data files never fall behind the checkpoint (see checkpoint.py)
+    def save_checkpoint(self, position, staircases=None):
+        import checkpoint, trial_logger
+        rows = self.session_writer.n_rows
+        state = {
+            "version": checkpoint.VERSION,
+            "participant_id": self.participant_id,
+            "participant_id_clean": self.participant_id_clean,
+            "gender": self.gender,
+            "age": self.age,
+            "handedness": self.handedness,
+            "seed": checkpoint.seed_to_json(self.seed),
+            "data_file": self.data_file,
+            "resumes": self.resumes,
+            "position": position,
+            "block_order": list(self.block_order),
+            "test_directions": list(self.test_directions),
+            "rng": self.rng.state(),
+            "staircases": staircases.state() if staircases is not None else None,
+            "rows": rows,
+        }
+
+        def write():
+            try:
+                self.session_writer.flush(rows)
+                checkpoint.save_checkpoint(checkpoint.checkpoint_path(self.data_file), state)
+            except OSError as e:
+                print(f"Unable to write checkpoint of {self.data_file}: {e}")
+        trial_logger.get_trial_logger(self.data_file, header).call(write)
+
+    def participant_columns(self):
+        return {
+            "participant_id": self.participant_id,
+            "gender": self.gender,
+            "age": self.age,
+            "handedness": self.handedness,
+        }
+
+    def sync_data_files(self):
+        import trial_logger
+        trial_logger.sync_all()
+        self.session_writer.flush()
+
+    def close_data_files(self):
+        import trial_logger
+        trial_logger.close_all()  # also writes the pending checkpoints
+        if self.session_writer is not None:
+            self.session_writer.close()
+
+class Experiment:
+    """The window, stimuli and phases of the experiment, for one session at a time.
+    Creating an Experiment opens nothing: the window and the objects that need it are
+    built the first time they are used. settings override the module-level ones listed
+    in SETTINGS.
+    """
+    def __init__(self, **settings):
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise TypeError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for name in SETTINGS:
+            setattr(self, name, settings.get(name, globals()[name]))
+        self.session = None
+
+    @functools.cached_property
+    def win(self):
+        from psychopy import visual, prefs
+        # Window settings
+        prefs.general['windowType'] = 'pyglet'
+        return visual.Window(
+            size=[1920, 1200],
+            color='gray',
+            units='pix',
+            fullscr=False,
+            screen=0,
+            pos=[0, 0]
         )
-        vividness_keys = None
-        vividness_prompt_text = None
-
-    # Store prompts in proper order
-    prompts = []
-    if block_type == "with_mental_replay":
-        if vividness_first:
-            prompts = [("vividness", vividness_prompt_text, vividness_keys),
-                       ("confidence", confidence_prompt_text, confidence_keys)]
+
+    @functools.cached_property
+    def collector(self):
+        # Keyboard input: escape and response keys are read together (see responses)
+        import responses
+        return responses.get_collector(self.win, on_escape=self.quit)
+
+    @functools.cached_property
+    def frame_timer(self):
+        # Every flip goes through the frame timer, which measures the refresh rate once here;
+        # the durations are shown as whole numbers of refreshes (see FrameTimer.present)
+        import frame_timing
+        return frame_timing.FrameTimer(self.win, on_frame=self.check_for_escape)
+
+    @functools.cached_property
+    def publisher(self):
+        # Non-blocking: nothing waits for the monitor, which may not be running
+        if not self.LIVE_MONITOR:
+            return None
+        import live_monitor
+        return live_monitor.TrialPublisher()
+
+    def publish(self, kind, data=None):
+        if self.publisher is not None:
+            self.publisher.publish(kind, data)
+
+    @functools.cached_property
+    def fixation_cross(self):
+        from psychopy import visual
+        return visual.TextStim(self.win, text="+", color='white', height=30)
+
+    def check_for_escape(self):
+        self.collector.check_escape()
+
+    # Escape function
+    def quit(self):
+        from psychopy import core
+        self.close()
+        core.quit()
+
+    def new_session(self, participant_id, gender, age, handedness, seed=None):
+        self.session = Session(participant_id, gender, age, handedness, total_blocks=self.TOTAL_BLOCKS,
+                               save_directory=self.save_directory, seed=seed)
+        return self.session
+
+    def resume_session(self, checkpoint_path):
+        self.session = Session.from_checkpoint(checkpoint_path, total_blocks=self.TOTAL_BLOCKS)
+        trials_per_block = self.session.position.get("trials_per_block", self.NUMBER_OF_TRIALS)
+        if trials_per_block != self.NUMBER_OF_TRIALS:
+            raise ValueError(f"{checkpoint_path} has {trials_per_block} trials per block, "
+                             f"not {self.NUMBER_OF_TRIALS}")
+        return self.session
+
+    def prepare_screen(self):
+        """Builds everything drawn during the trials before the first one."""
+        import assets, utils
+        import gabor_patches.generate_gaborPatches as gabor
+        # Upload the instruction images to the window before the session starts
+        assets.image_cache.upload(self.win)
+
+        # Build the reusable Gabor patches and arcs once, before the first trial
+        if gabor.ct.RENDER_MODE == "array":
+            gabor.get_stimulus_pool(self.win).get_gabor_array(gabor.ct.NUM_PATCHES)
+        else:
+            gabor.get_stimulus_pool(self.win).get_gabors(gabor.ct.NUM_PATCHES)
+
+        # Build the scales once, the ratings only toggle the highlighted square (see utils.RatingScale)
+        utils.get_rating_scale(self.win, vividness_labels, y_offset=-200)
+        utils.get_rating_scale(self.win, confidence_labels, y_offset=-200)
+        self.frame_timer  # measures the refresh rate
+        self.collector  # escape quits through self.quit, also on the instruction screens
+
+    def run(self, session=None):
+        """Runs a whole session; without a session, the participant is asked for in dialogs."""
+        # TRIAL PHASE
+        if self.TOTAL_BLOCKS % 2 != 0:
+            print("TOTAL_BLOCKS must be an even number.")
+            return
+        preload_images()
+        if session is None:
+            answers = ask_participant()
+            if answers is None:
+                return
+            # Offer to continue the participant's session if it was interrupted
+            import checkpoint
+            interrupted = checkpoint.find_checkpoint(self.save_directory, clean_participant_id(answers[0]))
+            if interrupted is not None and ask_resume(interrupted):
+                session = self.resume_session(interrupted)
+            else:
+                session = self.new_session(*answers)
+        self.session = session
+        print(f"Session seed: {session.seed}")
+        if session.resumes:
+            print(f"Resuming {session.data_file} at {session.position}")
+        print(session.describe())
+
+        try:
+            session.open_data_files()
+        except PermissionError:
+            print(f"Unable to write to file {session.data_file}. Close the file if it's open.")
+            return
+        self.prepare_screen()
+        self.publish("session_start", {"participant_id": session.participant_id, "group_id": session.group_id,
+                                       "block_order": session.block_order})
+
+        if session.position is None or session.position["phase"] == "training":
+            self.training_phase()
+        self.exp_phase()
+        import utils
+        utils.show_images(self.frame_timer, image_end, min_display_time)
+        self.close()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close_data_files()
+            if "frame_timer" in self.__dict__:
+                # A resumed session keeps the flips of each run apart
+                run_suffix = f"_resume{self.session.resumes}" if self.session.resumes else ""
+                self.frame_timer.save(self.session.data_path(f"{run_suffix}_flips.npy"))
+                self.frame_timer.report(self.session.data_path(f"{run_suffix}_timing.txt"))
+        if "publisher" in self.__dict__ and self.publisher is not None:
+            self.publish("session_end")
+            self.publisher.close()
+        if "win" in self.__dict__:
+            self.win.close()
+
+    # Builds the stimulus of a trial from its plan and the current stim_strength
+    def prepare_stimulus(self, trial_params, stim_strength):
+        import trial_plan
+        import gabor_patches.generate_gaborPatches as gabor
+        self.frame_timer.build_started()  # construction time is checked against the frame budget
+        orientations = trial_plan.trial_orientations(trial_params, stim_strength)
+        to_show = gabor.generate_gabor_patches(self.win, reference=int(trial_params["reference"]),
+                                               direction=int(trial_params["direction"]),
+                                               distance_to_bound=stim_strength,
+                                               orientations=orientations,
+                                               positions=trial_params["positions"])
+        # Draw once into the back buffer and clear it, so the updated patches are
+        # uploaded to the graphics card before the stimulus frame
+        for stim in to_show[0] + to_show[1]:
+            stim.draw()
+        self.win.clearBuffer()
+        self.frame_timer.build_finished()
+        return orientations, to_show
+
+    # Main trial procedure
+    # prepared: result of prepare_stimulus() when the stimulus was built ahead of the trial (see exp_phase)
+    def run_trial(self, block_type, block_number, trial_num, global_trial, trial_params, stim_strength,
+                  give_feedback=False, saved_block_label=None, prepared=None):
+        import assets, utils
+        win, session, frame_timer, collector = self.win, self.session, self.frame_timer, self.collector
+        if saved_block_label is None:
+            saved_block_label = block_type
+        response = None
+        # Everything random about this trial was drawn before the session (see trial_plan)
+        gabor_direction = int(trial_params["direction"])
+        reference = int(trial_params["reference"])
+
+        # Set rating key mappings
+        if block_type == "with_mental_replay":
+            vividness_on_left = not session.left_for_confidence
+            if session.left_for_confidence:
+                confidence_keys = left_confidence_keys
+                vividness_keys = right_vividness_keys
+                confidence_prompt_text = "How confident are you?\n\nUse A/Z/E/R (left hand)"
+                vividness_prompt_text = "How vivid was your mental replay?\n\nUse U/I/O/P (right hand)"
+            else:
+                confidence_keys = right_confidence_keys
+                vividness_keys = left_vividness_keys
+                confidence_prompt_text = "How confident are you?\n\nUse U/I/O/P (right hand)"
+                vividness_prompt_text = "How vivid was your mental replay?\n\nUse A/Z/E/R (left hand)"
+        else:  # without mental replay
+            vividness_on_left = None
+            confidence_keys = right_confidence_keys
+            confidence_prompt_text = (
+                "How confident are you in your response?\n\n"
+                "U = Not confident   I = Slightly   O = Moderately   P = Very confident"
+            )
+            vividness_keys = None
+            vividness_prompt_text = None
+
+        # Store prompts in proper order
+        prompts = []
+        if block_type == "with_mental_replay":
+            if session.vividness_first:
+                prompts = [("vividness", vividness_prompt_text, vividness_keys),
+                           ("confidence", confidence_prompt_text, confidence_keys)]
+            else:
+                prompts = [("confidence", confidence_prompt_text, confidence_keys),
+                           ("vividness", vividness_prompt_text, vividness_keys)]
+        elif block_type == "without_mental_replay":
+            prompts = [("confidence", confidence_prompt_text, confidence_keys)]
+
+        # Fixation cross; the stimulus is built while it is on screen unless it was prepared already
+        # (the experimental trials start with their inter-trial pause, see exp_phase)
+        if (frame_timer.block, frame_timer.global_trial) != (saved_block_label, global_trial):
+            frame_timer.start_trial(global_trial, saved_block_label)
+        if prepared is None:
+            prepared = frame_timer.present("fixation", self.fixation_cross.draw, self.FIXATION_CROSS_DURATION,
+                                           prepare=lambda: self.prepare_stimulus(trial_params, stim_strength))
         else:
-            prompts = [("confidence", confidence_prompt_text, confidence_keys),
-                       ("vividness", vividness_prompt_text, vividness_keys)]
-    elif block_type == "without_mental_replay":
-        prompts = [("confidence", confidence_prompt_text, confidence_keys)]
-
-    # Fixation cross
-    fixation_cross.draw()
-    win.flip()
-    check_for_escape()
-    core.wait(FIXATION_CROSS_DURATION)
-
-    # Stimulus presentation
-    reference = np.random.randint(0, 180)
-    to_show = gabor.generate_gabor_patches(win, reference=reference,
-                                           direction=gabor_direction, distance_to_bound=stim_strength)
-
-    for stim in to_show[0]:
-        stim.draw()
-    for stim in to_show[1]:
-        stim.draw()
-    win.flip()
-    check_for_escape()
-    core.wait(STIMULUS_DURATION)
-
-    response_time = rt_clock.getTime()
-    # Make correct_response mapping robust to 0/180 or negative-angle conventions
-    if isinstance(gabor_direction, (int, float)):
-        if gabor_direction == 180 or gabor_direction < 0:
-            correct_response = 'v'
+            frame_timer.present("fixation", self.fixation_cross.draw, self.FIXATION_CROSS_DURATION)
+        orientations, to_show = prepared
+
+        def draw_stimulus():
+            for stim in to_show[0]:
+                stim.draw()
+            for stim in to_show[1]:
+                stim.draw()
+
+        # Stimulus presentation
+        frame_timer.present("stimulus", draw_stimulus, self.STIMULUS_DURATION)
+
+        # Make correct_response mapping robust to 0/180 or negative-angle conventions
+        if isinstance(gabor_direction, (int, float)):
+            if gabor_direction == 180 or gabor_direction < 0:
+                correct_response = 'v'
+            else:
+                correct_response = 'b'
         else:
             correct_response = 'b'
-    else:
-        correct_response = 'b'
-
-    event.clearEvents()
-
-    for stim in to_show[1]:
-        stim.draw()
-    win.flip()
-    check_for_escape()
-
-    rt_clock.reset()
-    while True:  # Wait for participant's response
-        check_for_escape()
-        key = event.getKeys(keyList=key_list, timeStamped=rt_clock)
-        if key != []:
-            info_response = key[0]
-            response = info_response[0]
-            response_time = info_response[1]
-            break
-    correct = correct_response == response
-
-    # Ratings loop
-    ratings = {"vividness": "NA", "confidence": "NA"}
-
-    if block_type == "with_mental_replay":
-        # Show the replay instruction IMAGE for ~1 second
-        replay_stim = visual.ImageStim(win, image=image_replay[0])
-        replay_stim.draw()
-        win.flip()
-        check_for_escape()
-        core.wait(MENTAL_REPLAY_PAUSE)  # 1 second
-        
-    for measure, prompt_text, keymap in prompts:
-        prompt = visual.TextStim(win, text=prompt_text, color='white', height=20, wrapWidth=700)
-        rating = None
-        event.clearEvents()
-        while rating is None:
-            check_for_escape()
-            keys = event.getKeys()
-            for key in keys:
-                if key in keymap:
-                    rating = keymap[key]
-
-            # Draw prompt and highlight the current rating dynamically
-            prompt.draw()
-            labels = ["Not vivid", "Slightly", "Moderately", "Very vivid"] if measure == "vividness" \
-                     else ["Not confident", "Slightly", "Moderately", "Very confident"]
-            utils.draw_visual_scale(win, selected=rating, labels=labels, y_offset=-200) # pass current rating to highlight
-            win.flip()
-            core.wait(0.5)
-
-        ratings[measure] = rating
-
-    # Feedback
-    if give_feedback:
-        feedback_text = 'Correct!' if correct else 'Wrong!' if response else 'No response'
-        feedback = visual.TextStim(win, text=feedback_text, pos=(0, 0), color='white')
-        feedback.draw()
-        win.flip()
-        check_for_escape()
-        core.wait(FEEDBACK_TIME)
-
-    # Save data for this trial
-    row_dict = {
-        "participant_id": participant_id,
-        "gender": gender,
-        "age": age,
-        "handedness": handedness,
-        "block": saved_block_label,
-        "block_type": block_type,
-        "block_number": block_number,
-        "trial": trial_num,
-        "global_trial": global_trial,
-        "response": response,
-        "reference": reference,
-        "vividness": ratings["vividness"],
-        "confidence": ratings["confidence"],
-        "response_time": response_time,
-        "gabor_direction": gabor_direction,
-        "correct": correct,
-        "stim_strength": stim_strength,
-        "vividness_on_left": vividness_on_left if block_type == "with_mental_replay" else None
-    }
-    save_trial_data(data_file, header, row_dict)
-
-    return correct
-
-
-# TRAINING PHASE (Adaptive & Varying Duration)
-def training_phase():
-    utils.show_images(win, image_intro, min_display_time)
-
-    # 1: basic dot motion discrimination (left/right only)
-    utils.show_images(win, image_training1, min_display_time)
-    training1_directions = []
-    baseline_trials = 20
-    max_extra_trials = 10
-    accuracy_threshold = 0.85
-    trial_counter = 0
-    correct_history = []
-
-    while True:
-        direction = utils.get_pseudorandom_direction(prev_directions=training1_directions)
-        training1_directions.append(direction)
-        global STIMULUS_DURATION
-        STIMULUS_DURATION = 1.0
-
-        correct = run_trial(
-            block_type="training",
-            block_number=0,
-            trial_num=trial_counter + 1,
-            global_trial=trial_counter + 1,
-            gabor_direction=direction,
-            stim_strength=20,
-            give_feedback=True,
-            saved_block_label="training_1"
-        )
-        correct_history.append(correct)
-        trial_counter += 1
-
-        if trial_counter >= baseline_trials:
-            recent_accuracy = sum(correct_history[-baseline_trials:]) / baseline_trials
-            if recent_accuracy >= accuracy_threshold or trial_counter >= baseline_trials + max_extra_trials:
-                break
-
-    # 2: non-mental replay practice
-    utils.show_images(win, image_training2, min_display_time)
-    training2_directions = []
-    trial_counter = 0
-    correct_history = []
-
-    while True:
-        direction = utils.get_pseudorandom_direction(prev_directions=training2_directions)
-        training2_directions.append(direction)
-        STIMULUS_DURATION = 0.7
-
-        correct = run_trial(
-            block_type="without_mental_replay",
-            block_number=0,
-            trial_num=trial_counter + 1,
-            global_trial=trial_counter + 1 + len(training1_directions),
-            gabor_direction=direction,
-            stim_strength=20,
-            give_feedback=True,
-            saved_block_label="training_2"
-        )
-        correct_history.append(correct)
-        trial_counter += 1
 
-        if trial_counter >= baseline_trials:
+        collector.clear()
+
+        for stim in to_show[1]:
+            stim.draw()
+        collector.reset_clock_on_flip()  # response times are measured from the onset of the arcs
+        frame_timer.flip("stimulus_off", paced=True, wait_after=True)  # due right after the stimulus
+
+        # Wait for participant's response (escape is handled by the collector)
+        response, response_time = collector.wait_keys(key_list)
+        correct = correct_response == response
+
+        # Ratings loop
+        ratings = {"vividness": "NA", "confidence": "NA"}
+        rating_rts = {"vividness": "NA", "confidence": "NA"}
+
+        if block_type == "with_mental_replay":
+            # Show the replay instruction IMAGE for ~1 second
+            replay_stim = assets.image_cache.get(win, image_replay[0])
+            frame_timer.present("replay", replay_stim.draw, self.MENTAL_REPLAY_PAUSE)  # 1 second
+
+        for measure, prompt_text, keymap in prompts:
+            prompt = utils.get_text_stim(win, prompt_text, color='white', height=20, wrapWidth=700)
+            labels = vividness_labels if measure == "vividness" else confidence_labels
+            collector.clear()
+            collector.reset_clock_on_flip()  # rating times are measured from the prompt onset
+
+            # Prompt and scale until a rating key; the flips pace the loop at the refresh rate
+            def draw_scale():
+                prompt.draw()
+                utils.draw_visual_scale(win, selected=None, labels=labels, y_offset=-200)
+
+            def poll_rating():
+                keys = collector.get_keys(list(keymap))  # escape is handled by the collector
+                return keys[0] if keys else None
+            key, rating_rts[measure] = frame_timer.present_until(measure, draw_scale, poll_rating)
+            rating = keymap[key]
+
+            # Highlight the chosen rating from the next frame on
+            def draw_confirmation():
+                prompt.draw()
+                utils.draw_visual_scale(win, selected=rating, labels=labels, y_offset=-200)
+            frame_timer.present(measure + "_confirm", draw_confirmation, self.RATING_CONFIRM_DURATION)
+
+            ratings[measure] = rating
+
+        # Feedback
+        if give_feedback:
+            feedback_text = 'Correct!' if correct else 'Wrong!' if response else 'No response'
+            feedback = utils.get_text_stim(win, feedback_text, pos=(0, 0), color='white')
+            frame_timer.present("feedback", feedback.draw, self.FEEDBACK_TIME)
+
+        # Save data for this trial
+        row_dict = session.participant_columns()
+        row_dict.update({
+            "block": saved_block_label,
+            "block_type": block_type,
+            "block_number": block_number,
+            "trial": trial_num,
+            "global_trial": global_trial,
+            "response": response,
+            "reference": reference,
+            "vividness": ratings["vividness"],
+            "confidence": ratings["confidence"],
+            "response_time": response_time,
+            "gabor_direction": gabor_direction,
+            "correct": correct,
+            "stim_strength": stim_strength,
+            "vividness_on_left": vividness_on_left if block_type == "with_mental_replay" else None,
+            "vividness_rt": rating_rts["vividness"],
+            "confidence_rt": rating_rts["confidence"]
+        })
+        row_dict.update(frame_timer.end_trial(self.STIMULUS_DURATION))
+        session.save_trial_data(row_dict, orientations, trial_params["positions"])
+        self.publish("trial", row_dict)
+
+        return correct
+
+    # TRAINING PHASE (Adaptive & Varying Duration)
+    def training_phase(self):
+        import trial_plan, utils
+        win, session = self.win, self.session
+        baseline_trials = 20
+        max_extra_trials = 10
+        accuracy_threshold = 0.85
+
+        stages = [
+            # label, instructions, block type, stimulus duration
+            ("training_1", image_training1, "training", 1.0),  # 1: basic dot motion discrimination (left/right only)
+            ("training_2", image_training2, "without_mental_replay", 0.7),  # 2: non-mental replay practice
+            ("training_3", image_training3, "with_mental_replay", 0.4),  # 3: mental replay practice
+        ]
+
+        def stage_finished(trial_counter, correct_history):
+            if trial_counter < baseline_trials:
+                return False
             recent_accuracy = sum(correct_history[-baseline_trials:]) / baseline_trials
-            if recent_accuracy >= accuracy_threshold or trial_counter >= baseline_trials + max_extra_trials:
-                break
-
-    # 3: mental replay practice
-    utils.show_images(win, image_training3, min_display_time)
-    training3_directions = []
-    trial_counter = 0
-    correct_history = []
-
-    while True:
-        direction = utils.get_pseudorandom_direction(prev_directions=training3_directions)
-        training3_directions.append(direction)
-        STIMULUS_DURATION = 0.4
-
-        correct = run_trial(
-            block_type="with_mental_replay",
-            block_number=0,
-            trial_num=trial_counter + 1,
-            global_trial=trial_counter + 1 + len(training1_directions) + len(training2_directions),
-            gabor_direction=direction,
-            stim_strength=20,
-            give_feedback=True,
-            saved_block_label="training_3"
-        )
-        correct_history.append(correct)
-        trial_counter += 1
-
-        if trial_counter >= baseline_trials:
-            recent_accuracy = sum(correct_history[-baseline_trials:]) / baseline_trials
-            if recent_accuracy >= accuracy_threshold or trial_counter >= baseline_trials + max_extra_trials:
-                break
-
-    utils.show_images(win, image_training_end, min_display_time)
-
-
-# EXPERIMENTAL PHASE (Adaptive staircase)
-def exp_phase():
-    global STIMULUS_DURATION
-    # Ensure experiment uses intended value
-    STIMULUS_DURATION = 0.4
-
-    # Create block order (already built earlier, but rebuild locally to be safe)
-    half_blocks_local = TOTAL_BLOCKS // 2
-    all_blocks = (["with_mental_replay"] * half_blocks_local +
-                  ["without_mental_replay"] * half_blocks_local)
+            return recent_accuracy >= accuracy_threshold or trial_counter >= baseline_trials + max_extra_trials
+
+        # A resumed session continues the stage it was in, with its counters
+        position = session.position or {"phase": "training", "stage": 0, "trial_counter": 0,
+                                        "correct_history": [], "trials_before": 0}
+
+        # Draw the longest possible version of each training phase before the first flip
+        # (a resumed session reloads them)
+        training_plans = {}
+        for label, _, _, _ in stages:
+            path = trial_plan.plan_path(session.data_file, label)
+            if session.position is not None and os.path.exists(path):
+                training_plans[label] = trial_plan.load_trial_plan(path)
+            else:
+                training_plans[label] = trial_plan.build_trial_plan(baseline_trials + max_extra_trials, session.rng)
+                trial_plan.save_trial_plan(path, training_plans[label])
+
+        if session.position is None:
+            utils.show_images(self.frame_timer, image_intro, min_display_time)
+
+        trials_before = position["trials_before"]  # training trials of the previous stages
+        for stage in range(position["stage"], len(stages)):
+            label, instructions, block_type, stimulus_duration = stages[stage]
+            utils.show_images(self.frame_timer, instructions, min_display_time)
+            if stage == position["stage"]:
+                trial_counter, correct_history = position["trial_counter"], list(position["correct_history"])
+            else:
+                trial_counter, correct_history = 0, []
+            self.STIMULUS_DURATION = stimulus_duration
+
+            while not stage_finished(trial_counter, correct_history):
+                trial_params = training_plans[label][trial_counter]
+
+                correct = self.run_trial(
+                    block_type=block_type,
+                    block_number=0,
+                    trial_num=trial_counter + 1,
+                    global_trial=trials_before + trial_counter + 1,
+                    trial_params=trial_params,
+                    stim_strength=20,
+                    give_feedback=True,
+                    saved_block_label=label
+                )
+                correct_history.append(correct)
+                trial_counter += 1
+                session.save_checkpoint({"phase": "training", "stage": stage, "trial_counter": trial_counter,
+                                         "correct_history": list(correct_history), "trials_before": trials_before})
+            trials_before += trial_counter
+
+        session.sync_data_files()
+        session.save_checkpoint({"phase": "exp", "next_trial": 0, "trials_per_block": self.NUMBER_OF_TRIALS})
+        utils.show_images(self.frame_timer, image_training_end, min_display_time)
+
+    # EXPERIMENTAL PHASE (Adaptive staircase)
+    def exp_phase(self):
+        from psychopy import core, event, visual
+        import trial_plan, utils
+        from staircase import InterleavedStaircases
+        win, session = self.win, self.session
+        # Ensure experiment uses intended value
+        self.STIMULUS_DURATION = 0.4
+
+        # Blocks in the order drawn for this session, first block fixed by the group
+        block_order = session.block_order
+
+        # A resumed session starts again after the last trial of its checkpoint
+        resuming = session.position is not None and session.position["phase"] == "exp"
+        completed_trials = session.position["next_trial"] if resuming else 0
+
+        # Draw every trial of the session before the first flip (a resumed session reloads them)
+        plan_path = trial_plan.plan_path(session.data_file, "exp")
+        if resuming and os.path.exists(plan_path):
+            exp_plan = trial_plan.load_trial_plan(plan_path)
+        else:
+            exp_plan = trial_plan.build_trial_plan(len(block_order) * self.NUMBER_OF_TRIALS, session.rng)
+            trial_plan.save_trial_plan(plan_path, exp_plan)
 
-    # first_block preserved from earlier computation
-    # If first_block variable isn't in local scope, fall back to the global computed earlier
-    try:
-        fb = first_block
-    except NameError:
-        fb = "with_mental_replay" if start_with_replay else "without_mental_replay"
-
-    # Remaining blocks randomized
-    remaining_blocks = [b for b in all_blocks if b != fb] + [fb] * (half_blocks_local - 1)
-    random.shuffle(remaining_blocks)
-
-    block_order_local = [fb] + remaining_blocks
-
-    # Loop through blocks
-    stim_strength = 20  # initial coherence/distance value
-    for block_idx, condition in enumerate(block_order_local):
-
-        # Break halfway
-        if block_idx == TOTAL_BLOCKS // 2:
-            break_clock = core.Clock()
-            break_text = visual.TextStim(
-                win,
-                text="You can take a short break now.\n\nPress any key when ready to continue.",
-                color="white", height=30, wrapWidth=800
-            )
-            event.clearEvents()
-            break_text.draw()
-            win.flip()
-            event.waitKeys()  # wait for keypress
-            break_duration = break_clock.getTime()
-
-            # Save break info in CSV
-            row_dict = {
-                "participant_id": participant_id,
-                "gender": gender,
-                "age": age,
-                "handedness": handedness,
-                "block": "break",
-                "block_type": "pause",
-                "block_number": block_idx,
-                "trial": "NA",
-                "global_trial": "NA",
-                "response": "NA",
-                "reference": "NA",
-                "vividness": "NA",
-                "confidence": "NA",
-                "response_time": break_duration,
-                "gabor_direction": "NA",
-                "correct": "NA",
-                "stim_strength": "NA",
-                "vividness_on_left": "NA"
-            }
-            save_trial_data(data_file, header, row_dict)
-
-        # Show condition-specific instructions at the start of each block
-        if condition == "without_mental_replay":
-            utils.show_images(win, image_task2, min_display_time)  # non-replay
+        # Loop through blocks
+        # Adaptive staircase on the coherence/distance value, saved with the session checkpoint
+        if resuming and session.staircase_state is not None:
+            staircases = InterleavedStaircases.from_state(session.staircase_state)
         else:
-            utils.show_images(win, image_task1, min_display_time)  # replay
-
-        # Run all trials in block
-        for trial in range(NUMBER_OF_TRIALS):
-            win.flip()
-            core.wait(INTERTRIAL_PAUSE)
-
-            # Get next direction (pseudo-randomized to avoid streaks)
-            direction = utils.get_pseudorandom_direction(prev_directions=test_directions)
-            test_directions.append(direction)
-
-            block_number = block_idx + 1
-            global_trial_number = block_idx * NUMBER_OF_TRIALS + trial + 1
-
-            run_trial(
-                block_type=condition,
-                block_number=block_number,
-                trial_num=trial + 1,
-                global_trial=global_trial_number,
-                gabor_direction=direction,
-                stim_strength=stim_strength,
+            staircases = InterleavedStaircases(
+                conditions=["with_mental_replay", "without_mental_replay"] if self.INTERLEAVED_STAIRCASES else None,
+                method=self.STAIRCASE_METHOD,
+                **self.STAIRCASE_PARAMS[self.STAIRCASE_METHOD]
             )
+        for block_idx, condition in enumerate(block_order):
+            if (block_idx + 1) * self.NUMBER_OF_TRIALS <= completed_trials:
+                continue  # block finished before the session was interrupted
+
+            # Break halfway (unless it was taken before the session was interrupted)
+            break_done = completed_trials > block_idx * self.NUMBER_OF_TRIALS or \
+                (resuming and session.position.get("break_done", False))
+            if block_idx == self.TOTAL_BLOCKS // 2 and not break_done:
+                break_clock = core.Clock()
+                break_text = visual.TextStim(
+                    win,
+                    text="You can take a short break now.\n\nPress any key when ready to continue.",
+                    color="white", height=30, wrapWidth=800
+                )
+                event.clearEvents()
+                break_text.draw()
+                self.frame_timer.flip("break")
+                event.waitKeys()  # wait for keypress
+                break_duration = break_clock.getTime()
+
+                # Save break info in CSV
+                row_dict = session.participant_columns()
+                row_dict.update({
+                    "block": "break",
+                    "block_type": "pause",
+                    "block_number": block_idx,
+                    "trial": "NA",
+                    "global_trial": "NA",
+                    "response": "NA",
+                    "reference": "NA",
+                    "vividness": "NA",
+                    "confidence": "NA",
+                    "response_time": break_duration,
+                    "gabor_direction": "NA",
+                    "correct": "NA",
+                    "stim_strength": "NA",
+                    "vividness_on_left": "NA"
+                })
+                session.save_trial_data(row_dict)
+                session.save_checkpoint({"phase": "exp", "next_trial": block_idx * self.NUMBER_OF_TRIALS,
+                                         "break_done": True, "trials_per_block": self.NUMBER_OF_TRIALS},
+                                        staircases)
+
+            # Show condition-specific instructions at the start of each block
+            if condition == "without_mental_replay":
+                utils.show_images(self.frame_timer, image_task2, min_display_time)  # non-replay
+            else:
+                utils.show_images(self.frame_timer, image_task1, min_display_time)  # replay
+
+            # Run all trials in block
+            for trial in range(self.NUMBER_OF_TRIALS):
+                block_number = block_idx + 1
+                global_trial_number = block_idx * self.NUMBER_OF_TRIALS + trial + 1
+                if global_trial_number <= completed_trials:
+                    continue
+
+                # Direction (pseudo-randomized to avoid streaks) and stimuli come from the plan
+                trial_params = exp_plan[global_trial_number - 1]
+                session.test_directions.append(int(trial_params["direction"]))
+                stim_strength = staircases.value(condition)
+
+                # The staircase is up to date once the previous trial is answered, so the stimulus
+                # of this trial is built during the inter-trial pause, which belongs to the trial
+                self.frame_timer.start_trial(global_trial_number, condition)
+                prepared = self.frame_timer.present("intertrial", lambda: None, self.INTERTRIAL_PAUSE,
+                                                    prepare=lambda: self.prepare_stimulus(trial_params, stim_strength))
+
+                correct = self.run_trial(
+                    block_type=condition,
+                    block_number=block_number,
+                    trial_num=trial + 1,
+                    global_trial=global_trial_number,
+                    trial_params=trial_params,
+                    stim_strength=stim_strength,
+                    prepared=prepared,
+                )
+
+                # Adaptive staircase: update stim_strength from this trial's answer
+                staircases.update(condition, correct)
+                session.save_checkpoint({"phase": "exp", "next_trial": global_trial_number,
+                                         "trials_per_block": self.NUMBER_OF_TRIALS}, staircases)
+
+            # Make sure the block is on disk before the next one starts
+            session.sync_data_files()
+
+        session.save_checkpoint({"phase": "done"}, staircases)  # nothing left to resume
+
+def main():
+    Experiment().run()
+    from psychopy import core
+    core.quit()
 
-            # Adaptive staircase: update stim_strength (robust reading of last 'correct' value)
-            try:
-                with open(data_file, 'r', newline='') as f:
-                    reader = csv.DictReader(f)
-                    rows = list(reader)
-                    if rows:
-                        last_row = rows[-1]
-                        last_correct_str = last_row.get("correct", "")
-                        if last_correct_str == 'True':
-                            last_correct = True
-                        elif last_correct_str == 'False':
-                            last_correct = False
-                        else:
-                            last_correct = None
-                    else:
-                        last_correct = None
-            except Exception:
-                last_correct = None
-
-            step_up = 1.0   # after incorrect
-            step_down = 0.5 # after correct
-
-            if last_correct is True:
-                stim_strength = max(0.1, stim_strength - step_down)
-            elif last_correct is False:
-                stim_strength = min(100, stim_strength + step_up)
-
-training_phase()
-exp_phase()
-utils.show_images(win, image_end, min_display_time)
-win.close()
-core.quit()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import hashlib
+import numpy as np
+
+# Every source of randomness of a session gets its own stream
+STREAMS = ["blocks", "directions", "references", "orientations", "positions"]
+
+def session_seed(participant_id):
+    """Stable 64-bit seed from the participant ID.
+    Unlike sum(ord(c) ...), anagram IDs ("12" and "21") get different seeds."""
+    return int.from_bytes(hashlib.sha256(participant_id.encode("utf-8")).digest()[:8], "little")
+
+class SessionRNG:
+    """Independent NumPy Generators for a session, all spawned from one seed with SeedSequence.
+    The same seed always gives the same streams, and sessions (or parallel simulations) seeded
+    from different SeedSequences never share random numbers. Streams are attributes:
+    session_rng.directions, session_rng.positions, ...
+    """
+    def __init__(self, seed):
+        self.seed = seed
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        # The children spawn() would give, without advancing the seed sequence: the same
+        # SeedSequence object always gives the same streams, however often it is used
+        seq = self.seed_sequence
+        for i, name in enumerate(STREAMS):
+            child = np.random.SeedSequence(seq.entropy, spawn_key=seq.spawn_key + (seq.n_children_spawned + i,),
+                                           pool_size=seq.pool_size)
+            setattr(self, name, np.random.default_rng(child))
+
+    def state(self):
+        """Current state of every stream, to save and restore a session exactly."""
+        return {name: getattr(self, name).bit_generator.state for name in STREAMS}
+
+    def set_state(self, state):
+        for name in STREAMS:
+            getattr(self, name).bit_generator.state = state[name]
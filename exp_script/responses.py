@@ -0,0 +1,80 @@
+from psychopy import core, event
+import weakref
+try:
+    from psychopy.hardware import keyboard
+except ImportError:  # older PsychoPy: fall back on psychopy.event
+    keyboard = None
+
+class ResponseCollector:
+    """Keyboard input for the whole experiment.
+    Escape and the response keys are read from the keyboard in a single query, and waits
+    block in the keyboard backend instead of spinning in a getKeys loop. With the
+    psychtoolbox backend of psychopy.hardware.keyboard the key times are hardware
+    timestamps; reset_clock_on_flip() makes them relative to a screen onset.
+    on_escape is called when escape is pressed, e.g. Experiment.quit, which saves and closes
+    everything before quitting.
+    """
+    def __init__(self, win, on_escape):
+        self.win = win
+        self.on_escape = on_escape
+        if keyboard is not None:
+            self.keyboard = keyboard.Keyboard()
+            self.clock = self.keyboard.clock
+        else:
+            self.keyboard = None
+            self.clock = core.Clock()
+
+    def clear(self):
+        if self.keyboard is not None:
+            self.keyboard.clearEvents()
+        else:
+            event.clearEvents()
+
+    def reset_clock_on_flip(self):
+        """Key times will be measured from the next flip."""
+        self.win.callOnFlip(self.clock.reset)
+
+    def _with_escape(self, key_list):
+        return None if key_list is None else list(key_list) + ['escape']
+
+    def _handle(self, keys):
+        """Turns raw key events into (name, rt) pairs, quitting on escape."""
+        if self.keyboard is not None:
+            keys = [(key.name, key.rt) for key in keys]
+        if any(name == 'escape' for name, _ in keys):
+            self.on_escape()
+        return keys
+
+    def get_keys(self, key_list=None):
+        """Keys pressed since the last read, as (name, rt); never waits."""
+        if self.keyboard is not None:
+            keys = self.keyboard.getKeys(keyList=self._with_escape(key_list), waitRelease=False)
+        else:
+            keys = event.getKeys(keyList=self._with_escape(key_list), timeStamped=self.clock)
+        return self._handle(keys)
+
+    def check_escape(self):
+        self.get_keys([])
+
+    def wait_keys(self, key_list=None, max_wait=float('inf')):
+        """Waits for the first of key_list and returns (name, rt), or None after max_wait seconds."""
+        if self.keyboard is not None:
+            keys = self.keyboard.waitKeys(maxWait=max_wait, keyList=self._with_escape(key_list),
+                                          waitRelease=False)
+        else:
+            keys = event.waitKeys(maxWait=max_wait, keyList=self._with_escape(key_list),
+                                  timeStamped=self.clock)
+        keys = self._handle(keys or [])
+        return keys[0] if keys else None
+
+_collectors = weakref.WeakKeyDictionary()
+
+def get_collector(win, on_escape=None):
+    """Returns the collector of the window, creating it on first use (which needs on_escape)."""
+    collector = _collectors.get(win)
+    if collector is None:
+        if on_escape is None:
+            raise RuntimeError("No response collector for this window yet: create it with an on_escape callback")
+        collector = ResponseCollector(win, on_escape)
+        _collectors[win] = collector
+    return collector
@@ -0,0 +1,145 @@
+import atexit
+import glob
+import os
+import struct
+import threading
+import weakref
+import numpy as np
+from gabor_patches.constant import constant as ct
+
+MAX_PARTICIPANT_ID_LENGTH = 32  # longer IDs are refused when the session is created (main.Session)
+
+# Fixed type of every CSV column, with the value used when it is missing ("NA"/None).
+# Booleans are stored as int8 (1/0, -1 when missing) so they survive missing values.
+COLUMN_TYPES = {
+    "participant_id": (f"U{MAX_PARTICIPANT_ID_LENGTH}", "NA"),
+    "gender": ("U8", "NA"),
+    "age": (np.int16, -1),
+    "handedness": ("U12", "NA"),
+    "block": ("U24", "NA"),
+    "block_type": ("U24", "NA"),
+    "block_number": (np.int16, -1),
+    "trial": (np.int16, -1),
+    "global_trial": (np.int32, -1),
+    "response": ("U8", "NA"),
+    "reference": (np.float32, np.nan),
+    "vividness": (np.int8, -1),
+    "confidence": (np.int8, -1),
+    "response_time": (np.float64, np.nan),
+    "gabor_direction": (np.int8, 0),
+    "correct": (np.int8, -1),
+    "stim_strength": (np.float32, np.nan),
+    "vividness_on_left": (np.int8, -1),
+    "vividness_rt": (np.float64, np.nan),
+    "confidence_rt": (np.float64, np.nan),
+    "stim_onset": (np.float64, np.nan),
+    "stim_offset": (np.float64, np.nan),
+    "stim_duration": (np.float64, np.nan),
+    "stim_frames": (np.int16, -1),
+    "stim_build_time": (np.float64, np.nan),
+    "dropped_frames": (np.int16, -1),
+}
+DEFAULT_TYPE = ("U64", "NA")  # columns added to the header without a type above
+
+def session_dtype(header, num_patches=ct.NUM_PATCHES):
+    """One record per CSV row, plus the orientation and position of every patch."""
+    fields = [(key, COLUMN_TYPES.get(key, DEFAULT_TYPE)[0]) for key in header]
+    fields += [("orientations", np.float32, (num_patches,)),
+               ("positions", np.float32, (num_patches, 2))]
+    return np.dtype(fields)
+
+def to_typed(key, value):
+    """Converts one CSV value to its column type, mapping "NA"/None to the missing value."""
+    column_type, missing = COLUMN_TYPES.get(key, DEFAULT_TYPE)
+    if value is None or (isinstance(value, str) and value == "NA"):
+        return missing
+    if np.dtype(column_type).kind == "U":
+        return str(value)
+    return value
+
+def npy_header(dtype, n_rows, size):
+    """Header (.npy format 1.0) of a file of n_rows records, padded to size bytes."""
+    text = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (n_rows,)})
+    text = text.ljust(size - 11) + "\n"
+    return np.lib.format.magic(1, 0) + struct.pack("<H", size - 10) + text.encode("latin1")
+
+class SessionArrayWriter:
+    """Appends the typed rows of a session to a structured .npy file.
+    flush() writes the rows appended since the last flush at the end of the file, then their
+    count in the header, which is padded for any count; so each flush only costs the new rows
+    and the file is readable with np.load(path, mmap_mode="r") at any time.
+    keep_rows is the number of rows of an existing file to continue after (a resumed session).
+    """
+    def __init__(self, path, header, num_patches=ct.NUM_PATCHES, keep_rows=0):
+        self.path = path
+        self.header = list(header)
+        self.dtype = session_dtype(header, num_patches)
+        # Room for the longest count, rounded up to the 64-byte alignment of np.save
+        self.header_size = -(-len(npy_header(self.dtype, 10 ** 18, 12)) // 64) * 64
+        kept = np.zeros(0, dtype=self.dtype)
+        if keep_rows and os.path.exists(path):
+            kept = np.load(path)[:keep_rows].astype(self.dtype)
+        self.kept = len(kept)
+        self.rows = []  # rows appended after the kept ones
+        self._saved = self.kept
+        self._lock = threading.Lock()
+        tmp_path = self.path + ".tmp.npy"
+        with open(tmp_path, "wb") as f:
+            f.write(npy_header(self.dtype, self.kept, self.header_size))
+            f.write(kept.tobytes())
+        os.replace(tmp_path, self.path)
+        _writers.add(self)
+
+    @property
+    def n_rows(self):
+        return self.kept + len(self.rows)
+
+    def append(self, row_dict, orientations=None, positions=None):
+        record = np.zeros((), dtype=self.dtype)
+        for key in self.header:
+            record[key] = to_typed(key, row_dict.get(key))
+        record["orientations"] = np.nan if orientations is None else orientations
+        record["positions"] = np.nan if positions is None else positions
+        self.rows.append(record)
+
+    def flush(self, n_rows=None):
+        """Saves the first n_rows rows (all by default), e.g. the count at a checkpoint when
+        flushing from another thread. Rows already saved are not written again."""
+        n_rows = self.n_rows if n_rows is None else n_rows
+        with self._lock:
+            if n_rows <= self._saved:
+                return
+            new_rows = np.array(self.rows[self._saved - self.kept:n_rows - self.kept], dtype=self.dtype)
+            with open(self.path, "r+b") as f:
+                # Rows first: a crash in between leaves a file with the previous count
+                f.seek(self.header_size + self._saved * self.dtype.itemsize)
+                f.write(new_rows.tobytes())
+                f.truncate()
+                f.flush()
+                f.seek(0)
+                f.write(npy_header(self.dtype, n_rows, self.header_size))
+            self._saved = n_rows
+
+    def close(self):
+        self.flush()
+        _writers.discard(self)
+
+_writers = weakref.WeakSet()
+
+def flush_all():
+    for writer in list(_writers):
+        writer.flush()
+
+atexit.register(flush_all)  # core.quit() exits through sys.exit
+
+def session_path(data_file):
+    return data_file.replace(".csv", ".npy")
+
+def load_session(path, mmap=True):
+    """Memory-maps one session; columns are read lazily, e.g. session["correct"]."""
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def load_sessions(data_dir, mmap=True):
+    """Memory-maps every session saved in data_dir, keyed by file name."""
+    paths = sorted(glob.glob(os.path.join(data_dir, "*_experiment_data.npy")))
+    return {os.path.basename(path): load_session(path, mmap) for path in paths}
@@ -0,0 +1,401 @@
+"""Headless backend: runs main.py without a display, dialogs or a participant.
+
+install() puts simulated stand-ins for the parts of PsychoPy used by the experiment
+(window, stimuli, dialogs, clocks and keyboard) in sys.modules. Time is virtual: flips
+advance it by one frame and waits jump ahead. A screen that stays up unchanged is held
+for all its frames at once (Window.hold_frames, frames_until_input), so of the ~60,000
+frames of a default session of 220 trials only ~2,000 are actually flipped and a session
+takes about 0.5 s of CPU, i.e. roughly 120 sessions per minute and per core
+(design_simulation.py runs them in parallel). Keyboard answers come from a SimulatedObserver, which looks at what is
+drawn on the screen like a participant would.
+
+Usage (from exp_script):
+    python simulation.py --participants 50
+"""
+import argparse
+import contextlib
+import io
+import math
+import sys
+import tempfile
+import types
+import numpy as np
+
+FRAME_RATE = 60.0
+
+_erf = np.vectorize(math.erf)
+
+def norm_cdf(x):
+    return 0.5 * (1 + _erf(np.asarray(x, dtype=float) / math.sqrt(2)))
+
+class SessionEnded(SystemExit):
+    """Raised by the simulated core.quit()."""
+
+class SimulatedObserver:
+    """Synthetic participant answering from the screen.
+    The orientation offset of the patches relative to the reference (read from the drawn
+    stimuli) is perceived with Gaussian noise of sd sensory_noise, so the proportion correct
+    follows a cumulative Gaussian over stim_strength (see psychometric). Confidence and
+    vividness are the strength of that evidence seen through extra metacognitive noise,
+    binned by rating_criteria (in units of sensory_noise).
+    """
+    def __init__(self, rng=None, sensory_noise=6.0, meta_noise=0.5, vividness_noise=1.0,
+                 rating_criteria=(0.5, 1.0, 1.75), lapse_rate=0.02, non_decision_time=0.35,
+                 rt_scale=0.5, rt_sd=0.3, rating_rt=0.8, break_duration=30.0):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.sensory_noise = sensory_noise
+        self.meta_noise = meta_noise
+        self.vividness_noise = vividness_noise
+        self.rating_criteria = tuple(rating_criteria)
+        self.lapse_rate = lapse_rate
+        self.non_decision_time = non_decision_time
+        self.rt_scale = rt_scale
+        self.rt_sd = rt_sd
+        self.rating_rt = rating_rt
+        self.break_duration = break_duration
+        self.offset = None  # signed orientation offset of the last stimulus seen
+        self.evidence = None  # internal evidence of the last decision, in units of sensory_noise
+
+    def psychometric(self, stim_strength):
+        """Expected proportion correct at a given stim_strength."""
+        return self.lapse_rate / 2 + (1 - self.lapse_rate) * norm_cdf(np.asarray(stim_strength) / self.sensory_noise)
+
+    def see(self, screen):
+        """Called at every flip with the stimuli drawn on that frame."""
+        oris = []
+        reference = None
+        for stim in screen:
+            if isinstance(stim, GratingStim):
+                oris.append(stim.ori)
+            elif isinstance(stim, ElementArrayStim):
+                oris.extend(np.asarray(stim.oris, dtype=float))
+            elif isinstance(stim, ShapeStim) and stim.lineColor == 'blue' and reference is None:
+                # The first blue arc starts at the reference orientation
+                x, y = np.asarray(stim.vertices, dtype=float)[0]
+                reference = 90 - np.rad2deg(np.arctan2(y, x))
+        if oris and reference is not None:
+            offsets = (np.asarray(oris, dtype=float) - reference + 90) % 180 - 90
+            self.offset = offsets.mean()
+
+    def _rating(self, noise):
+        latent = abs(self.evidence) + self.rng.normal(0, noise)
+        return 1 + sum(latent > criterion for criterion in self.rating_criteria)
+
+    def respond(self, screen, key_list):
+        """Returns (key, rt) for a screen waiting on key_list, or None to never answer."""
+        keys = [key for key in key_list if key != 'escape'] if key_list is not None else ['space']
+        if not keys:
+            return None
+        if keys == ['space']:  # instructions and breaks
+            return 'space', self.rating_rt + self.rng.exponential(0.5)
+        if set(keys) == {'v', 'b'}:
+            offset = self.offset if self.offset is not None else 0.0
+            self.evidence = (offset + self.rng.normal(0, self.sensory_noise)) / self.sensory_noise
+            choice = 'b' if self.evidence > 0 else 'v'
+            if self.rng.random() < self.lapse_rate:
+                choice = self.rng.choice(['v', 'b'])
+            rt = self.non_decision_time + self.rt_scale * np.exp(-abs(self.evidence) / 2 +
+                                                                 self.rng.normal(0, self.rt_sd))
+            return choice, rt
+        # Rating scales: the keys come in the order of the ratings 1..4
+        vividness = any(isinstance(stim, TextStim) and "vivid" in stim.text for stim in screen)
+        rating = self._rating(self.vividness_noise if vividness else self.meta_noise)
+        rating = min(rating, len(keys))
+        return keys[rating - 1], self.rating_rt * np.exp(self.rng.normal(0, self.rt_sd))
+
+class HeadlessBackend:
+    """Virtual clock, current screen and scripted dialogs shared by the simulated modules."""
+    def __init__(self):
+        self.now = 0.0
+        self.observer = SimulatedObserver()
+        self.dialog_answers = {}
+        self.screen = []
+        self.next_press = None  # time of the key press planned by the keyboard, if any
+
+    def start_session(self, observer, dialog_answers):
+        self.now = 0.0
+        self.observer = observer
+        self.dialog_answers = dialog_answers
+        self.screen = []
+        self.next_press = None
+
+_backend = HeadlessBackend()
+
+# psychopy.core
+class Clock:
+    def __init__(self):
+        self._start = _backend.now
+
+    def reset(self, newT=0.0):
+        self._start = _backend.now + newT
+
+    def getTime(self):
+        return _backend.now - self._start
+
+def getTime():
+    return _backend.now
+
+def wait(secs, hogCPUperiod=0.2):
+    _backend.now += max(0.0, secs)
+
+def quit():
+    raise SessionEnded()
+
+# psychopy.visual
+class Window:
+    def __init__(self, size=(800, 600), color='gray', units='pix', fullscr=False, screen=0, pos=None, **kwargs):
+        self.size = size
+        self.units = units
+        self._drawn = []
+        self._on_flip = []
+        self.frameIntervals = []
+        self.recordFrameIntervals = False
+        self.nDroppedFrames = 0
+        self.closed = False
+
+    def flip(self, clearBuffer=True):
+        # Next vertical blank after the current (virtual) time
+        frame = 1.0 / FRAME_RATE
+        _backend.now = (math.floor(_backend.now / frame + 1e-9) + 1) * frame
+        for function, args, kwargs in self._on_flip:
+            function(*args, **kwargs)
+        self._on_flip = []
+        # Most flips redraw the same stimuli (stimuli only change while another screen is up)
+        if self._drawn != _backend.screen:
+            _backend.observer.see(self._drawn)
+        _backend.screen = self._drawn
+        if clearBuffer:
+            self._drawn = []
+        return _backend.now
+
+    def hold_frames(self, n):
+        """Keeps the screen of the last flip for n more refreshes at once; returns their times.
+        Used by FrameTimer.present, whose screens do not change from one frame to the next."""
+        frame = 1.0 / FRAME_RATE
+        first = math.floor(_backend.now / frame + 1e-9) + 1
+        times = [(first + i) * frame for i in range(n)]
+        _backend.now = times[-1]
+        return times
+
+    def frames_until_input(self):
+        """Refreshes that can be held (hold_frames) before the flip after which the planned
+        key press is due; None if no press is planned."""
+        if _backend.next_press is None:
+            return None
+        frame = 1.0 / FRAME_RATE
+        last = math.floor(_backend.now / frame + 1e-9)
+        return max(0, math.ceil(_backend.next_press / frame - 1e-9) - last - 1)
+
+    def clearBuffer(self, color=True, depth=False, stencil=False):
+        self._drawn = []
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self._on_flip.append((function, args, kwargs))
+
+    def getActualFrameRate(self, **kwargs):
+        return FRAME_RATE
+
+    def close(self):
+        self.closed = True
+
+class SimulatedStim:
+    """Keeps its parameters as attributes; draw() puts it on the next frame."""
+    defaults = {}
+
+    def __init__(self, win, **kwargs):
+        self.win = win
+        self.__dict__.update(self.defaults)
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        (win or self.win)._drawn.append(self)
+
+class GratingStim(SimulatedStim):
+    defaults = {"ori": 0.0, "pos": (0, 0)}
+
+class ElementArrayStim(SimulatedStim):
+    defaults = {"oris": 0.0, "xys": None}
+
+class ShapeStim(SimulatedStim):
+    defaults = {"vertices": None, "lineColor": 'white'}
+
+class TextStim(SimulatedStim):
+    defaults = {"text": "", "pos": (0, 0)}
+
+class ImageStim(SimulatedStim):
+    defaults = {"image": None}
+
+class Rect(SimulatedStim):
+    defaults = {"fillColor": None}
+
+# psychopy.hardware.keyboard
+class KeyPress:
+    def __init__(self, name, rt, tDown):
+        self.name = name
+        self.rt = rt
+        self.tDown = tDown
+
+class Keyboard:
+    """Answers come from the observer the first time a screen asks for keys after clearEvents()."""
+    def __init__(self, *args, **kwargs):
+        self.clock = Clock()
+        self._pending = None  # (key, time of the press) planned by the observer
+
+    def clearEvents(self, eventType=None):
+        self._pending = _backend.next_press = None
+
+    def _plan(self, keyList):
+        if self._pending is None:
+            answer = _backend.observer.respond(_backend.screen, keyList)
+            if answer is not None:
+                key, rt = answer
+                # The clock is reset on the flip showing the screen, so rt counts from there
+                self._pending = (key, max(_backend.now, self.clock._start) + rt)
+                _backend.next_press = self._pending[1]
+        return self._pending
+
+    def _press(self):
+        key, t_down = self._pending
+        self._pending = _backend.next_press = None
+        return [KeyPress(key, t_down - self.clock._start, t_down)]
+
+    def getKeys(self, keyList=None, waitRelease=True, clear=True):
+        pending = self._plan(keyList)
+        if pending is not None and pending[1] <= _backend.now:
+            return self._press()
+        return []
+
+    def waitKeys(self, maxWait=float('inf'), keyList=None, waitRelease=True, clear=True):
+        pending = self._plan(keyList)
+        if pending is None or pending[1] - _backend.now > maxWait:
+            _backend.now += maxWait if np.isfinite(maxWait) else 0.0
+            return None
+        _backend.now = max(_backend.now, pending[1])
+        return self._press()
+
+# psychopy.event
+def clearEvents(eventType=None):
+    pass
+
+def getKeys(keyList=None, timeStamped=False):
+    return []
+
+def waitKeys(maxWait=float('inf'), keyList=None, timeStamped=False):
+    # Only used for the break screen: the participant rests, then presses a key
+    _backend.now += _backend.observer.break_duration
+    return ['space']
+
+# psychopy.gui
+class Dlg:
+    def __init__(self, title="", **kwargs):
+        self.title = title
+        self.OK = False
+        self.data = []
+
+    def addField(self, label, initial="", choices=None, **kwargs):
+        return self
+
+    def show(self):
+        self.data = list(_backend.dialog_answers.get(self.title, []))
+        self.OK = True
+        return self.data
+
+def install():
+    """Replaces PsychoPy by the simulated backend in sys.modules.
+    Must run before utils, main or gabor_patches are imported."""
+    this = sys.modules[__name__]
+    modules = {
+        "visual": ["Window", "GratingStim", "ElementArrayStim", "ShapeStim", "TextStim", "ImageStim", "Rect"],
+        "core": ["Clock", "getTime", "wait", "quit"],
+        "event": ["clearEvents", "getKeys", "waitKeys"],
+        "gui": ["Dlg"],
+        "hardware.keyboard": ["Keyboard", "KeyPress"],
+    }
+    if getattr(sys.modules.get("psychopy"), "simulated", False):
+        return
+    psychopy = types.ModuleType("psychopy")
+    psychopy.simulated = True
+    psychopy.prefs = types.SimpleNamespace(general={}, hardware={})
+    psychopy.hardware = types.ModuleType("psychopy.hardware")
+    sys.modules["psychopy"] = psychopy
+    sys.modules["psychopy.hardware"] = psychopy.hardware
+    for name, attributes in modules.items():
+        module = types.ModuleType("psychopy." + name)
+        for attribute in attributes:
+            setattr(module, attribute, getattr(this, attribute))
+        sys.modules["psychopy." + name] = module
+        parent, _, child = name.rpartition(".")
+        setattr(psychopy.hardware if parent else psychopy, child, module)
+
+def run_session(participant_id, observer=None, overrides=None, data_dir=None, quiet=True,
+                demographics=("Other", "25", "Right"), seed=None, resume=None):
+    """Runs main.Experiment for one simulated participant and returns its typed trial records.
+    overrides replaces settings of main.py (e.g. NUMBER_OF_TRIALS, see main.SETTINGS) and seed the
+    session seed derived from the participant ID; data files go to data_dir (a temporary folder
+    by default). resume is the checkpoint of an interrupted session to continue instead.
+    """
+    install()
+    import main
+    import session_store
+    observer = observer if observer is not None else SimulatedObserver()
+    if data_dir is None:
+        data_dir = tempfile.mkdtemp(prefix="simulated_session_")
+    overrides = dict(overrides or {})
+    overrides["save_directory"] = data_dir
+
+    _backend.start_session(observer, {"Enter Participant ID": [str(participant_id)],
+                                      "Participant Info": list(demographics)})
+    experiment = main.Experiment(**overrides)
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        if resume is not None:
+            session = experiment.resume_session(resume)
+        else:
+            session = experiment.new_session(str(participant_id), *demographics, seed=seed)
+        try:
+            experiment.run(session)
+        except SessionEnded:
+            pass
+
+    records = session_store.load_session(session_store.session_path(session.data_file), mmap=False)
+    return {
+        "participant_id": str(participant_id),
+        "group_id": session.group_id,
+        "data_file": session.data_file,
+        "duration": _backend.now,
+        "records": records,
+    }
+
+def summarize_session(result):
+    """Training lengths, accuracy per block type and final stim_strength of one session."""
+    records = result["records"]
+    summary = {"participant_id": result["participant_id"], "group_id": result["group_id"],
+               "duration": result["duration"]}
+    for label in ["training_1", "training_2", "training_3"]:
+        summary[f"{label}_trials"] = int(np.sum(records["block"] == label))
+    for block_type in ["with_mental_replay", "without_mental_replay"]:
+        trials = records[(records["block"] == block_type) & (records["correct"] >= 0)]
+        summary[f"accuracy_{block_type}"] = float(trials["correct"].mean()) if len(trials) else np.nan
+    experimental = records[np.isin(records["block"], ["with_mental_replay", "without_mental_replay"])]
+    summary["stim_strength"] = experimental["stim_strength"]
+    summary["final_stim_strength"] = float(experimental["stim_strength"][-1]) if len(experimental) else np.nan
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run simulated participants through main.py")
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--sensory-noise", type=float, default=6.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    install()
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.participants):
+        observer = SimulatedObserver(rng=rng, sensory_noise=args.sensory_noise)
+        summary = summarize_session(run_session(i + 1, observer))
+        print(f"participant {summary['participant_id']} (group {summary['group_id']}): "
+              f"training {summary['training_1_trials']}/{summary['training_2_trials']}/{summary['training_3_trials']} trials, "
+              f"accuracy replay {summary['accuracy_with_mental_replay']:.2f}, "
+              f"no replay {summary['accuracy_without_mental_replay']:.2f}, "
+              f"final stim_strength {summary['final_stim_strength']:.2f} "
+              f"(expected accuracy {observer.psychometric(summary['final_stim_strength']):.2f})")
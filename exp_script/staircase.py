@@ -0,0 +1,193 @@
+import abc
+import inspect
+import numpy as np
+
+def weibull_2afc(x, threshold, slope, guess_rate=0.5, lapse_rate=0.02):
+    """Probability of a correct answer at stim_strength x (broadcasts over all arguments)."""
+    x = np.maximum(x, 1e-9)
+    return guess_rate + (1 - guess_rate - lapse_rate) * (1 - np.exp(-(x / threshold) ** slope))
+
+def weibull_2afc_inverse(p, threshold, slope, guess_rate=0.5, lapse_rate=0.02):
+    """stim_strength giving a proportion correct of p."""
+    scaled = (p - guess_rate) / (1 - guess_rate - lapse_rate)
+    return threshold * (-np.log(1 - scaled)) ** (1 / slope)
+
+class Staircase(abc.ABC):
+    """Common interface of the adaptive procedures on stim_strength.
+    `value` is the stim_strength of the next trial and update(correct) moves it after the
+    answer. Every procedure is fully determined by its parameters and the history of
+    (stim_strength, correct) pairs, which is what state() stores and from_state() replays.
+    """
+    method = None
+
+    def __init__(self, start=20, min_value=0.1, max_value=100):
+        self.params = {"start": start, "min_value": min_value, "max_value": max_value}
+        self.value = start
+        self.min_value = min_value
+        self.max_value = max_value
+        self.history = []  # (stim_strength, correct) of every trial
+
+    def update(self, correct):
+        self.history.append((self.value, correct))
+        if correct is True or correct is False:
+            self._update(self.value, correct)
+        return self.value
+
+    @abc.abstractmethod
+    def _update(self, x, correct):
+        """Moves value after an answer of correct at stim_strength x."""
+
+    def _clip(self, x):
+        return float(min(self.max_value, max(self.min_value, x)))
+
+    def state(self):
+        return {"method": self.method, "params": dict(self.params), "history": list(self.history)}
+
+class WeightedUpDown(Staircase):
+    """Weighted up-down: down by step_down after a correct answer, up by step_up after an error.
+    Converges on a proportion correct of step_up / (step_up + step_down)."""
+    method = "weighted_up_down"
+
+    def __init__(self, start=20, step_up=1.0, step_down=0.5, min_value=0.1, max_value=100):
+        super().__init__(start, min_value, max_value)
+        self.params.update(step_up=step_up, step_down=step_down)
+        self.step_up = step_up
+        self.step_down = step_down
+
+    def _update(self, x, correct):
+        if correct:
+            self.value = self._clip(x - self.step_down)
+        else:
+            self.value = self._clip(x + self.step_up)
+
+class Quest(Staircase):
+    """QUEST: posterior over the threshold of a Weibull with a known slope.
+    The posterior lives on a log-spaced grid and each answer multiplies it by the likelihood
+    of that answer; the next value targets target_p at the posterior mean threshold."""
+    method = "quest"
+
+    def __init__(self, start=20, target_p=0.75, slope=2.0, prior_sd=1.0, grid_size=200,
+                 min_value=0.1, max_value=100):
+        super().__init__(start, min_value, max_value)
+        self.params.update(target_p=target_p, slope=slope, prior_sd=prior_sd, grid_size=grid_size)
+        self.target_p = target_p
+        self.slope = slope
+        # Prior: normal on log10(threshold) centred on the start value
+        self.log_thresholds = np.linspace(np.log10(min_value), np.log10(max_value), grid_size)
+        self.thresholds = 10 ** self.log_thresholds
+        log_prior = -0.5 * ((self.log_thresholds - np.log10(start)) / prior_sd) ** 2
+        self.log_posterior = log_prior - log_prior.max()
+
+    def _update(self, x, correct):
+        p_correct = weibull_2afc(x, self.thresholds, self.slope)
+        self.log_posterior += np.log(p_correct if correct else 1 - p_correct)
+        self.log_posterior -= self.log_posterior.max()
+        self.value = self._clip(weibull_2afc_inverse(self.target_p, self.threshold(), self.slope))
+
+    def threshold(self):
+        """Posterior mean of the threshold (averaged on the log scale)."""
+        posterior = np.exp(self.log_posterior)
+        return 10 ** (posterior @ self.log_thresholds / posterior.sum())
+
+class Psi(Staircase):
+    """Psi method (Kontsevich & Tyler, 1999): joint posterior over threshold and slope.
+    The likelihood of a correct answer is precomputed for every candidate stim_strength on a
+    (candidate, threshold, slope) grid, so an update is one multiplication of the posterior
+    and the next value is the candidate with the lowest expected posterior entropy, which
+    reduces to a few matrix-vector products with the precomputed tables."""
+    method = "psi"
+
+    def __init__(self, start=20, n_thresholds=40, n_slopes=12, n_candidates=60, prior_sd=1.0,
+                 min_value=0.1, max_value=100):
+        super().__init__(start, min_value, max_value)
+        self.params.update(n_thresholds=n_thresholds, n_slopes=n_slopes, n_candidates=n_candidates,
+                           prior_sd=prior_sd)
+        log_thresholds = np.linspace(np.log10(min_value), np.log10(max_value), n_thresholds)
+        self.thresholds = 10 ** log_thresholds
+        self.slopes = np.geomspace(0.5, 8, n_slopes)
+        self.candidates = np.geomspace(min_value, max_value, n_candidates)
+        p_correct = weibull_2afc(self.candidates[:, None, None], self.thresholds[None, :, None],
+                                 self.slopes[None, None, :]).reshape(n_candidates, -1)
+        # Likelihood tables of both outcomes, flattened over (threshold, slope)
+        self.likelihoods = [(p_correct, p_correct * np.log(p_correct)),
+                            (1 - p_correct, (1 - p_correct) * np.log(1 - p_correct))]
+        # Prior: normal on log10(threshold) centred on the start value, flat over slopes
+        prior = np.exp(-0.5 * ((log_thresholds - np.log10(start)) / prior_sd) ** 2)
+        self.posterior = np.repeat(prior[:, None], n_slopes, axis=1)
+        self.posterior /= self.posterior.sum()
+
+    def _update(self, x, correct):
+        p_correct = weibull_2afc(x, self.thresholds[:, None], self.slopes[None, :])
+        self.posterior *= p_correct if correct else 1 - p_correct
+        self.posterior /= self.posterior.sum()
+        self.value = self._clip(self.candidates[np.argmin(self.expected_entropy())])
+
+    def expected_entropy(self):
+        """Expected entropy of the posterior after a trial at each candidate stim_strength.
+        For an outcome with likelihood L and joint J = posterior * L of total p,
+        p * H(J / p) = p log p - L @ (posterior log posterior) - (L log L) @ posterior."""
+        posterior = self.posterior.ravel()
+        posterior_log = posterior * np.log(posterior + 1e-300)
+        entropy = 0
+        for likelihood, likelihood_log in self.likelihoods:
+            p = likelihood @ posterior
+            entropy = entropy + p * np.log(p) - likelihood @ posterior_log - likelihood_log @ posterior
+        return entropy
+
+    def threshold(self):
+        """Posterior mean of the threshold (averaged on the log scale)."""
+        return 10 ** (self.posterior.sum(axis=1) @ np.log10(self.thresholds))
+
+    def slope(self):
+        return self.posterior.sum(axis=0) @ self.slopes
+
+STAIRCASE_METHODS = {cls.method: cls for cls in [WeightedUpDown, Quest, Psi]}
+
+def make_staircase(method="weighted_up_down", **params):
+    if method not in STAIRCASE_METHODS:
+        raise ValueError(f"Unknown staircase method {method!r}, choose from {', '.join(STAIRCASE_METHODS)}")
+    accepted = list(inspect.signature(STAIRCASE_METHODS[method]).parameters)
+    unknown = sorted(set(params) - set(accepted))
+    if unknown:
+        raise ValueError(f"The {method} staircase does not take {', '.join(unknown)} "
+                         f"(its parameters are {', '.join(accepted)})")
+    return STAIRCASE_METHODS[method](**params)
+
+def staircase_from_state(state):
+    """Rebuilds a staircase by replaying its history."""
+    staircase = make_staircase(state["method"], **state["params"])
+    for x, correct in state["history"]:
+        staircase.history.append((x, correct))
+        if correct is True or correct is False:
+            staircase._update(x, correct)
+    return staircase
+
+class InterleavedStaircases:
+    """One staircase per condition (e.g. block type), so each condition converges on its own.
+    With conditions=None every condition shares a single staircase. Their state() is saved
+    with the session checkpoint (see checkpoint.py).
+    """
+    def __init__(self, conditions=None, method="weighted_up_down", **params):
+        self.shared = conditions is None
+        keys = ["shared"] if self.shared else list(conditions)
+        self.staircases = {key: make_staircase(method, **params) for key in keys}
+
+    def get(self, condition):
+        return self.staircases["shared" if self.shared else condition]
+
+    def value(self, condition):
+        return self.get(condition).value
+
+    def update(self, condition, correct):
+        return self.get(condition).update(correct)
+
+    def state(self):
+        return {"shared": self.shared,
+                "staircases": {key: staircase.state() for key, staircase in self.staircases.items()}}
+
+    @classmethod
+    def from_state(cls, state):
+        staircases = cls()
+        staircases.shared = state["shared"]
+        staircases.staircases = {key: staircase_from_state(s) for key, s in state["staircases"].items()}
+        return staircases
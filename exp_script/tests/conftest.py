@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The experiment modules are imported flat from exp_script, as when it is run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulation
+
+simulation.install()  # PsychoPy is replaced by the headless backend in every test
@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import checkpoint
+import session_store
+import simulation
+
+EXP_SCRIPT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DESIGN = {"TOTAL_BLOCKS": 2, "NUMBER_OF_TRIALS": 10}
+
+# Runs a simulated session in a child process that dies (os._exit: no atexit hooks, no
+# flushing) when experimental trial crash_at starts, optionally once the writer thread
+# has caught up with everything queued so far
+CRASHING_SESSION = """
+import os, sys, threading
+import simulation
+simulation.install()
+import main, trial_logger
+data_dir, crash_at, wait_for_disk = sys.argv[1], int(sys.argv[2]), sys.argv[3] == "1"
+run_trial = main.Experiment.run_trial
+def crashing_run_trial(self, **kwargs):
+    if kwargs["block_number"] > 0 and kwargs["global_trial"] == crash_at:
+        if wait_for_disk:
+            written = threading.Event()
+            trial_logger.get_trial_logger(self.session.data_file, main.header).call(written.set)
+            written.wait()
+        os._exit(1)
+    return run_trial(self, **kwargs)
+main.Experiment.run_trial = crashing_run_trial
+simulation.run_session(5, seed=5, data_dir=data_dir, overrides={overrides})
+"""
+
+def crash_session(data_dir, crash_at, wait_for_disk=False):
+    code = CRASHING_SESSION.replace("{overrides}", repr(DESIGN))
+    process = subprocess.run([sys.executable, "-c", code, data_dir, str(crash_at), str(int(wait_for_disk))],
+                             cwd=EXP_SCRIPT)
+    assert process.returncode == 1
+
+def csv_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_seed_round_trip():
+    seed = np.random.SeedSequence(123).spawn(3)[2]
+    restored = checkpoint.seed_from_json(json.loads(json.dumps(checkpoint.seed_to_json(seed))))
+    assert restored.entropy == seed.entropy and restored.spawn_key == seed.spawn_key
+    assert checkpoint.seed_from_json(checkpoint.seed_to_json(42)) == 42
+
+def test_truncate_csv(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows([["trial"]] + [[i] for i in range(5)])
+    checkpoint.truncate_csv(path, 10)
+    assert len(csv_rows(path)) == 5
+    checkpoint.truncate_csv(path, 3)
+    assert [row["trial"] for row in csv_rows(path)] == ["0", "1", "2"]
+
+def test_find_checkpoint(tmp_path):
+    def save(name, participant, phase, mtime, version=checkpoint.VERSION):
+        path = str(tmp_path / f"{name}_experiment_data_checkpoint.json")
+        checkpoint.save_checkpoint(path, {"version": version, "participant_id_clean": participant,
+                                          "position": {"phase": phase}})
+        os.utime(path, (mtime, mtime))
+        return path
+
+    assert checkpoint.find_checkpoint(str(tmp_path), "7") is None
+    older = save("7_20260101_100000", "7", "exp", 100)
+    save("7_20260102_100000", "7", "exp", 200, version=1)  # another version: ignored
+    save("77_20260103_100000", "77", "exp", 300)  # another participant
+    assert checkpoint.find_checkpoint(str(tmp_path), "7") == older
+    save("7_20260104_100000", "7", "done", 400)  # the latest session finished
+    assert checkpoint.find_checkpoint(str(tmp_path), "7") is None
+
+def check_resumed_session(data_dir):
+    path = checkpoint.find_checkpoint(data_dir, "5")
+    assert path is not None
+    result = simulation.run_session(5, data_dir=data_dir, overrides=DESIGN, resume=path)
+    rows = csv_rows(result["data_file"])
+    records = session_store.load_session(session_store.session_path(result["data_file"]), mmap=False)
+    assert len(records) == len(rows)
+    assert [r["global_trial"] for r in rows] == [str(g) if g > 0 else "NA" for g in records["global_trial"]]
+    experimental = [int(r["global_trial"]) for r in rows if r["block"] in ("with_mental_replay", "without_mental_replay")]
+    assert experimental == list(range(1, 21))
+    assert sum(r["block"] == "break" for r in rows) == 1
+    assert checkpoint.find_checkpoint(data_dir, "5") is None  # finished: nothing left to resume
+    return rows
+
+def test_resume_after_a_crash(tmp_path):
+    # The latest checkpoints may still be queued when the process dies: the session resumes
+    # from the last one written, whose rows the data files hold
+    data_dir = str(tmp_path)
+    crash_session(data_dir, crash_at=4)
+    state = checkpoint.load_checkpoint(checkpoint.find_checkpoint(data_dir, "5"))
+    data_file = os.path.join(data_dir, os.path.basename(state["data_file"]))
+    assert len(csv_rows(data_file)) >= state["rows"]
+    assert len(session_store.load_session(session_store.session_path(data_file))) >= state["rows"]
+    check_resumed_session(data_dir)
+
+def test_resume_from_the_checkpoint_of_the_last_trial(tmp_path):
+    data_dir = str(tmp_path)
+    crash_session(data_dir, crash_at=4, wait_for_disk=True)
+    state = checkpoint.load_checkpoint(checkpoint.find_checkpoint(data_dir, "5"))
+    assert state["position"] == {"phase": "exp", "next_trial": 3, "trials_per_block": 10}
+    rows = check_resumed_session(data_dir)
+    assert len([r for r in rows if r["block"].startswith("training")]) == state["rows"] - 3
+
+def test_resume_after_the_break(tmp_path):
+    data_dir = str(tmp_path)
+    crash_session(data_dir, crash_at=11, wait_for_disk=True)  # first trial after the break
+    state = checkpoint.load_checkpoint(checkpoint.find_checkpoint(data_dir, "5"))
+    assert state["position"]["next_trial"] == 10 and state["position"]["break_done"]
+    check_resumed_session(data_dir)
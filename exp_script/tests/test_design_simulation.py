@@ -0,0 +1,23 @@
+import numpy as np
+import design_simulation
+
+def test_participant_streams_leave_the_seed_unchanged():
+    seed = np.random.SeedSequence(1).spawn(3)[1]
+    first = [np.random.default_rng(s).random(3) for s in design_simulation.participant_streams(seed)]
+    second = [np.random.default_rng(s).random(3) for s in design_simulation.participant_streams(seed)]
+    assert seed.n_children_spawned == 0
+    np.testing.assert_array_equal(first, second)
+    assert not np.array_equal(first[0], first[1])
+
+def test_designs_share_the_participants_random_numbers():
+    seeds = np.random.SeedSequence(7).spawn(2)
+    summaries = {}
+    for trials in [2, 4]:
+        design = {"TOTAL_BLOCKS": 2, "NUMBER_OF_TRIALS": trials}
+        summaries[trials] = [design_simulation._simulate_participant(design, i + 1, seed, {"sensory_noise": 6.0}, 0.2)
+                             for i, seed in enumerate(seeds)]
+    for a, b in zip(summaries[2], summaries[4]):
+        assert a["sensory_noise"] == b["sensory_noise"]
+        for label in ["training_1", "training_2", "training_3"]:
+            assert a[f"{label}_trials"] == b[f"{label}_trials"]
+    assert summaries[2][0]["sensory_noise"] != summaries[2][1]["sensory_noise"]
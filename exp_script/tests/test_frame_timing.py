@@ -0,0 +1,86 @@
+import time
+import numpy as np
+import pytest
+import frame_timing
+import simulation
+
+FRAME = 1.0 / simulation.FRAME_RATE
+
+def make_timer(hold=False):
+    simulation._backend.start_session(simulation.SimulatedObserver(rng=np.random.default_rng(0)), {})
+    win = simulation.Window()
+    if not hold:
+        win.hold_frames = win.frames_until_input = None  # flip every frame, like a real window
+    return frame_timing.FrameTimer(win)
+
+def late_on_call(n, frames):
+    """A draw() that makes the flip after its n-th call come frames refreshes late."""
+    calls = []
+    def draw():
+        calls.append(None)
+        if len(calls) == n:
+            simulation.wait(frames * FRAME)
+    return draw
+
+def test_late_flip_within_the_stimulus():
+    timer = make_timer()
+    timer.start_trial(1, "with_mental_replay")
+    timer.present("fixation", lambda: None, 0.5)
+    timer.present("stimulus", late_on_call(3, 2.5), 0.25)  # 2 refreshes missed before the 3rd frame
+    timer.flip("stimulus_off", paced=True, wait_after=True)
+    simulation.wait(1.0)  # waiting for the answer: the next flip is not late
+    timer.present("confidence", lambda: None, 0.1)
+    row = timer.end_trial(0.25)
+    assert row["dropped_frames"] == 2
+    assert row["stim_frames"] == 17  # 15 frames, stretched by the 2 dropped ones
+    assert row["stim_onset"] == pytest.approx(30 * FRAME)  # from the fixation onset
+    assert timer.trials[0]["block"] == "with_mental_replay" and timer.trials[0]["intended_frames"] == 15
+
+def test_late_first_flip_of_a_screen():
+    for hold in (False, True):
+        timer = make_timer(hold)
+        timer.start_trial(1, "training_1")
+        timer.present("fixation", lambda: None, 0.5)
+        timer.present("stimulus", late_on_call(1, 2.5), 0.25)
+        simulation.wait(2.5 * FRAME)  # late stimulus_off
+        timer.flip("stimulus_off", paced=True, wait_after=True)
+        row = timer.end_trial(0.25)
+        assert row["dropped_frames"] == 4, hold
+        assert row["stim_frames"] == 17 and row["stim_onset"] == pytest.approx(32 * FRAME)
+
+def test_unpaced_flips_are_not_checked():
+    timer = make_timer()
+    timer.present("intertrial", lambda: None, 0.1)
+    simulation.wait(1.0)
+    timer.flip("instructions")
+    timer.start_trial(1, "without_mental_replay")
+    timer.present("fixation", lambda: None, 0.1)
+    assert timer.end_trial(0.25)["dropped_frames"] == 0
+
+def test_summary_and_flip_log(tmp_path):
+    timer = make_timer(hold=True)
+    timer.flip("instructions")
+    for block, trial, late in [("training_1", 1, 0), ("with_mental_replay", 1, 2.5)]:
+        timer.start_trial(trial, block)
+        timer.build_started()
+        if late:
+            time.sleep(2 * timer.frame_duration)  # the stimulus takes longer than a frame to build
+        timer.build_finished()
+        timer.present("fixation", lambda: None, 0.5)
+        timer.present("stimulus", late_on_call(1, late), 0.25)
+        timer.flip("stimulus_off", paced=True, wait_after=True)
+        timer.end_trial(0.25)
+    summary = "\n".join(timer.summary())
+    assert "stimulus duration off target: 0 trials" in summary
+    assert "stimulus construction over the frame budget: 1 trials" in summary
+    assert "with_mental_replay trial 1: generate_gabor_patches took" in summary
+    assert "trials with dropped frames: 1 (2 frames)" in summary
+    assert "with_mental_replay trial 1: 2 frames" in summary
+
+    path = str(tmp_path / "flips.npy")
+    timer.save(path)
+    flips = np.load(path)
+    assert flips.dtype == frame_timing.flip_dtype and len(flips) == 1 + 2 * (30 + 15 + 1)
+    assert (flips["block"][0], flips["global_trial"][0]) == ("NA", -1)
+    trials = {(block, trial) for block, trial in zip(flips["block"][1:], flips["global_trial"][1:])}
+    assert trials == {("training_1", 1), ("with_mental_replay", 1)}
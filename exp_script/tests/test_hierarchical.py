@@ -0,0 +1,53 @@
+import numpy as np
+from analysis import hierarchical
+from tests.test_metad import model_counts
+
+MU, BETA_REPLAY, SIGMA = np.log(0.8), -0.5, 0.2
+
+def synthetic_data(n_participants=12, n_trials=400, seed=0):
+    """Cells of a cohort whose log M-ratio is MU + BETA_REPLAY * replay + SIGMA * z (no vividness effect)."""
+    rng = np.random.default_rng(seed)
+    cells, counts = [], []
+    for i in range(n_participants):
+        d_prime, c, z = rng.uniform(1.0, 2.0), rng.normal(0, 0.2), rng.standard_normal()
+        for block_type, vividness_levels in [("without_mental_replay", [0]), ("with_mental_replay", [2, 3])]:
+            m_ratio = np.exp(MU + BETA_REPLAY * (block_type == "with_mental_replay") + SIGMA * z)
+            expected = model_counts(d_prime, c, m_ratio, [0.5, 0.5, 0.5], n_trials)[0]
+            for vividness in vividness_levels:
+                n = n_trials // len(vividness_levels)
+                table = np.stack([rng.multinomial(n // 2, expected[s].ravel() / expected[s].sum()).reshape(2, -1)
+                                  for s in range(2)])
+                cells.append((f"pilot/{i}", block_type, vividness))
+                counts.append(table)
+    return hierarchical.ModelData(np.array(cells, dtype=hierarchical.cell_dtype), np.array(counts, dtype=float))
+
+def test_recovers_the_replay_effect():
+    data = synthetic_data()
+    draws_group, draws_z, _ = hierarchical.sample(data, n_chains=2, n_warmup=1000, n_samples=1000, seed=1)
+    summary = hierarchical.summarize(data, draws_group, draws_z)
+    assert abs(summary["beta_replay"]["mean"] - BETA_REPLAY) < 0.2
+    assert abs(summary["mu"]["mean"] - MU) < 0.2
+    assert abs(summary["beta_vividness"]["mean"]) < 0.2
+    assert summary["p_replay_positive"] < 0.05
+    assert len(summary["participants"]) == data.n_participants
+
+def test_out_of_range_m_ratios_have_infinite_nll():
+    data = synthetic_data(n_participants=2, n_trials=40)
+    state = hierarchical.initial_state(data)
+    nll = data.cell_nll(state["group"], state["z"], state["gaps"])
+    assert np.all(np.isfinite(nll))
+    extreme = np.array([hierarchical.MAX_LOG_M_RATIO + 1, 0.0, 0.0, 0.0])
+    assert np.all(data.cell_nll(extreme, state["z"], state["gaps"]) == np.inf)
+    huge = np.array([0.0, 0.0, 0.0, 800.0])  # exp(log_sigma) overflows
+    with np.errstate(over="ignore", invalid="ignore"):
+        assert not np.any(np.isnan(data.cell_nll(huge, np.ones(data.n_participants), state["gaps"])))
+
+def test_chains_start_apart_and_are_reproducible():
+    data = synthetic_data(n_participants=3, n_trials=80)
+    state = hierarchical.initial_state(data)
+    starts = [hierarchical.overdisperse(state, np.random.default_rng(seed))["group"] for seed in range(2)]
+    assert not np.allclose(starts[0], starts[1])
+    first = hierarchical.sample(data, n_chains=2, n_warmup=50, n_samples=50, seed=3)
+    second = hierarchical.sample(data, n_chains=2, n_warmup=50, n_samples=50, seed=3)
+    np.testing.assert_array_equal(first[0], second[0])
+    assert not np.array_equal(first[0][0], first[0][1])
@@ -0,0 +1,44 @@
+import live_monitor
+
+def trial(correct, block="with_mental_replay", stim_strength=10.0, dropped_frames=0):
+    block_type = "training" if block.startswith("training") else block  # as in the CSV
+    return {"kind": "trial", "data": {"block": block, "block_type": block_type, "correct": correct,
+                                      "stim_strength": stim_strength, "response_time": 0.5,
+                                      "dropped_frames": dropped_frames}}
+
+def session_start(participant_id):
+    return {"kind": "session_start", "data": {"participant_id": participant_id, "group_id": 1}}
+
+def test_a_resumed_session_keeps_its_trials():
+    state = live_monitor.MonitorState()
+    state.handle(session_start("7"))
+    state.handle(trial(True, dropped_frames=2))
+    state.handle(trial(False, stim_strength=10.5))
+    state.handle({"kind": "session_end", "data": {}})
+    assert state.finished
+
+    # The same participant again: the session was resumed after a crash
+    state.handle(session_start("7"))
+    assert not state.finished and len(state.trials) == 2
+    state.handle(trial(True, stim_strength=10.0))
+    assert state.accuracy() == (2 / 3, 3)
+    assert list(state.stim_strength()) == [10.0, 10.5, 10.0]
+    assert state.dropped_frames() == 2
+
+    # Another participant starts over
+    state.handle(session_start("8"))
+    assert state.trials == [] and state.session["participant_id"] == "8"
+    assert state.accuracy()[1] == 0
+
+def test_statistics_leave_out_training_and_missing_values():
+    state = live_monitor.MonitorState(window=2)
+    state.handle(session_start("7"))
+    state.handle(trial(True, block="training_1", stim_strength=20))
+    for correct in [False, True, True]:
+        state.handle(trial(correct))
+    state.handle(trial(None, block="without_mental_replay", stim_strength="NA"))
+    assert state.accuracy("with_mental_replay") == (2 / 3, 3)
+    assert state.accuracy("with_mental_replay", last=2) == (1.0, 2)
+    assert state.accuracy("without_mental_replay")[1] == 0
+    assert list(state.stim_strength()) == [10.0, 10.0, 10.0]  # training rows have another block label
+    assert "Participant 7 (group 1)" in live_monitor.render(state)
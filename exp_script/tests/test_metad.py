@@ -0,0 +1,79 @@
+import csv
+import numpy as np
+from scipy import special
+from analysis import metad
+
+def model_counts(d_prime, c, m_ratio, gaps, n_trials):
+    """Expected count table of the meta-d' model: type-1 answers from d' and c, ratings from
+    meta-d' = m_ratio * d' with type-2 criteria gaps apart on both sides."""
+    n_ratings = len(gaps) + 1
+    params = np.concatenate([[m_ratio * d_prime], np.log(gaps), np.log(gaps)])[None, :]
+    c_prime = np.array([c / d_prime])
+    counts = np.zeros((1, 2, 2, n_ratings))
+    for stimulus in range(2):
+        mean = (stimulus - 0.5) * d_prime
+        p_s2 = special.ndtr(mean - c)  # probability of answering S2
+        for response, p_response in enumerate([1 - p_s2, p_s2]):
+            for rating in range(n_ratings):
+                cell = np.zeros_like(counts)
+                cell[0, stimulus, response, rating] = 1
+                p_rating = np.exp(-metad.negative_log_likelihood(params, cell, c_prime)[0])
+                counts[0, stimulus, response, rating] = n_trials / 2 * p_response * p_rating
+    return counts
+
+def test_expected_counts_recover_the_m_ratio():
+    counts = np.concatenate([model_counts(1.5, 0.2, m_ratio, [0.4, 0.6, 0.8], 1000)
+                             for m_ratio in [0.5, 0.8, 1.0, 1.3]])
+    fit = metad.fit_meta_d(counts, pad=False)
+    np.testing.assert_allclose(fit["d_prime"], 1.5, atol=1e-6)
+    np.testing.assert_allclose(fit["c"], 0.2, atol=1e-6)
+    np.testing.assert_allclose(fit["m_ratio"], [0.5, 0.8, 1.0, 1.3], atol=1e-3)
+    assert fit["converged"].all()
+
+def test_sampled_counts_recover_the_m_ratio():
+    rng = np.random.default_rng(0)
+    expected = model_counts(1.2, 0.0, 0.7, [0.5, 0.5, 0.5], 20000)
+    counts = np.stack([rng.multinomial(10000, expected[0, s].ravel() / expected[0, s].sum()).reshape(2, 4)
+                       for s in range(2)])[None]
+    fit = metad.fit_meta_d(counts)
+    assert abs(fit["m_ratio"][0] - 0.7) < 0.1
+
+def test_fit_sessions_from_csv(tmp_path):
+    phase_dir = tmp_path / "pilot"
+    phase_dir.mkdir()
+    rng = np.random.default_rng(1)
+    fields = ["participant_id", "block", "block_type", "gabor_direction", "response", "confidence", "vividness"]
+    with open(phase_dir / "3_20260101_000000_experiment_data.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerow({"participant_id": "3", "block": "training_1", "block_type": "training",
+                         "gabor_direction": 1, "response": "b", "confidence": 4, "vividness": "NA"})
+        for block_type in metad.BLOCK_TYPES:
+            for _ in range(200):
+                direction = rng.choice([-1, 1])
+                evidence = direction * 0.6 + rng.normal()
+                writer.writerow({"participant_id": "3", "block": block_type, "block_type": block_type,
+                                 "gabor_direction": direction, "response": "b" if evidence > 0 else "v",
+                                 "confidence": int(np.clip(1 + abs(evidence) // 0.5, 1, 4)),
+                                 "vividness": "NA"})
+        writer.writerow({"participant_id": "3", "block": "with_mental_replay", "block_type": "with_mental_replay",
+                         "gabor_direction": 1, "response": "None", "confidence": "NA", "vividness": "NA"})
+    results = metad.fit_sessions(str(tmp_path), phases=["pilot"])
+    assert [(r["block_type"], r["n_trials"]) for r in results] == [(b, 200) for b in sorted(metad.BLOCK_TYPES)]
+    for row in results:
+        assert 0.6 < row["d_prime"] < 1.8 and 0.5 < row["m_ratio"] < 1.5
+
+def test_long_participant_ids_are_kept(tmp_path):
+    participant_id = "participant-with-a-very-long-identifier-0042"
+    path = tmp_path / "session.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["participant_id", "block", "block_type", "gabor_direction",
+                                               "response", "confidence", "vividness"])
+        writer.writeheader()
+        writer.writerow({"participant_id": participant_id, "block": "with_mental_replay",
+                         "block_type": "with_mental_replay", "gabor_direction": 1, "response": "b",
+                         "confidence": 3, "vividness": 2})
+    trials = metad.load_session_trials(str(path), "pilot")
+    assert trials["participant_id"][0] == participant_id
+    short = np.zeros(1, dtype=metad.trial_dtype)
+    assert np.concatenate([short, trials])["participant_id"][1] == participant_id
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from gabor_patches import utils as gabor_utils
+
+def pairwise_distances(positions):
+    diff = positions[:, None, :] - positions[None, :, :]
+    distances = np.sqrt((diff ** 2).sum(axis=-1))
+    return distances[np.triu_indices(len(positions), k=1)]
+
+@pytest.mark.parametrize("num_patches, radius, distance_min", [(15, 90, 30), (100, 300, 20), (1, 50, 10)])
+def test_positions_are_apart_and_inside_the_disc(num_patches, radius, distance_min):
+    positions = gabor_utils.generate_position_patches(num_patches, radius, distance_min,
+                                                      rng=np.random.default_rng(0))
+    assert positions.shape == (num_patches, 2)
+    assert np.all(np.hypot(positions[:, 0], positions[:, 1]) <= radius)
+    if num_patches > 1:
+        assert pairwise_distances(positions).min() >= distance_min
+
+def test_same_stream_same_layout():
+    first = gabor_utils.generate_position_patches(15, 90, 30, rng=np.random.default_rng(3))
+    second = gabor_utils.generate_position_patches(15, 90, 30, rng=np.random.default_rng(3))
+    np.testing.assert_array_equal(first, second)
+
+def test_no_minimal_distance_and_no_patches():
+    positions = gabor_utils.generate_position_patches(50, 10, 0, rng=np.random.default_rng(0))
+    assert positions.shape == (50, 2)
+    assert np.all(np.hypot(positions[:, 0], positions[:, 1]) <= 10)
+    assert gabor_utils.generate_position_patches(0, 10, 5).shape == (0, 2)
+
+def test_impossible_packing_is_rejected():
+    with pytest.raises(ValueError):
+        gabor_utils.generate_position_patches(100, 50, 30)
+
+def test_gives_up_after_max_batches():
+    # Possible in principle, but far too dense for random sequential placement
+    with pytest.raises(RuntimeError):
+        gabor_utils.generate_position_patches(60, 90, 20, rng=np.random.default_rng(0), max_batches=5)
@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import random_streams
+
+def draws(session_rng, n=5):
+    return {name: getattr(session_rng, name).random(n) for name in random_streams.STREAMS}
+
+def test_session_seeds_are_stable_and_tell_anagrams_apart():
+    assert random_streams.session_seed("12") == random_streams.session_seed("12")
+    assert random_streams.session_seed("12") != random_streams.session_seed("21")
+    assert 0 <= random_streams.session_seed("12") < 2 ** 64
+
+def test_streams_are_independent():
+    values = draws(random_streams.SessionRNG(1))
+    for i, a in enumerate(random_streams.STREAMS):
+        for b in random_streams.STREAMS[i + 1:]:
+            assert not np.array_equal(values[a], values[b])
+
+    # Drawing more from one stream leaves the others unchanged
+    session_rng = random_streams.SessionRNG(1)
+    session_rng.positions.random(1000)
+    shifted = draws(session_rng)
+    for name in random_streams.STREAMS:
+        if name != "positions":
+            np.testing.assert_array_equal(shifted[name], values[name])
+
+def test_spawned_seeds_never_share_streams():
+    first, second = np.random.SeedSequence(3).spawn(2)
+    a, b = draws(random_streams.SessionRNG(first)), draws(random_streams.SessionRNG(second))
+    for name in random_streams.STREAMS:
+        assert not np.array_equal(a[name], b[name])
+    np.testing.assert_array_equal(draws(random_streams.SessionRNG(first))["blocks"], a["blocks"])
+
+def test_restored_state_reproduces_the_draws():
+    session_rng = random_streams.SessionRNG(5)
+    draws(session_rng)
+    state = json.loads(json.dumps(session_rng.state()))  # as saved in the session checkpoint
+    expected = draws(session_rng)
+
+    restored = random_streams.SessionRNG(5)
+    restored.set_state(state)
+    for name, values in draws(restored).items():
+        np.testing.assert_array_equal(values, expected[name])
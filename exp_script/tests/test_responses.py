@@ -0,0 +1,73 @@
+import pytest
+import responses
+import simulation
+
+class ScriptedObserver(simulation.SimulatedObserver):
+    """Answers every screen with the same key after the same time (None: never answers)."""
+    def __init__(self, answer):
+        super().__init__()
+        self.answer = answer
+        self.key_lists = []
+
+    def respond(self, screen, key_list):
+        self.key_lists.append(key_list)
+        return self.answer
+
+def make_collector(answer):
+    observer = ScriptedObserver(answer)
+    simulation._backend.start_session(observer, {})
+    win = simulation.Window()
+    escapes = []
+    collector = responses.ResponseCollector(win, on_escape=lambda: escapes.append(simulation.getTime()))
+    return collector, win, observer, escapes
+
+def test_escape_is_read_with_the_response_keys():
+    collector, win, observer, escapes = make_collector(("escape", 0.1))
+    collector.clear()
+    assert collector.get_keys(["v", "b"]) == []  # not pressed yet
+    assert observer.key_lists == [["v", "b", "escape"]]  # one query for both
+    simulation.wait(0.2)
+    (name, rt), = collector.get_keys(["v", "b"])
+    assert name == "escape" and rt == pytest.approx(0.1)
+    assert escapes == [pytest.approx(0.2)]
+
+    collector.clear()
+    collector.check_escape()
+    simulation.wait(0.2)
+    collector.check_escape()
+    assert observer.key_lists[-1] == ["escape"] and len(escapes) == 2
+
+def test_wait_keys_jumps_to_the_answer():
+    collector, win, observer, escapes = make_collector(("b", 0.45))
+    collector.clear()
+    collector.reset_clock_on_flip()
+    onset = win.flip()
+    assert collector.wait_keys(["v", "b"]) == ("b", pytest.approx(0.45))
+    assert simulation.getTime() == pytest.approx(onset + 0.45)
+    assert escapes == []
+
+def test_wait_keys_gives_up_after_max_wait():
+    collector, win, observer, escapes = make_collector(None)
+    collector.clear()
+    start = simulation.getTime()
+    assert collector.wait_keys(["space"], max_wait=0.5) is None
+    assert simulation.getTime() == pytest.approx(start + 0.5)
+
+def test_reset_clock_on_flip_times_keys_from_the_flip():
+    collector, win, observer, escapes = make_collector(("v", 0.3))
+    simulation.wait(2.0)  # the clock of the keyboard started long before
+    collector.clear()
+    collector.reset_clock_on_flip()
+    win.flip()
+    assert collector.clock.getTime() == 0
+    assert collector.get_keys(["v", "b"]) == []  # polled from the flip on, as in the rating loop
+    simulation.wait(0.5)
+    (name, rt), = collector.get_keys(["v", "b"])
+    assert name == "v" and rt == pytest.approx(0.3)
+
+def test_one_collector_per_window():
+    win = simulation.Window()
+    with pytest.raises(RuntimeError):
+        responses.get_collector(win)
+    collector = responses.get_collector(win, on_escape=lambda: None)
+    assert responses.get_collector(win) is collector
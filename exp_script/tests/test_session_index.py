@@ -0,0 +1,84 @@
+import csv
+import os
+import sqlite3
+import main
+from analysis import session_index
+
+def write_session(data_dir, participant, timestamp="20260101_120000", n_trials=4, phase="pilot"):
+    os.makedirs(os.path.join(data_dir, phase), exist_ok=True)
+    path = os.path.join(data_dir, phase, f"{participant}_{timestamp}_experiment_data.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=main.header, restval="NA")
+        writer.writeheader()
+        writer.writerow({"participant_id": participant, "gender": "Other", "age": 25, "handedness": "Right",
+                         "block": "training_1", "block_type": "training", "trial": 1, "correct": True})
+        for trial in range(1, n_trials + 1):
+            writer.writerow({"participant_id": participant, "gender": "Other", "age": 25, "handedness": "Right",
+                             "block": "with_mental_replay", "block_type": "with_mental_replay",
+                             "block_number": 1, "trial": trial, "global_trial": trial, "response": "b",
+                             "correct": trial % 2 == 0, "response_time": 0.5, "confidence": 3,
+                             "vividness": 2, "stim_strength": 20.0})
+    return path
+
+def test_update_only_reads_new_and_changed_files(tmp_path):
+    data_dir = str(tmp_path / "data")
+    path = write_session(data_dir, "7")
+    write_session(data_dir, "8", n_trials=2)
+    index = session_index.SessionIndex(str(tmp_path / "index.sqlite"), data_dir, expected_trials=4)
+    assert index.update() == (2, 0, 0)
+    assert index.update() == (0, 0, 0)
+    sessions = {s["participant_id_clean"]: s for s in index.sessions()}
+    assert sessions["7"]["complete"] == 1 and sessions["8"]["complete"] == 0
+    assert sessions["7"]["group_id"] == main.assign_group("7")
+    assert sessions["7"]["started"] == "2026-01-01 12:00:00"
+    assert len(index.trials(participant="7")) == 5
+    assert len(index.trials(participant="7", block_type="with_mental_replay")) == 4
+
+    # Touched but unchanged: re-stamped, not re-read
+    os.utime(path, ns=(0, 10 ** 18))
+    assert index.update() == (0, 0, 0)
+
+    # Changed: its trials are replaced
+    write_session(data_dir, "7", n_trials=6)
+    assert index.update() == (0, 1, 0)
+    assert len(index.trials(participant="7")) == 7
+
+    # Deleted: the session and its trials are forgotten
+    os.remove(path)
+    assert index.update() == (0, 0, 1)
+    assert index.trials(participant="7") == []
+    index.close()
+
+def test_typed_columns_and_summary(tmp_path):
+    data_dir = str(tmp_path / "data")
+    write_session(data_dir, "7")
+    write_session(data_dir, "7", timestamp="20260102_120000")
+    index = session_index.SessionIndex(str(tmp_path / "index.sqlite"), data_dir, expected_trials=4)
+    index.update()
+    trial = index.trials(participant="7", block_type="with_mental_replay")[0]
+    assert trial["correct"] in (0, 1) and trial["response_time"] == 0.5 and trial["vividness"] == 2
+    assert trial["stim_onset"] is None  # "NA"
+    (row,) = index.summary(phase="pilot", complete=None)
+    assert row["block_type"] == "with_mental_replay" and row["n_trials"] == 8 and row["accuracy"] == 0.5
+    (duplicate,) = index.duplicates()
+    assert duplicate["participant_id_clean"] == "7" and duplicate["n_sessions"] == 2
+    index.close()
+
+def test_index_of_another_schema_is_rebuilt(tmp_path):
+    data_dir = str(tmp_path / "data")
+    write_session(data_dir, "7")
+    db_path = str(tmp_path / "index.sqlite")
+    index = session_index.SessionIndex(db_path, data_dir)
+    index.update()
+    index.close()
+
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA user_version = 1")
+    connection.commit()
+    connection.close()
+
+    index = session_index.SessionIndex(db_path, data_dir)
+    assert index.sessions() == []
+    assert index.update() == (1, 0, 0)
+    assert index.connection.execute("PRAGMA user_version").fetchone()[0] == session_index.SCHEMA_VERSION
+    index.close()
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+import session_store
+
+HEADER = ["participant_id", "block", "trial", "response", "correct", "response_time", "vividness", "notes"]
+
+def make_row(trial, correct=True, response="b", response_time=0.5):
+    return {"participant_id": "7", "block": "with_mental_replay", "trial": trial, "response": response,
+            "correct": correct, "response_time": response_time, "vividness": "NA", "notes": f"row {trial}"}
+
+def test_typed_round_trip(tmp_path):
+    path = str(tmp_path / "7_experiment_data.npy")
+    writer = session_store.SessionArrayWriter(path, HEADER, num_patches=3)
+    orientations = np.array([10.0, 20.0, 30.0])
+    positions = np.arange(6.0).reshape(3, 2)
+    writer.append(make_row(1), orientations, positions)
+    writer.append(make_row(2, correct=None, response=None, response_time="NA"))
+    writer.close()
+
+    session = session_store.load_session(path)
+    assert session.dtype["trial"] == np.int16 and session.dtype["response_time"] == np.float64
+    assert session.dtype["notes"].kind == "U"  # a column without a type is kept as text
+    np.testing.assert_array_equal(session["trial"], [1, 2])
+    np.testing.assert_array_equal(session["correct"], [1, -1])
+    np.testing.assert_array_equal(session["vividness"], [-1, -1])
+    assert list(session["response"]) == ["b", "NA"]
+    assert session["response_time"][0] == 0.5 and np.isnan(session["response_time"][1])
+    assert list(session["notes"]) == ["row 1", "row 2"]
+    np.testing.assert_array_equal(session["orientations"][0], orientations)
+    np.testing.assert_array_equal(session["positions"][0], positions)
+    assert np.all(np.isnan(session["orientations"][1]))
+
+def test_flush_appends_the_new_rows(tmp_path):
+    path = str(tmp_path / "7_experiment_data.npy")
+    writer = session_store.SessionArrayWriter(path, HEADER, num_patches=1)
+    assert len(session_store.load_session(path)) == 0
+    writer.append(make_row(1))
+    checkpoint_rows = writer.n_rows
+    writer.append(make_row(2))
+    writer.flush(checkpoint_rows)
+    np.testing.assert_array_equal(session_store.load_session(path, mmap=False)["trial"], [1])
+    size = os.path.getsize(path)
+    writer.flush()
+    assert os.path.getsize(path) == size + writer.dtype.itemsize
+    writer.flush(checkpoint_rows)  # e.g. a checkpoint queued before the last flush
+    np.testing.assert_array_equal(session_store.load_session(path, mmap=False)["trial"], [1, 2])
+    writer.close()
+
+def test_resumed_writer_keeps_the_checkpointed_rows(tmp_path):
+    path = str(tmp_path / "7_experiment_data.npy")
+    writer = session_store.SessionArrayWriter(path, HEADER, num_patches=1)
+    for trial in range(1, 6):
+        writer.append(make_row(trial))
+    writer.close()
+
+    resumed = session_store.SessionArrayWriter(path, HEADER, num_patches=1, keep_rows=3)
+    resumed.append(make_row(4, correct=False))
+    resumed.close()
+    session = session_store.load_session(path, mmap=False)
+    np.testing.assert_array_equal(session["trial"], [1, 2, 3, 4])
+    np.testing.assert_array_equal(session["correct"], [1, 1, 1, 0])
+    assert set(session_store.load_sessions(str(tmp_path))) == {"7_experiment_data.npy"}
+
+def test_sessions_refuse_ids_the_array_cannot_hold(tmp_path):
+    import main
+    participant_id = "x" * (session_store.MAX_PARTICIPANT_ID_LENGTH + 1)
+    with pytest.raises(ValueError):
+        main.Session(participant_id, "Other", 25, "Right", save_directory=str(tmp_path))
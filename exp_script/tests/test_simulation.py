@@ -0,0 +1,45 @@
+import time
+import numpy as np
+import frame_timing
+import simulation
+
+def run_screens(hold):
+    """A fixed screen and a rating screen, with or without the fast-forward of the headless window."""
+    observer = simulation.SimulatedObserver(rng=np.random.default_rng(0))
+    observer.evidence = 1.0  # as after a type-1 answer
+    simulation._backend.start_session(observer, {})
+    win = simulation.Window()
+    if not hold:
+        win.hold_frames = win.frames_until_input = None
+    timer = frame_timing.FrameTimer(win)
+    fixation = simulation.TextStim(win, text="+")
+    timer.present("fixation", fixation.draw, 0.5)
+    keyboard = simulation.Keyboard()
+    scale = simulation.TextStim(win, text="How confident were you?")
+    key = timer.present_until("confidence", scale.draw, lambda: keyboard.getKeys(["1", "2", "3", "4"]) or None)
+    return timer.flips, key[0].name, key[0].rt
+
+def test_held_screens_are_logged_like_flipped_ones():
+    held, key, rt = run_screens(hold=True)
+    flipped, flipped_key, flipped_rt = run_screens(hold=False)
+    assert [label for _, _, label, _ in held] == [label for _, _, label, _ in flipped]
+    np.testing.assert_allclose([t for _, _, _, t in held], [t for _, _, _, t in flipped])
+    assert len([label for _, _, label, _ in held if label == "fixation"]) == 30
+    assert (key, rt) == (flipped_key, flipped_rt)
+
+def test_session_cost(tmp_path, monkeypatch):
+    flips = []
+    window_flip = simulation.Window.flip
+    def counting_flip(self, *args, **kwargs):
+        flips.append(None)
+        return window_flip(self, *args, **kwargs)
+    monkeypatch.setattr(simulation.Window, "flip", counting_flip)
+
+    start = time.process_time()
+    result = simulation.run_session(1, simulation.SimulatedObserver(rng=np.random.default_rng(0)),
+                                    data_dir=str(tmp_path))
+    cost = time.process_time() - start
+    assert len(result["records"]) > 200
+    # One flip per screen rather than per frame (the flip log still has ~60,000 frames)
+    assert len(flips) < 3000
+    assert cost < 2.0  # about 0.5 s of CPU
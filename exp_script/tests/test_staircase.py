@@ -0,0 +1,72 @@
+import json
+import numpy as np
+import pytest
+import staircase
+
+def test_weighted_up_down_steps_and_bounds():
+    s = staircase.WeightedUpDown(start=20, step_up=1.0, step_down=0.5, min_value=0.1, max_value=21)
+    assert s.update(True) == 19.5
+    assert s.update(False) == 20.5
+    assert s.update(False) == 21  # clipped at max_value
+    assert s.update(None) == 21  # no answer: the value stays, the trial is kept in the history
+    assert s.history == [(20, True), (19.5, False), (20.5, False), (21, None)]
+    for _ in range(100):
+        s.update(True)
+    assert s.value == 0.1
+
+def test_interleaved_staircases_restore_from_their_state():
+    staircases = staircase.InterleavedStaircases()
+    for correct in [True, True, False, True]:
+        staircases.update("with_mental_replay", correct)
+    restored = staircase.InterleavedStaircases.from_state(json.loads(json.dumps(staircases.state())))
+    assert restored.value("without_mental_replay") == staircases.value("with_mental_replay") == 19.5
+    assert restored.state() == staircases.state()
+
+def test_weibull_inverse_inverts_weibull():
+    x = np.geomspace(0.5, 20, 20)  # the curve saturates at 1 - lapse_rate further up
+    p = staircase.weibull_2afc(x, threshold=8.0, slope=2.5)
+    assert np.all(np.diff(p) > 0) and 0.5 < p.min() and p.max() < 0.98
+    np.testing.assert_allclose(staircase.weibull_2afc_inverse(p, threshold=8.0, slope=2.5), x)
+
+def simulate(s, threshold, slope, n_trials, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_trials):
+        s.update(bool(rng.random() < staircase.weibull_2afc(s.value, threshold, slope)))
+    return s
+
+def test_quest_and_psi_converge_on_the_threshold():
+    quest = simulate(staircase.Quest(start=20, target_p=0.75, slope=2.0), threshold=6.0, slope=2.0, n_trials=300)
+    assert abs(np.log(quest.threshold() / 6.0)) < np.log(1.5)
+    psi = simulate(staircase.Psi(start=20), threshold=6.0, slope=2.0, n_trials=200)
+    assert abs(np.log(psi.threshold() / 6.0)) < np.log(1.5)
+
+def test_quest_moves_down_after_correct_and_up_after_errors():
+    # A correct answer at 20 makes low thresholds more likely, an error high ones
+    after_correct = staircase.Quest(start=20).update(True)
+    after_error = staircase.Quest(start=20).update(False)
+    assert after_correct < after_error
+
+@pytest.mark.parametrize("method, params", [("weighted_up_down", {"start": 15, "step_up": 2.0}),
+                                            ("quest", {"start": 15, "target_p": 0.8}),
+                                            ("psi", {"start": 15, "n_candidates": 30})])
+def test_state_replays_to_the_same_staircase(method, params):
+    s = simulate(staircase.make_staircase(method, **params), threshold=5.0, slope=2.0, n_trials=30)
+    s.update(None)
+    saved = json.loads(json.dumps(s.state()))  # as read back from a checkpoint
+    restored = staircase.staircase_from_state(saved)
+    assert type(restored) is type(s)
+    assert restored.value == s.value
+    assert json.loads(json.dumps(restored.state())) == saved
+
+def test_make_staircase_checks_method_and_parameters():
+    with pytest.raises(ValueError, match="Unknown staircase method"):
+        staircase.make_staircase("bisection")
+    with pytest.raises(ValueError, match="step_up"):
+        staircase.make_staircase("quest", step_up=1.0)
+    with pytest.raises(TypeError):
+        staircase.Staircase()  # abstract: every method defines its own update rule
+
+def test_every_method_accepts_its_settings_in_main():
+    import main
+    for method, params in main.STAIRCASE_PARAMS.items():
+        assert staircase.make_staircase(method, **params).method == method
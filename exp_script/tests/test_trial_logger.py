@@ -0,0 +1,59 @@
+import csv
+import pytest
+import trial_logger
+
+HEADER = ["trial", "response"]
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+def test_rows_are_written_in_order_even_through_the_overflow(tmp_path):
+    path = str(tmp_path / "data.csv")
+    logger = trial_logger.TrialLogger(path, HEADER, maxsize=4, batch_size=3)
+    for i in range(200):
+        logger.log({"trial": i, "response": "v"} if i % 2 else [str(i), "b"])
+    logger.close()
+    rows = read_rows(path)
+    assert rows[0] == HEADER
+    assert [int(row[0]) for row in rows[1:]] == list(range(200))
+    assert rows[1] == ["0", "b"] and rows[2] == ["1", "v"]
+
+def test_missing_columns_become_na_and_reopening_appends(tmp_path):
+    path = str(tmp_path / "data.csv")
+    logger = trial_logger.TrialLogger(path, HEADER)
+    logger.log({"trial": 1})
+    logger.close()
+    logger = trial_logger.TrialLogger(path, HEADER)
+    logger.log({"trial": 2, "response": "b"})
+    logger.close()
+    assert read_rows(path) == [HEADER, ["1", "NA"], ["2", "b"]]  # one header only
+
+def test_call_runs_after_the_rows_logged_before_it(tmp_path):
+    path = str(tmp_path / "data.csv")
+    logger = trial_logger.TrialLogger(path, HEADER, maxsize=2)
+    seen = []
+    for i in range(20):
+        logger.log([str(i), "v"])
+        logger.call(lambda: seen.append(len(read_rows(path)) - 1))
+    logger.sync()
+    logger.close()
+    assert seen == list(range(1, 21))
+
+def test_logging_after_close_raises(tmp_path):
+    path = str(tmp_path / "data.csv")
+    logger = trial_logger.TrialLogger(path, HEADER)
+    logger.close()
+    logger.close()  # closing twice is harmless
+    with pytest.raises(RuntimeError):
+        logger.log([1, "v"])
+    with pytest.raises(RuntimeError):
+        logger.sync()
+
+def test_get_trial_logger_reuses_the_open_logger(tmp_path):
+    path = str(tmp_path / "data.csv")
+    logger = trial_logger.get_trial_logger(path, HEADER)
+    assert trial_logger.get_trial_logger(path, HEADER) is logger
+    trial_logger.close_all()
+    assert trial_logger.get_trial_logger(path, HEADER) is not logger  # a closed logger is forgotten
+    trial_logger.close_all()
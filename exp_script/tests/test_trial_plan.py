@@ -0,0 +1,50 @@
+import numpy as np
+import random_streams
+import trial_plan
+from gabor_patches.constant import constant as ct
+
+def longest_run(values):
+    longest = run = 1
+    for previous, value in zip(values[:-1], values[1:]):
+        run = run + 1 if value == previous else 1
+        longest = max(longest, run)
+    return longest
+
+def test_a_direction_is_never_repeated_more_than_three_times():
+    rng = np.random.default_rng(0)
+    assert trial_plan.get_pseudorandom_direction([1, 1, 1], rng=rng) == -1
+    assert trial_plan.get_pseudorandom_direction([1, -1, -1, -1], rng=rng) == 1
+    assert {trial_plan.get_pseudorandom_direction([1, -1], rng=rng) for _ in range(50)} == {-1, 1}
+
+def test_directions_are_balanced_in_every_block():
+    trials_per_block = 20
+    plan = trial_plan.build_trial_plan(8 * trials_per_block, random_streams.SessionRNG(1))
+    for block in plan["direction"].reshape(-1, trials_per_block):
+        assert set(block.tolist()) == {-1, 1}
+        assert longest_run(block.tolist()) <= 3
+        assert 5 <= np.sum(block == 1) <= trials_per_block - 5
+    assert abs(plan["direction"].mean()) < 0.15
+
+def test_the_same_seed_gives_the_same_plan():
+    first = trial_plan.build_trial_plan(30, random_streams.SessionRNG(7))
+    second = trial_plan.build_trial_plan(30, random_streams.SessionRNG(7))
+    other = trial_plan.build_trial_plan(30, random_streams.SessionRNG(8))
+    for field in first.dtype.names:
+        np.testing.assert_array_equal(first[field], second[field])
+        assert not np.array_equal(first[field], other[field])
+    assert np.all((0 <= first["reference"]) & (first["reference"] < 180))
+    radii = np.hypot(first["positions"][..., 0], first["positions"][..., 1])
+    assert np.all(radii <= ct.DIAGONAL_TO_CENTER)
+
+def test_save_and_load_round_trip(tmp_path):
+    plan = trial_plan.build_trial_plan(12, random_streams.SessionRNG(3))
+    path = trial_plan.plan_path(str(tmp_path / "7_20260101_120000_experiment_data.csv"), "training_1")
+    assert path.endswith("7_20260101_120000_experiment_data_training_1_plan.npy")
+    trial_plan.save_trial_plan(path, plan)
+    loaded = trial_plan.load_trial_plan(path)
+    assert loaded.dtype == trial_plan.plan_dtype()
+    for field in plan.dtype.names:
+        np.testing.assert_array_equal(loaded[field], plan[field])
+    trial = loaded[0]
+    np.testing.assert_allclose(trial_plan.trial_orientations(trial, 10.0),
+                               trial["reference"] + 10.0 * trial["direction"] + trial["orientation_noise"])
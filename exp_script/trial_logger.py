@@ -0,0 +1,135 @@
+import atexit
+import collections
+import csv
+import os
+import queue
+import threading
+
+_SYNC = object()
+_STOP = object()
+
+class TrialLogger:
+    """Appends trial rows to a CSV from a background thread.
+    log() never blocks the stimulus loop: rows go through a bounded queue and, if the
+    writer falls behind, wait in an in-memory overflow until there is room again. The
+    writer batches whatever is queued into one write, and sync() additionally fsyncs
+    the file (at block boundaries and when quitting). call() runs a function on the writer
+    thread once the rows logged before it are written (see main.Session.save_checkpoint).
+    The file is opened once, here, so a locked file is reported before the first trial
+    rather than in the middle of it. Logging after close() raises RuntimeError.
+    """
+    def __init__(self, filepath, header, maxsize=256, batch_size=64):
+        self.filepath = filepath
+        self.header = list(header)
+        self.batch_size = batch_size
+        self.error = None
+        write_header = not os.path.exists(filepath) or os.path.getsize(filepath) == 0
+        self._file = open(filepath, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(self.header)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._overflow = collections.deque()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, row):
+        """Queues one row, given as a dict keyed by header (missing keys become "NA") or as a list."""
+        if isinstance(row, dict):
+            row = [str(row.get(key, "NA")) for key in self.header]
+        self._put(row)
+
+    def sync(self):
+        """Asks the writer to flush and fsync everything logged so far."""
+        self._put(_SYNC)
+
+    def call(self, function):
+        """Runs function() on the writer thread after every row logged so far is written."""
+        self._put(function)
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError(f"Trial logger of {self.filepath} is closed")
+        # Keep the order: nothing jumps ahead of rows already waiting in the overflow
+        while self._overflow:
+            try:
+                self._queue.put_nowait(self._overflow[0])
+            except queue.Full:
+                self._overflow.append(item)
+                return
+            self._overflow.popleft()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._overflow.append(item)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            sync = False
+            for item in batch:
+                if item is _STOP:
+                    stop = sync = True
+                elif item is _SYNC:
+                    sync = True
+                elif callable(item):
+                    # Only once the rows before it are in the file (skipped if they could not be written)
+                    if self._write(rows):
+                        item()
+                    rows = []
+                else:
+                    rows.append(item)
+            self._write(rows, sync)
+        self._file.close()
+
+    def _write(self, rows, sync=False):
+        try:
+            self._writer.writerows(rows)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            self.error = e
+            print(f"Unable to write to file {self.filepath}: {e}")
+            return False
+        return True
+
+    def close(self):
+        """Writes every pending row, fsyncs and closes the file."""
+        if self._closed:
+            return
+        self._closed = True
+        while self._overflow:
+            self._queue.put(self._overflow.popleft())
+        self._queue.put(_STOP)
+        self._thread.join()
+        if _loggers.get(self.filepath) is self:
+            del _loggers[self.filepath]
+
+_loggers = {}
+
+def get_trial_logger(filepath, header):
+    """Returns the logger of a data file, opening it on first use."""
+    logger = _loggers.get(filepath)
+    if logger is None:
+        logger = TrialLogger(filepath, header)
+        _loggers[filepath] = logger
+    return logger
+
+def sync_all():
+    for logger in _loggers.values():
+        logger.sync()
+
+def close_all():
+    for logger in list(_loggers.values()):
+        logger.close()
+
+atexit.register(close_all)  # core.quit() exits through sys.exit
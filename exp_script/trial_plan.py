@@ -0,0 +1,60 @@
+import numpy as np
+from gabor_patches import utils as gabor_utils
+from gabor_patches.constant import constant as ct
+
+# Spread of the patch orientations around their mean
+ORIENTATION_SD = 5
+
+def plan_dtype(num_patches=ct.NUM_PATCHES):
+    """One record per trial: everything that can be drawn before the session starts."""
+    return np.dtype([
+        ("direction", np.int8),
+        ("reference", np.int16),
+        ("orientation_noise", np.float32, (num_patches,)),  # added to reference + stim_strength * direction
+        ("positions", np.float32, (num_patches, 2)),
+    ])
+
+# Function to generate a pseudorandom motion direction
+def get_pseudorandom_direction(prev_directions, max_repeats=3, rng=None): # a direction can only be repeated as much as "max_repeats"
+    if rng is None:
+        rng = np.random.default_rng()
+    if len(prev_directions) >= max_repeats:
+        last_n = prev_directions[-max_repeats:]
+        if all(d == last_n[0] for d in last_n):
+            return 1 if last_n[0] == -1 else -1
+    return -1 if rng.random() < 0.5 else 1
+
+def build_trial_plan(n_trials, session_rng, num_patches=ct.NUM_PATCHES):
+    """Draws the direction, reference, orientations and positions of n_trials trials up front,
+    each from its own stream of session_rng (a random_streams.SessionRNG).
+
+    The orientations are stored as offsets around 0 because their mean depends on the
+    staircase, which is only known once the previous trial has been answered.
+    """
+    plan = np.zeros(n_trials, dtype=plan_dtype(num_patches))
+    directions = []
+    for i in range(n_trials):
+        direction = get_pseudorandom_direction(prev_directions=directions, rng=session_rng.directions)
+        directions.append(direction)
+        plan[i]["direction"] = direction
+        plan[i]["reference"] = session_rng.references.integers(0, 180)
+        plan[i]["orientation_noise"] = gabor_utils.generate_orientation_patches(num_patches, 0, sd=ORIENTATION_SD,
+                                                                                rng=session_rng.orientations)
+        plan[i]["positions"] = gabor_utils.generate_position_patches(num_patches, ct.DIAGONAL_TO_CENTER,
+                                                                     ct.DISTANCE_MIN_BETW_GABORS,
+                                                                     rng=session_rng.positions)
+    return plan
+
+def trial_orientations(trial, stim_strength):
+    """Orientations of one planned trial for the current staircase value."""
+    return trial["reference"] + stim_strength * trial["direction"] + trial["orientation_noise"]
+
+def plan_path(data_file, label):
+    """Plans are saved next to the CSV, one file per phase."""
+    return data_file.replace(".csv", f"_{label}_plan.npy")
+
+def save_trial_plan(path, plan):
+    np.save(path, plan)
+
+def load_trial_plan(path):
+    return np.load(path)
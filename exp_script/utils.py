@@ -1,63 +1,83 @@
-from psychopy import visual, core, event, gui, prefs # mental replay condition counterbalanced, with visuals
-import random
-import os
-import csv
-def show_images(win, images, min_display_time): # function to display instructions
+from psychopy import visual, core # mental replay condition counterbalanced, with visuals
+import weakref
+import trial_logger
+import responses
+import assets
+from trial_plan import get_pseudorandom_direction  # moved to trial_plan, kept here for older scripts
+def show_images(frame_timer, images, min_display_time): # function to display instructions
+    win = frame_timer.win
+    collector = responses.get_collector(win)
     for img in images:
-        stim = visual.ImageStim(win, image=img)
-        timer = core.Clock()
-        timer.reset()
-        while True:
-            stim.draw()
-            win.flip()
-            keys = event.getKeys(keyList=['space', 'escape'])
-            if timer.getTime() > min_display_time:
-                if 'space' in keys:
-                    break
-                if 'escape' in keys:
-                    win.close()
-                    core.quit()
-            else:
-                if 'escape' in keys:
-                    win.close()
-                    core.quit()
+        stim = assets.image_cache.get(win, img)  # decoded and uploaded once, see assets
+        stim.draw()
+        frame_timer.flip("instructions")  # the image stays on screen, no need to redraw it every frame
+        collector.clear()
+        collector.wait_keys([], max_wait=min_display_time)  # only escape counts before min_display_time
+        collector.clear()  # space presses made too early are ignored
+        collector.wait_keys(['space'])
 
 # Create visual scales for both conditions
+class RatingScale:
+    """Squares and labels of a rating scale, built once per label set.
+    Rendering text is slow in PsychoPy, so redrawing the scale only changes the fill
+    colour of the square that gets (de)selected.
+    """
+    def __init__(self, win, labels, y_offset=-100): # squares offset from labels
+        spacing = 150
+        start_x = -((len(labels) - 1) * spacing) / 2
+        rect_size = 50
+        self.squares = []
+        self.texts = []
+        self.selected = None
+        for i, label in enumerate(labels):
+            x = start_x + i * spacing
+            self.squares.append(visual.Rect(win, width=rect_size, height=rect_size, lineColor='white',
+                                            fillColor=None, pos=(x, y_offset)))
+            # Label below the square
+            self.texts.append(visual.TextStim(win, text=label, pos=(x, y_offset - 40),
+                                              height=16, color='blue', wrapWidth=200))
+
+    def select(self, selected):
+        if selected == self.selected:
+            return
+        if self.selected is not None:
+            self.squares[self.selected - 1].fillColor = None
+        if selected is not None:
+            self.squares[selected - 1].fillColor = 'blue'
+        self.selected = selected
+
+    def draw(self, selected=None):
+        self.select(selected)
+        for square, text in zip(self.squares, self.texts):
+            square.draw()
+            text.draw()
+
+_rating_scales = weakref.WeakKeyDictionary()  # window -> {(labels, y_offset): RatingScale}
+_text_stims = weakref.WeakKeyDictionary()  # window -> {(text, options): TextStim}
+
+def get_rating_scale(win, labels, y_offset=-100):
+    """Returns the scale of this label set, building it on first use."""
+    scales = _rating_scales.setdefault(win, {})
+    key = (tuple(labels), y_offset)
+    if key not in scales:
+        scales[key] = RatingScale(win, labels, y_offset)
+    return scales[key]
+
+def get_text_stim(win, text, **kwargs):
+    """Returns a TextStim for this text and these options, building it on first use."""
+    stims = _text_stims.setdefault(win, {})
+    key = (text, tuple(sorted(kwargs.items())))
+    if key not in stims:
+        stims[key] = visual.TextStim(win, text=text, **kwargs)
+    return stims[key]
+
 def draw_visual_scale(win, selected, labels, y_offset=-100): # squares offset from labels
-    spacing = 150
-    start_x = -((len(labels) - 1) * spacing) / 2
-    rect_size = 50
-
-    for i, label in enumerate(labels):
-        x = start_x + i * spacing
-        # Draw square
-        color = 'blue' if selected == (i + 1) else None
-        square = visual.Rect(win, width=rect_size, height=rect_size, lineColor='white',
-                             fillColor=color, pos=(x, y_offset))
-        square.draw()
-
-        # Draw label below
-        text = visual.TextStim(win, text=label, pos=(x, y_offset - 40),
-                               height=16, color='blue', wrapWidth=200)
-        text.draw()
-
-# Function to generate a pseudorandom motion direction
-def get_pseudorandom_direction(prev_directions, max_repeats=3): # a direction can only be repeated as much as "max_repeats"
-    if len(prev_directions) < max_repeats:
-        return random.choice([-1, 1])
-    last_n = prev_directions[-max_repeats:]
-    if all(d == last_n[0] for d in last_n):
-        return 1 if last_n[0] == -1 else -1
-    return random.choice([-1, 1])
-
-def save_trial_data(filepath, header, data_row): 
-    file_exists = os.path.exists(filepath)
+    get_rating_scale(win, labels, y_offset).draw(selected)
+
+def save_trial_data(filepath, header, data_row): # rows are written on a background thread, see trial_logger
     try:
-        with open(filepath, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                writer.writerow(header)
-            writer.writerow(data_row)
+        trial_logger.get_trial_logger(filepath, header).log(data_row)
     except PermissionError:
         print(f"Unable to write to file {filepath}. Close the file if it's open.")
         core.quit()
+